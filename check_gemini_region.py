@@ -4,30 +4,87 @@
 """
 
 import os
+import json
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from loguru import logger
 
-def check_gemini_availability():
+# Результат проверки кэшируется на диске, чтобы не ждать сетевые запросы при каждом запуске
+REGION_CACHE_FILE = "./data/.gemini_region_cache.json"
+REGION_CACHE_TTL = 24 * 60 * 60  # 24 часа
+
+def load_cached_availability():
+    """
+    Возвращает сохраненный положительный результат проверки, если он
+    не старше REGION_CACHE_TTL
+    """
+    try:
+        with open(REGION_CACHE_FILE, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        # Отрицательный результат (кэш прежних версий) не используется
+        if cached.get("available") and time.time() - cached["ts"] < REGION_CACHE_TTL:
+            return cached
+    except Exception:
+        pass
+    return None
+
+def save_cached_availability(available, country=None):
+    """Сохраняет результат проверки вместе с временем"""
+    try:
+        os.makedirs(os.path.dirname(REGION_CACHE_FILE), exist_ok=True)
+        with open(REGION_CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump({"ts": time.time(), "available": available, "country": country}, f, ensure_ascii=False)
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось сохранить кэш проверки региона: {e}")
+
+def check_gemini_availability(use_cache=True):
     """Проверяет доступность Gemini API из вашего региона"""
     
+    if use_cache:
+        cached = load_cached_availability()
+        if cached is not None:
+            logger.info(f"💾 Используем результат проверки из кэша (регион: {cached.get('country') or 'Unknown'})")
+            return cached["available"]
+    
     logger.info("🌍 Проверяем доступность Gemini API...")
     
+    # Одна сессия на оба запроса: соединения переиспользуются
+    with requests.Session() as session:
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=2)
+        session.mount("https://", adapter)
+        available, country, definitive = probe_gemini_availability(session)
+    
+    # Кэшируется только доступность в определенном регионе: блокировку
+    # снимает включенный VPN, а сетевые ошибки, 429/5xx и неизвестный регион
+    # следующий запуск должен проверить снова
+    if available and definitive:
+        save_cached_availability(available, country)
+    return available
+
+def probe_gemini_availability(session):
+    """
+    Выполняет сетевые проверки
+    
+    Returns:
+        (доступность, страна, окончательный ли результат — регион определен)
+    """
     # Проверяем статус Google AI Studio
     try:
-        response = requests.get("https://aistudio.google.com/", timeout=10)
+        response = session.get("https://aistudio.google.com/", timeout=10)
         if response.status_code == 200:
             logger.success("✅ Google AI Studio доступен")
         else:
             logger.error(f"❌ Google AI Studio недоступен: {response.status_code}")
-            return False
+            return False, None, False
     except Exception as e:
         logger.error(f"❌ Ошибка подключения к Google AI Studio: {e}")
-        return False
+        return False, None, False
     
     # Проверяем ваш IP и регион
     try:
-        ip_response = requests.get("https://ipapi.co/json/", timeout=5)
+        ip_response = session.get("https://ipapi.co/json/", timeout=5)
         if ip_response.status_code == 200:
             ip_data = ip_response.json()
             country = ip_data.get('country_name', 'Unknown')
@@ -39,23 +96,23 @@ def check_gemini_availability():
                 logger.error(f"❌ Ваш регион ({country}) заблокирован для Gemini API")
                 logger.info("🔧 РЕШЕНИЕ: Используйте VPN")
                 logger.info("   Рекомендуемые страны: США, Канада, Германия, Великобритания")
-                return False
+                return False, country, True
             else:
                 logger.success(f"✅ Регион {country} должен поддерживаться")
-                return True
+                return True, country, country != 'Unknown'
         else:
             logger.warning("⚠️ Не удается определить регион")
-            return True
+            return True, None, False
     except Exception as e:
         logger.warning(f"⚠️ Ошибка проверки региона: {e}")
-        return True
+        return True, None, False
 
-def main():
+def main(use_cache=True):
     """Основная функция"""
     logger.info("🔍 Проверка доступности Gemini API")
     logger.info("=" * 50)
     
-    available = check_gemini_availability()
+    available = check_gemini_availability(use_cache=use_cache)
     
     logger.info("=" * 50)
     if available:
@@ -72,4 +129,14 @@ def main():
         logger.info("   3. Используйте ChatGPT API (уже настроен как резерв)")
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Проверка доступности Gemini API из текущего региона"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="проверить заново, не используя сохраненный результат (например, с VPN)",
+    )
+    args = parser.parse_args()
+    main(use_cache=not args.no_cache)
@@ -5,8 +5,11 @@
 
 import os
 import sys
+import functools
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 import google.generativeai as genai
 from loguru import logger
@@ -15,10 +18,21 @@ from loguru import logger
 logger.remove()
 logger.add(sys.stderr, level="INFO", format="<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>")
 
+@functools.lru_cache(maxsize=1)
+def get_api_key():
+    """Загружает .env один раз и возвращает GEMINI_API_KEY"""
+    load_dotenv()
+    return os.getenv("GEMINI_API_KEY")
+
+@functools.lru_cache(maxsize=1)
+def get_model():
+    """Настраивает Gemini и создает модель один раз"""
+    genai.configure(api_key=get_api_key())
+    return genai.GenerativeModel('gemini-2.0-flash-exp')
+
 def check_api_key_format():
     """Проверяет формат API ключа"""
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
+    api_key = get_api_key()
     
     if not api_key:
         logger.error("❌ GEMINI_API_KEY не найден в .env")
@@ -42,9 +56,19 @@ def check_region_restrictions():
     """Проверяет региональные ограничения"""
     logger.info("🌍 Проверяем региональные ограничения...")
     
+    # Оба запроса независимы: выполняем их параллельно в одной сессии,
+    # общее время равно самому медленному запросу, а не сумме
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=2) as executor:
+        session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=2))
+        aistudio_future = executor.submit(session.get, "https://aistudio.google.com/", timeout=10)
+        ip_future = executor.submit(session.get, "https://ipapi.co/json/", timeout=5)
+        return report_region_checks(aistudio_future, ip_future)
+
+def report_region_checks(aistudio_future, ip_future):
+    """Выводит результаты сетевых проверок в исходном порядке"""
     try:
         # Проверяем доступность Google AI Studio
-        response = requests.get("https://aistudio.google.com/", timeout=10)
+        response = aistudio_future.result()
         if response.status_code == 200:
             logger.success("✅ Google AI Studio доступен")
         else:
@@ -54,7 +78,7 @@ def check_region_restrictions():
     
     # Проверяем IP через внешний сервис
     try:
-        ip_response = requests.get("https://ipapi.co/json/", timeout=5)
+        ip_response = ip_future.result()
         if ip_response.status_code == 200:
             ip_data = ip_response.json()
             country = ip_data.get('country_name', 'Unknown')
@@ -79,8 +103,7 @@ def check_region_restrictions():
 
 def test_direct_api_call():
     """Тестирует прямой вызов API"""
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
+    api_key = get_api_key()
     
     if not api_key:
         return False
@@ -88,11 +111,8 @@ def test_direct_api_call():
     logger.info("🔄 Тестируем прямой вызов Gemini API...")
     
     try:
-        # Настраиваем Gemini
-        genai.configure(api_key=api_key)
-        
-        # Создаем модель
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        # Настроенная модель создается один раз
+        model = get_model()
         
         # Простой тест
         response = model.generate_content("Hi")
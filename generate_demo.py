@@ -6,16 +6,64 @@
 """
 
 import os
+import sys
+import hashlib
+import functools
 from loguru import logger
 from dotenv import load_dotenv
 
-from config import JSON_DIR
+from config import JSON_DIR, CHROMA_DB_PATH
 from vector_database import VectorDatabase
 from simple_vector_db import SimpleVectorDatabase
 from gemini_integration import generate_legal_document
 
 load_dotenv()
 
+SEARCH_QUERY = "договор займа расписка взыскание задолженности"
+
+
+def json_dir_fingerprint(json_dir: str) -> str:
+	"""Отпечаток директории JSON: имена, время изменения и размеры файлов"""
+	digest = hashlib.blake2b(digest_size=16)
+	if os.path.isdir(json_dir):
+		with os.scandir(json_dir) as it:
+			entries = sorted((e.name, e.stat()) for e in it if e.name.endswith(".json"))
+		for name, stat in entries:
+			digest.update(f"{name}\0{stat.st_mtime_ns}\0{stat.st_size}\n".encode("utf-8"))
+	return digest.hexdigest()
+
+
+def load_json_if_changed(db, marker_name: str):
+	"""Загружает JSON в базу, только если содержимое JSON_DIR изменилось с прошлой загрузки"""
+	marker_path = os.path.join(CHROMA_DB_PATH, marker_name)
+	fingerprint = json_dir_fingerprint(JSON_DIR)
+	try:
+		with open(marker_path, "r", encoding="utf-8") as f:
+			if f.read().strip() == fingerprint:
+				logger.info("JSON не изменились с прошлой загрузки, пропускаю")
+				return
+	except OSError:
+		pass
+	db.load_from_json_files(JSON_DIR)
+	os.makedirs(CHROMA_DB_PATH, exist_ok=True)
+	with open(marker_path, "w", encoding="utf-8") as f:
+		f.write(fingerprint)
+
+
+@functools.lru_cache(maxsize=1)
+def get_vector_db():
+	"""Векторная база создается один раз на процесс: полная, при ошибке — упрощенная"""
+	try:
+		logger.info("Инициализация полной векторной БД...")
+		vdb = VectorDatabase()
+		load_json_if_changed(vdb, ".demo_chroma_json_fingerprint")
+		return vdb
+	except Exception as e:
+		logger.error(f"Полная БД недоступна: {e}. Перехожу на упрощенную.")
+		svdb = SimpleVectorDatabase()
+		load_json_if_changed(svdb, ".demo_simple_json_fingerprint")
+		return svdb
+
 
 def main():
 	case_description = (
@@ -24,28 +72,22 @@ def main():
 	)
 	
 	# Пробуем полную БД, при ошибке — упрощенную
-	similar_docs = []
-	try:
-		logger.info("Поиск похожих документов (полная БД)...")
-		vdb = VectorDatabase()
-		vdb.load_from_json_files(JSON_DIR)
-		similar_docs = vdb.search_similar("договор займа расписка взыскание задолженности", n_results=5)
-	except Exception as e:
-		logger.error(f"Полная БД недоступна: {e}. Перехожу на упрощенную.")
-		svdb = SimpleVectorDatabase()
-		svdb.load_from_json_files(JSON_DIR)
-		similar_docs = svdb.search_similar("договор займа расписка взыскание задолженности", n_results=5)
+	logger.info("Поиск похожих документов...")
+	similar_docs = get_vector_db().search_similar(SEARCH_QUERY, n_results=5)
 	
 	logger.info(f"Найдено фрагментов: {len(similar_docs)}")
 	
-	result = generate_legal_document(case_description, similar_docs, document_type="исковое заявление")
+	# Документ печатается по мере генерации
+	result = generate_legal_document(case_description, similar_docs, document_type="исковое заявление", stream=True)
 	provider = result.get("provider")
-	document = result.get("document", "")
 	
 	print("\n=== Провайдер ===")
 	print(provider)
 	print("\n=== Сгенерированный документ ===\n")
-	print(document)
+	for fragment in result.get("document", ()):
+		sys.stdout.write(fragment)
+		sys.stdout.flush()
+	print()
 
 
 if __name__ == "__main__":
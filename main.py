@@ -4,46 +4,154 @@ Main entry point for the application
 """
 
 import os
-from typing import List, Dict, Any
+import re
+import asyncio
+from typing import List, Dict, Any, Iterator, Optional
 from contextlib import asynccontextmanager
 
+import numpy as np
 import uvicorn
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
-from src.utils.config import API_HOST, API_PORT, API_TITLE, API_VERSION, JSON_DIR
+from src.utils.config import (
+	API_HOST,
+	API_PORT,
+	API_WORKERS,
+	API_TITLE,
+	API_VERSION,
+	JSON_DIR,
+	CHROMA_DB_PATH,
+	SEARCH_WARMUP_PATH,
+	GENERATION_CACHE,
+)
 from src.databases.vector_database import VectorDatabase
 from src.databases.simple_vector_db import SimpleVectorDatabase
-from src.integrations.gemini_integration import generate_legal_document
+from src.integrations.gemini_integration import (
+	generate_legal_document,
+	generate_legal_document_async,
+	enable_semantic_cache,
+)
+from src.utils.json_io import json_dumps
+from src.utils.semantic_cache import SemanticCache
 from loguru import logger
 
+try:
+	import ahocorasick
+
+	_HAS_AHOCORASICK = True
+except Exception:
+	_HAS_AHOCORASICK = False
+
 # Try to init full vector DB on startup; fallback to simple
-vector_backend = {"type": "", "db": None}
+vector_backend = {"type": "", "db": None, "embed": None, "search_cache": None, "ready": None}
+# Длина текста фрагмента в ответе API
+SNIPPET_MAX_CHARS = 500
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # Startup
-    global vector_backend
+def _init_backend() -> Dict[str, Any]:
+    """Создает векторный бэкенд: Chroma, при ошибке — упрощенный TF-IDF"""
     load_json_on_start = os.getenv("LOAD_JSON_ON_START", "0").lower() in ("1", "true", "yes")
     try:
         vdb = VectorDatabase()
         # IMPORTANT: by default do NOT reload JSON on server start — attach to persisted collection for instant startup
         if load_json_on_start:
             vdb.load_from_json_files(JSON_DIR)
-        vector_backend = {"type": "chroma", "db": vdb}
+        # Эмбеддинг запроса считается один раз (LRU-кэш внутри базы): его
+        # используют кэш поиска, сам поиск и семантический кэш генерации
+        embed = vdb.embed_query
+        # Близкие по смыслу запросы с теми же найденными документами получают
+        # готовый документ без обращения к LLM (только при GENERATION_CACHE=1)
+        if GENERATION_CACHE:
+            enable_semantic_cache(embed)
+        return {
+            "type": "chroma",
+            "db": vdb,
+            "embed": embed,
+            # Близкие по смыслу запросы получают готовые результаты поиска
+            "search_cache": SemanticCache(embed, threshold=0.92, ttl=300.0),
+        }
     except Exception:
         svdb = SimpleVectorDatabase()
         if load_json_on_start:
             svdb.load_from_json_files(JSON_DIR)
-        vector_backend = {"type": "tfidf", "db": svdb}
+        return {"type": "tfidf", "db": svdb, "embed": None, "search_cache": None}
+
+def _read_through(path: str) -> int:
+    """Читает файл целиком, чтобы он оказался в page cache ОС"""
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            size += len(chunk)
+    return size
+
+async def _prefetch_chroma_files():
+    """Параллельно прогревает файлы индекса Chroma перед загрузкой коллекции"""
+    paths = [
+        os.path.join(root, name)
+        for root, _, names in os.walk(CHROMA_DB_PATH)
+        for name in names
+    ]
+    loop = asyncio.get_running_loop()
+    sizes = await asyncio.gather(
+        *[loop.run_in_executor(None, _read_through, path) for path in paths],
+        return_exceptions=True,
+    )
+    total = sum(size for size in sizes if isinstance(size, int))
+    logger.info(f"Прогрето файлов индекса: {len(paths)} ({total / 2**20:.1f} МБ)")
+
+def _warm_search_cache():
+    """Заполняет кэш поиска типовыми запросами, сохраненными при переиндексации"""
+    search_cache = vector_backend["search_cache"]
+    if search_cache is None or not os.path.exists(SEARCH_WARMUP_PATH):
+        return
+    try:
+        with np.load(SEARCH_WARMUP_PATH) as warmup:
+            queries = [str(query) for query in warmup["queries"]]
+            embeddings = warmup["embeddings"]
+        # Поиск выполняется заново по текущей коллекции, но без вызова модели
+        for query, embedding in zip(queries, embeddings):
+            dispute_type = _detect_dispute_type(query.lower())
+            db = vector_backend["db"]
+            similar = _search(db, query, dispute_type, embedding.tolist())
+            snippets = db.format_snippets(similar, max_chars=SNIPPET_MAX_CHARS)
+            search_cache.set(
+                query, (dispute_type, similar, snippets), SemanticCache.normalize(embedding)
+            )
+        logger.info(f"Кэш поиска прогрет: {len(queries)} запросов")
+    except Exception as e:
+        logger.warning(f"Не удалось прогреть кэш поиска: {e}")
+
+async def _start_backend(ready: asyncio.Event):
+    """Инициализирует бэкенд в фоне; запросы ждут события ready"""
+    # Прогрев читает весь каталог Chroma в каждом процессе сервера, поэтому
+    # включается явно (PREFETCH_INDEX_ON_START=1), например после перезагрузки машины
+    prefetch_on_start = os.getenv("PREFETCH_INDEX_ON_START", "0").lower() in ("1", "true", "yes")
+    try:
+        loop = asyncio.get_running_loop()
+        if prefetch_on_start:
+            await _prefetch_chroma_files()
+        vector_backend.update(await loop.run_in_executor(None, _init_backend))
+        await loop.run_in_executor(None, _warm_search_cache)
+        logger.info(f"Векторный бэкенд готов: {vector_backend['type']}")
+    except Exception as e:
+        logger.error(f"Не удалось инициализировать векторный бэкенд: {e}")
+    finally:
+        ready.set()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: сервер принимает запросы сразу, база подключается в фоне
+    ready = asyncio.Event()
+    vector_backend["ready"] = ready
+    init_task = asyncio.create_task(_start_backend(ready))
     
     yield
     
     # Shutdown
-    # Cleanup if needed
+    init_task.cancel()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -75,68 +183,179 @@ async def root_page(request: Request):
 		{"request": request, "api_version": API_VERSION, "backend": vector_backend["type"]},
 	)
 
+def _pending_backend_status() -> str:
+	ready = vector_backend["ready"]
+	return "initializing" if ready is not None and not ready.is_set() else "none"
+
 @app.get("/health")
 async def health_check():
 	return {
 		"status": "healthy",
 		"components": {
 			"api": "running",
-			"vector_backend": vector_backend["type"] or "none",
+			"vector_backend": vector_backend["type"] or _pending_backend_status(),
 		},
 	}
 
+# Ключевые слова типов спора в порядке приоритета
+_DISPUTE_KEYWORDS = (
+	("consumer_protection", ("потребитель", "товар", "продавец", "недостаток", "качество")),
+	("contract_dispute", ("договор", "контракт", "обязательство")),
+)
+
+def _build_dispute_word_types() -> Dict[str, frozenset]:
+	"""Ключевое слово -> множество типов спора"""
+	word_types: Dict[str, set] = {}
+	for dispute_type, keywords in _DISPUTE_KEYWORDS:
+		for keyword in keywords:
+			word_types.setdefault(keyword, set()).add(dispute_type)
+	return {keyword: frozenset(types) for keyword, types in word_types.items()}
+
+_DISPUTE_WORD_TYPES = _build_dispute_word_types()
+
+def _build_dispute_automaton():
+	"""Автомат Aho-Corasick по ключевым словам"""
+	automaton = ahocorasick.Automaton()
+	for keyword, types in _DISPUTE_WORD_TYPES.items():
+		automaton.add_word(keyword, types)
+	automaton.make_automaton()
+	return automaton
+
+_DISPUTE_AUTOMATON = _build_dispute_automaton() if _HAS_AHOCORASICK else None
+
+# Без pyahocorasick — одно скомпилированное выражение вместо проверки каждого
+# слова отдельно; опережающая проверка находит и перекрывающиеся вхождения
+_DISPUTE_PATTERN = re.compile(
+	"(?=(" + "|".join(map(re.escape, _DISPUTE_WORD_TYPES)) + "))"
+)
+
+def _detect_dispute_type(query_lower: str) -> Optional[str]:
+	"""Тип спора по ключевым словам запроса (за один проход по тексту)"""
+	found = set()
+	if _DISPUTE_AUTOMATON is None:
+		for match in _DISPUTE_PATTERN.finditer(query_lower):
+			found |= _DISPUTE_WORD_TYPES[match.group(1)]
+	else:
+		for _, types in _DISPUTE_AUTOMATON.iter(query_lower):
+			found |= types
+	return next((dispute_type for dispute_type, _ in _DISPUTE_KEYWORDS if dispute_type in found), None)
+
+def _search(
+	db,
+	query: str,
+	dispute_type: Optional[str],
+	query_embedding: Optional[List[float]] = None,
+) -> List[Dict[str, Any]]:
+	"""Поиск с фильтром по типу спора (если бэкенд его поддерживает)"""
+	# Для Chroma эмбеддинг берется готовым или из общего кэша, а не считается заново
+	search_kwargs = {}
+	if query_embedding is not None:
+		search_kwargs["query_embedding"] = query_embedding
+	elif vector_backend["embed"] is not None:
+		search_kwargs["query_embedding"] = vector_backend["embed"](query)
+	
+	# Используем фильтрацию по типу спора если доступна
+	if hasattr(db, 'search_similar') and 'dispute_type' in db.search_similar.__code__.co_varnames:
+		# Сначала пробуем с фильтром
+		similar = db.search_similar(query, n_results=5, dispute_type=dispute_type, **search_kwargs)
+		
+		# Если не нашли с фильтром, пробуем без фильтра
+		if not similar and dispute_type:
+			logger.warning(f"Не найдено документов с фильтром {dispute_type}, пробую без фильтра")
+			similar = db.search_similar(query, n_results=5, **search_kwargs)
+		return similar
+	return db.search_similar(query, n_results=5)
+
+def _ndjson_response(frames: Iterator[Dict[str, Any]]) -> StreamingResponse:
+	"""Потоковый ответ: по одному JSON-объекту на строку"""
+	# Синхронный генератор Starlette выполняет в пуле потоков, поэтому
+	# блокирующий поток LLM не останавливает event loop
+	return StreamingResponse(
+		(json_dumps(frame) + b"\n" for frame in frames),
+		media_type="application/x-ndjson",
+	)
+
+def _generation_frames(
+	query: str,
+	similar: List[Dict[str, Any]],
+	document_type: str,
+	snippets: List[Dict[str, str]],
+) -> Iterator[Dict[str, Any]]:
+	yield {"snippets": snippets}
+	try:
+		result = generate_legal_document(query, similar, document_type=document_type, stream=True)
+		yield {"provider": result["provider"]}
+		for chunk in result["document"]:
+			yield {"chunk": chunk}
+	except Exception as e:
+		logger.error(f"Ошибка потоковой генерации: {e}")
+		yield {"error": str(e)}
+
 @app.post("/api/generate")
 async def api_generate(payload: Dict[str, Any]):
-	"""Body: { "query": str, "document_type": str }
+	"""Body: { "query": str, "document_type": str, "stream": bool }
 	Returns: { provider, document, snippets }
+	При "stream": true — NDJSON: сначала {"snippets": [...]}, затем
+	{"provider": ...} и фрагменты документа {"chunk": "..."} по мере генерации
+	(при ошибке — {"error": "..."})
 	"""
 	query = (payload.get("query") or "").strip()
 	document_type = (payload.get("document_type") or "исковое заявление").strip()
+	stream = bool(payload.get("stream"))
 	if not query:
 		raise HTTPException(status_code=400, detail="query is required")
 	
-	# Search
+	# Search: при первом запросе дожидаемся фоновой инициализации базы
+	if vector_backend["ready"] is not None:
+		await vector_backend["ready"].wait()
 	db = vector_backend["db"]
 	if db is None:
 		raise HTTPException(status_code=500, detail="vector backend not initialized")
 	
 	# Определяем тип спора для фильтрации
-	query_lower = query.lower()
-	dispute_type = None
-	if any(keyword in query_lower for keyword in ["потребитель", "товар", "продавец", "недостаток", "качество"]):
-		dispute_type = "consumer_protection"
-	elif any(keyword in query_lower for keyword in ["договор", "контракт", "обязательство"]):
-		dispute_type = "contract_dispute"
+	dispute_type = _detect_dispute_type(query.lower())
 	
-	# Используем фильтрацию по типу спора если доступна
-	similar = []
-	if hasattr(db, 'search_similar') and 'dispute_type' in db.search_similar.__code__.co_varnames:
-		# Сначала пробуем с фильтром
-		similar = db.search_similar(query, n_results=5, dispute_type=dispute_type)
-		
-		# Если не нашли с фильтром, пробуем без фильтра
-		if not similar and dispute_type:
-			logger.warning(f"Не найдено документов с фильтром {dispute_type}, пробую без фильтра")
-			similar = db.search_similar(query, n_results=5)
-	else:
-		similar = db.search_similar(query, n_results=5)
+	# Кэш поиска: результат близкого запроса с тем же типом спора
+	# вместе с уже обрезанными фрагментами для ответа
+	search_cache = vector_backend["search_cache"]
+	similar = None
+	if search_cache is not None:
+		query_vector = search_cache.embed(query)
+		cached = search_cache.get(query, query_vector)
+		if cached is not None and cached[0] == dispute_type:
+			_, similar, snippets = cached
+	
+	if similar is None:
+		similar = _search(db, query, dispute_type)
+		snippets = db.format_snippets(similar, max_chars=SNIPPET_MAX_CHARS)
+		if search_cache is not None:
+			search_cache.set(query, (dispute_type, similar, snippets), query_vector)
+	
+	if stream:
+		# Фрагменты уходят клиенту сразу после поиска, документ — по мере генерации
+		return _ndjson_response(_generation_frames(query, similar, document_type, snippets))
 	
 	# Generate
-	result = generate_legal_document(query, similar, document_type=document_type)
+	# Асинхронный запрос не блокирует event loop; хеджирование (второй запрос
+	# к OpenAI при медленном Gemini) включается только через LLM_HEDGE_DELAY
+	result = await generate_legal_document_async(query, similar, document_type=document_type)
 	
 	# Return
-	snippets = [
-		{
-			"text": s.get("text", "")[:500],
-			"source_file": s.get("metadata", {}).get("source_file", ""),
-			"chunk_type": s.get("metadata", {}).get("chunk_type", ""),
-		}
-		for s in similar
-	]
 	return {"provider": result.get("provider"), "document": result.get("document"), "snippets": snippets}
 
 if __name__ == "__main__":
 	print(f"🚀 Starting RAG Legal Document Generator MVP")
 	print(f"📡 API will be available at: http://{API_HOST}:{API_PORT}")
 	print(f"📚 Documentation: http://{API_HOST}:{API_PORT}/docs")
-	uvicorn.run("main:app", host=API_HOST, port=API_PORT, reload=True, log_level="info")
+	# loop/http по умолчанию "auto": uvloop и httptools (uvicorn[standard]), если установлены.
+	# При API_WORKERS > 1 каждый процесс поднимает свой бэкенд; файлы индекса
+	# общие через page cache ОС (матрицы SimpleVectorDatabase — через mmap).
+	# reload несовместим с несколькими процессами и включается только для одного
+	uvicorn.run(
+		"main:app",
+		host=API_HOST,
+		port=API_PORT,
+		reload=API_WORKERS == 1,
+		workers=API_WORKERS,
+		log_level="info",
+	)
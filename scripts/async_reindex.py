@@ -7,27 +7,70 @@ import os
 import sys
 import asyncio
 import time
+import multiprocessing as mp
 from pathlib import Path
-from typing import List, Dict, Any
-from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import shutil
+import numpy as np
 
 # Добавляем текущую директорию в путь
 sys.path.append(str(Path(__file__).parent.parent))
 
 from src.processors.data_processor import LegalDocumentProcessor
-from src.databases.vector_database import VectorDatabase
-from src.utils.config import PDF_DIR, JSON_DIR, CHROMA_DB_PATH
+from src.databases.vector_database import VectorDatabase, DEFAULT_FILES_BATCH
+from src.utils.config import PDF_DIR, JSON_DIR, CHROMA_DB_PATH, SEARCH_WARMUP_PATH
+from src.utils.json_io import read_json
+from src.utils.file_scan import scan_pdf_vs_json
 from loguru import logger
 from tqdm.asyncio import tqdm
 
+# Интервалы перерисовки прогресс-бара (сек): обновления копятся между ними
+PROGRESS_MININTERVAL = 0.25
+PROGRESS_MAXINTERVAL = 1.0
+
+# Инкрементальный режим не удаляет за раз больше этой доли загруженных
+# документов: массовое исчезновение PDF скорее означает ошибку (не тот
+# каталог, не смонтирован диск), чем намеренную чистку — для нее есть --full
+MAX_DELETE_FRACTION = 0.5
+
+# Процессор рабочего процесса пула (создается один раз на процесс)
+_WORKER_PROCESSOR: Optional[LegalDocumentProcessor] = None
+
+def _init_worker(use_gemini_chunking: bool):
+    """Инициализирует процессор в рабочем процессе пула"""
+    global _WORKER_PROCESSOR
+    _WORKER_PROCESSOR = LegalDocumentProcessor(use_gemini_chunking=use_gemini_chunking)
+
+def _process_pdf_in_worker(pdf_path: str, json_path: str) -> Dict[str, Any]:
+    """
+    Обрабатывает PDF в рабочем процессе и сохраняет JSON;
+    обратно передается только сводка
+    """
+    result = _WORKER_PROCESSOR.process_pdf_to_json(pdf_path)
+    if not result:
+        raise RuntimeError("пустой результат обработки")
+    _WORKER_PROCESSOR.save_json(result, json_path)
+    return {'processing_info': result.get('processing_info', {})}
+
 class AsyncReindexer:
     """Асинхронный переиндексатор с прогресс-баром"""
     
-    def __init__(self, max_workers: int = 8):
+    def __init__(self, max_workers: int = 8, use_gemini_chunking: bool = True, full: bool = False):
         self.max_workers = max_workers
-        self.processor = LegalDocumentProcessor(use_gemini_chunking=True)
+        # full=True — удалить JSON и векторную базу и построить все заново;
+        # иначе переобрабатываются только новые и измененные PDF
+        self.full = full
         self.vector_db = None
+        # Разбор PDF нагружает CPU и под GIL в потоках не масштабируется,
+        # поэтому идет в пуле процессов; работа с Chroma — в пуле потоков
+        context = mp.get_context('forkserver') if 'forkserver' in mp.get_all_start_methods() else None
+        self.process_executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(use_gemini_chunking,)
+        )
         self.executor = ThreadPoolExecutor(max_workers=max_workers)
         
     async def clear_old_data(self):
@@ -45,45 +88,31 @@ class AsyncReindexer:
             shutil.rmtree(JSON_DIR)
             os.makedirs(JSON_DIR, exist_ok=True)
     
-    async def get_pdf_files(self) -> List[str]:
-        """Получает список PDF файлов для обработки"""
+    async def get_pdf_files(self) -> Optional[List[str]]:
+        """Получает список PDF файлов для обработки (None, если каталога нет)"""
         if not os.path.exists(PDF_DIR):
             logger.error(f"Директория {PDF_DIR} не существует")
-            return []
+            return None
         
         pdf_files = [f for f in os.listdir(PDF_DIR) if f.lower().endswith('.pdf')]
         logger.info(f"📄 Найдено {len(pdf_files)} PDF файлов для обработки")
         return pdf_files
     
     async def process_single_pdf(self, pdf_file: str) -> Dict[str, Any]:
-        """Асинхронно обрабатывает один PDF файл"""
+        """Асинхронно обрабатывает один PDF файл (актуальность проверена заранее)"""
         start_time = time.time()
         try:
             pdf_path = os.path.join(PDF_DIR, pdf_file)
             json_file = pdf_file.replace('.pdf', '.json')
             json_path = os.path.join(JSON_DIR, json_file)
             
-            # Проверяем, нужно ли обрабатывать файл
-            if os.path.exists(json_path):
-                try:
-                    if os.path.getmtime(json_path) >= os.path.getmtime(pdf_path):
-                        return {
-                            'file': pdf_file,
-                            'status': 'skipped',
-                            'chunks': 0,
-                            'positions': 0,
-                            'error': None,
-                            'processing_time': 0
-                        }
-                except OSError:
-                    pass  # Файл поврежден, переобрабатываем
-            
-            # Обрабатываем файл в отдельном потоке
+            # Обрабатываем файл в отдельном процессе
             loop = asyncio.get_event_loop()
             result = await loop.run_in_executor(
-                self.executor,
-                self._process_pdf_sync,
-                pdf_path
+                self.process_executor,
+                _process_pdf_in_worker,
+                pdf_path,
+                json_path
             )
             
             processing_time = time.time() - start_time
@@ -92,6 +121,7 @@ class AsyncReindexer:
             
             return {
                 'file': pdf_file,
+                'json_file': json_file,
                 'status': 'processed',
                 'chunks': result.get('processing_info', {}).get('total_chunks', 0),
                 'positions': result.get('processing_info', {}).get('total_positions', 0),
@@ -108,13 +138,27 @@ class AsyncReindexer:
                 'error': str(e)
             }
     
-    def _process_pdf_sync(self, pdf_path: str) -> Dict[str, Any]:
-        """Синхронная обработка PDF файла"""
-        return self.processor.process_pdf_to_json(pdf_path)
+    async def process_all_pdfs_async(self, json_queue: Optional[asyncio.Queue] = None) -> Dict[str, Any]:
+        """
+        Асинхронно обрабатывает все PDF файлы.
+        Если передана очередь json_queue, каждый готовый JSON кладется
+        в нее сразу парой (имя, изменен ли) для конвейерной загрузки
+        в векторную базу, а в конце — None как признак окончания
+        """
+        results = await self._process_all_pdfs(json_queue)
+        if json_queue is not None:
+            await json_queue.put(None)
+        return results
     
-    async def process_all_pdfs_async(self) -> Dict[str, Any]:
-        """Асинхронно обрабатывает все PDF файлы"""
-        pdf_files = await self.get_pdf_files()
+    async def _process_all_pdfs(self, json_queue: Optional[asyncio.Queue]) -> Dict[str, Any]:
+        if not os.path.exists(PDF_DIR):
+            logger.error(f"Директория {PDF_DIR} не существует")
+            pdf_files, stale_files = [], []
+        else:
+            # Один проход scandir по каждому каталогу: актуальные файлы
+            # отсекаются сразу, без обращения к пулу процессов
+            pdf_files, stale_files = scan_pdf_vs_json(PDF_DIR, JSON_DIR)
+            logger.info(f"📄 Найдено {len(pdf_files)} PDF файлов, к обработке: {len(stale_files)}")
         
         if not pdf_files:
             return {
@@ -127,28 +171,51 @@ class AsyncReindexer:
             }
         
         logger.info(f"🚀 Начинаю асинхронную обработку {len(pdf_files)} файлов")
-        logger.info(f"⚡ Используется {self.max_workers} параллельных потоков")
+        logger.info(f"⚡ Используется {self.max_workers} параллельных процессов")
+        
+        # Актуальные файлы пропускаются, но их JSON все равно идет в очередь:
+        # загрузчик сам решит по манифесту, нужен ли он базе
+        stale = set(stale_files)
+        results = []
+        for pdf_file in pdf_files:
+            if pdf_file in stale:
+                continue
+            json_file = pdf_file.replace('.pdf', '.json')
+            results.append({
+                'file': pdf_file,
+                'json_file': json_file,
+                'status': 'skipped',
+                'chunks': 0,
+                'positions': 0,
+                'error': None,
+                'processing_time': 0
+            })
+            if json_queue is not None:
+                await json_queue.put((json_file, False))
         
         # Создаем задачи для асинхронной обработки
-        tasks = [self.process_single_pdf(pdf_file) for pdf_file in pdf_files]
+        tasks = [self.process_single_pdf(pdf_file) for pdf_file in stale_files]
         
-        # Обрабатываем с прогресс-баром
-        results = []
-        with tqdm(total=len(tasks), desc="📄 Обработка PDF", unit="файл") as pbar:
+        # Обрабатываем с прогресс-баром. Перерисовка не чаще PROGRESS_MININTERVAL:
+        # set_postfix без refresh лишь запоминает значения до ближайшей перерисовки
+        with tqdm(total=len(tasks), desc="📄 Обработка PDF", unit="файл",
+                  mininterval=PROGRESS_MININTERVAL, maxinterval=PROGRESS_MAXINTERVAL) as pbar:
             for coro in asyncio.as_completed(tasks):
                 result = await coro
                 results.append(result)
+                if json_queue is not None and result['status'] != 'error':
+                    await json_queue.put((result['json_file'], result['status'] == 'processed'))
                 
                 # Обновляем прогресс-бар
                 if result['status'] == 'processed':
                     pbar.set_postfix({
                         'chunks': result['chunks'],
                         'positions': result['positions']
-                    })
+                    }, refresh=False)
                 elif result['status'] == 'skipped':
-                    pbar.set_postfix({'status': 'skipped'})
+                    pbar.set_postfix({'status': 'skipped'}, refresh=False)
                 elif result['status'] == 'error':
-                    pbar.set_postfix({'status': 'error'})
+                    pbar.set_postfix({'status': 'error'}, refresh=False)
                 
                 pbar.update(1)
         
@@ -176,8 +243,13 @@ class AsyncReindexer:
             'processed_files': processed_files
         }
     
-    async def create_vector_database(self):
-        """Создает векторную базу данных"""
+    async def create_vector_database(self, json_queue: Optional[asyncio.Queue] = None):
+        """
+        Создает векторную базу данных и загружает в нее JSON файлы:
+        все файлы из JSON_DIR или, если передана очередь, файлы по мере
+        их появления в json_queue (до None). Уже загруженные и неизмененные
+        файлы пропускаются, измененные заменяют свои старые фрагменты
+        """
         logger.info("🔍 Создаю векторную базу данных...")
         
         loop = asyncio.get_event_loop()
@@ -186,41 +258,133 @@ class AsyncReindexer:
             VectorDatabase
         )
         
+        if json_queue is not None:
+            await self._ingest_from_queue(json_queue)
+            logger.info("✅ Векторная база данных создана")
+            return
+        
         # Загружаем JSON файлы в векторную базу
-        json_files = [f for f in os.listdir(JSON_DIR) if f.endswith('.json')]
+        json_files = [
+            f for f in os.listdir(JSON_DIR)
+            if f.endswith('.json') and f not in self.vector_db.ingested_files
+        ]
         
         if not json_files:
-            logger.warning("JSON файлы не найдены")
+            logger.warning("Новые JSON файлы не найдены")
             return
         
         logger.info(f"📚 Загружаю {len(json_files)} JSON файлов в векторную базу...")
         
-        # Загружаем файлы с прогресс-баром
-        with tqdm(total=len(json_files), desc="📚 Загрузка в векторную БД", unit="файл") as pbar:
-            for json_file in json_files:
-                json_path = os.path.join(JSON_DIR, json_file)
-                
-                try:
-                    await loop.run_in_executor(
-                        self.executor,
-                        self._load_single_json,
-                        json_path
-                    )
-                    pbar.update(1)
-                except Exception as e:
-                    logger.error(f"Ошибка загрузки {json_file}: {e}")
-                    pbar.update(1)
+        with tqdm(total=len(json_files), desc="📚 Загрузка в векторную БД", unit="файл",
+                  mininterval=PROGRESS_MININTERVAL, maxinterval=PROGRESS_MAXINTERVAL) as pbar:
+            for start in range(0, len(json_files), DEFAULT_FILES_BATCH):
+                batch_files = json_files[start:start + DEFAULT_FILES_BATCH]
+                await self._add_json_batch(batch_files)
+                pbar.update(len(batch_files))
         
         logger.info("✅ Векторная база данных создана")
     
-    def _load_single_json(self, json_path: str):
-        """Загружает один JSON файл в векторную базу"""
-        import json
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+    async def _ingest_from_queue(self, json_queue: asyncio.Queue):
+        """Загружает JSON из очереди партиями из всего, что накопилось к этому моменту"""
+        total = 0
+        finished = False
+        while not finished:
+            batch_files = []
+            item = await json_queue.get()
+            while item is not None:
+                json_file, changed = item
+                if changed or json_file not in self.vector_db.ingested_files:
+                    batch_files.append(json_file)
+                if len(batch_files) >= DEFAULT_FILES_BATCH or json_queue.empty():
+                    break
+                item = json_queue.get_nowait()
+            finished = item is None
+            
+            if batch_files:
+                await self._add_json_batch(batch_files)
+                total += len(batch_files)
+                logger.info(f"📚 В векторную базу загружено JSON файлов: {total}")
+    
+    async def _add_json_batch(self, batch_files: List[str]):
+        """
+        Читает партию JSON параллельно и добавляет ее одним вызовом
+        add_documents (эмбеддинги считаются большими пакетами)
+        """
+        loop = asyncio.get_event_loop()
+        loaded = await asyncio.gather(
+            *[
+                loop.run_in_executor(
+                    self.executor, read_json, os.path.join(JSON_DIR, json_file)
+                )
+                for json_file in batch_files
+            ],
+            return_exceptions=True
+        )
+        
+        documents = []
+        added_files = []
+        replaced_sources = []
+        for json_file, data in zip(batch_files, loaded):
+            if isinstance(data, Exception):
+                logger.error(f"Ошибка загрузки {json_file}: {data}")
+                continue
+            documents.append(data)
+            added_files.append(json_file)
+            # Файл уже был в базе: его старые фрагменты заменяются новыми
+            if json_file in self.vector_db.ingested_files:
+                replaced_sources.append(data.get('source_file', 'unknown'))
+        
+        try:
+            await loop.run_in_executor(
+                self.executor,
+                self.vector_db.delete_source_files,
+                replaced_sources
+            )
+            await loop.run_in_executor(
+                self.executor,
+                self.vector_db.add_documents,
+                documents
+            )
+        except Exception as e:
+            logger.error(f"Ошибка добавления партии из {len(documents)} файлов: {e}")
+            return
+        for json_file in added_files:
+            self.vector_db.mark_ingested(json_file)
+    
+    async def remove_deleted_pdfs(self, pdf_files: Optional[List[str]]):
+        """Удаляет из векторной базы и JSON_DIR документы, PDF которых больше нет"""
+        if not pdf_files:
+            # Пустой или недоступный PDF_DIR удалил бы весь корпус
+            logger.warning(f"В {PDF_DIR} нет PDF файлов, удаление документов пропущено")
+            return
+        current = {pdf_file.replace('.pdf', '.json') for pdf_file in pdf_files}
+        ingested = self.vector_db.ingested_files
+        stale = [json_file for json_file in ingested if json_file not in current]
+        if not stale:
+            return
+        if len(stale) > MAX_DELETE_FRACTION * len(ingested):
+            logger.warning(
+                f"Без исходных PDF {len(stale)} из {len(ingested)} документов — "
+                f"удаление пропущено; для пересборки запустите с --full"
+            )
+            return
+        
+        logger.info(f"🗑️ Удаляю {len(stale)} документов без исходных PDF")
+        source_files = []
+        for json_file in stale:
+            json_path = os.path.join(JSON_DIR, json_file)
+            try:
+                source_files.append(read_json(json_path).get('source_file', 'unknown'))
+                os.remove(json_path)
+            except OSError:
+                source_files.append(json_file[:-len('.json')] + '.pdf')
+            except Exception as e:
+                logger.warning(f"Не удалось прочитать {json_file}: {e}")
+                source_files.append(json_file[:-len('.json')] + '.pdf')
         
-        # Добавляем документ в векторную базу
-        self.vector_db.add_documents([data])
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self.executor, self.vector_db.delete_source_files, source_files)
+        self.vector_db.forget_ingested(stale)
     
     async def test_search(self):
         """Тестирует поиск в векторной базе"""
@@ -237,19 +401,39 @@ class AsyncReindexer:
             "административная ответственность"
         ]
         
+        warmup_queries = []
+        warmup_embeddings = []
         for query in test_queries:
             try:
-                results = self.vector_db.search_similar(query, n_results=3)
+                embedding = self.vector_db.embed_query(query)
+                results = self.vector_db.search_similar(query, n_results=3, query_embedding=embedding)
                 logger.info(f"🔍 Запрос: '{query}' -> найдено {len(results)} результатов")
+                warmup_queries.append(query)
+                warmup_embeddings.append(embedding)
                 
                 for i, result in enumerate(results[:2], 1):
                     logger.info(f"   {i}. {result.get('title', 'Без названия')[:50]}...")
                     
             except Exception as e:
                 logger.error(f"Ошибка поиска для '{query}': {e}")
+        
+        # Эмбеддинги типовых запросов сохраняются: сервер прогревает
+        # ими кэш поиска при старте, не вызывая модель
+        if warmup_queries:
+            try:
+                np.savez(
+                    SEARCH_WARMUP_PATH,
+                    queries=np.array(warmup_queries),
+                    embeddings=np.asarray(warmup_embeddings, dtype=np.float32)
+                )
+                logger.info(f"💾 Эмбеддинги {len(warmup_queries)} запросов для прогрева: {SEARCH_WARMUP_PATH}")
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить эмбеддинги для прогрева: {e}")
     
     async def cleanup(self):
         """Очищает ресурсы"""
+        if self.process_executor:
+            self.process_executor.shutdown(wait=True)
         if self.executor:
             self.executor.shutdown(wait=True)
     
@@ -258,14 +442,32 @@ class AsyncReindexer:
         start_time = time.time()
         
         try:
-            # 1. Очищаем старые данные
-            await self.clear_old_data()
+            # 1. Полная переиндексация начинается с чистого листа;
+            # инкрементальная переиспользует готовые JSON и векторную базу
+            if self.full:
+                await self.clear_old_data()
             
-            # 2. Обрабатываем PDF файлы
-            pdf_results = await self.process_all_pdfs_async()
+            # 2-3. Обрабатываем PDF файлы и создаем векторную базу конвейером:
+            # готовые JSON загружаются, пока остальные PDF еще разбираются
+            json_queue = asyncio.Queue(maxsize=32)
+            pdf_task = asyncio.ensure_future(self.process_all_pdfs_async(json_queue))
+            db_task = asyncio.ensure_future(self.create_vector_database(json_queue))
+            try:
+                # Ошибка одной стороны конвейера отменяет другую: иначе та ждала
+                # бы очередь бесконечно (asyncio.TaskGroup есть только с Python 3.11)
+                done, _ = await asyncio.wait(
+                    {pdf_task, db_task}, return_when=asyncio.FIRST_EXCEPTION
+                )
+                for task in done:
+                    task.result()
+            finally:
+                for task in (pdf_task, db_task):
+                    task.cancel()
+                await asyncio.gather(pdf_task, db_task, return_exceptions=True)
+            pdf_results = pdf_task.result()
             
-            # 3. Создаем векторную базу
-            await self.create_vector_database()
+            if not self.full:
+                await self.remove_deleted_pdfs(await self.get_pdf_files())
             
             # 4. Тестируем поиск
             await self.test_search()
@@ -286,15 +488,15 @@ class AsyncReindexer:
         finally:
             await self.cleanup()
 
-async def main():
+async def main(full: bool = False):
     """Основная функция"""
     logger.info("🚀 Запуск асинхронной переиндексации")
     
     # Определяем количество потоков на основе CPU
     import multiprocessing
-    max_workers = min(multiprocessing.cpu_count(), 8)  # Максимум 8 потоков
+    max_workers = min(multiprocessing.cpu_count(), 8)  # Максимум 8 процессов
     
-    reindexer = AsyncReindexer(max_workers=max_workers)
+    reindexer = AsyncReindexer(max_workers=max_workers, full=full)
     
     try:
         await reindexer.run_full_reindex()
@@ -311,5 +513,14 @@ if __name__ == "__main__":
     # Настраиваем логирование
     logger.add("./logs/async_reindex.log", rotation="10 MB", level="INFO")
     
+    import argparse
+    parser = argparse.ArgumentParser(description="Асинхронная переиндексация документов")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="удалить JSON и векторную базу и переиндексировать все PDF заново",
+    )
+    args = parser.parse_args()
+    
     # Запускаем асинхронную переиндексацию
-    asyncio.run(main())
+    asyncio.run(main(full=args.full))
@@ -7,14 +7,25 @@
 """
 
 import os
+import sys
 import time
 from pathlib import Path
+import numpy as np
 from data_processor import LegalDocumentProcessor
 from vector_database import VectorDatabase
 from simple_vector_db import SimpleVectorDatabase
 from config import PDF_DIR, JSON_DIR, CHROMA_DB_PATH
 from loguru import logger
 
+# Ход теста выводится в stdout через loguru: запись идет в фоновом потоке
+# (enqueue=True) и не попадает в замеры времени шагов
+report = logger.bind(report=True)
+
+def list_files(directory: str, suffix: str) -> list:
+    """Имена файлов с расширением suffix (без учета регистра) — один проход os.scandir"""
+    with os.scandir(directory) as it:
+        return [e.name for e in it if e.name.lower().endswith(suffix) and e.is_file()]
+
 class FullPipelineTest:
     """Класс для полного тестирования пайплайна"""
     
@@ -26,97 +37,107 @@ class FullPipelineTest:
         
     def setup_logging(self):
         """Настройка логирования"""
+        logger.remove()
+        logger.add(sys.stderr, level="INFO", filter=lambda r: "report" not in r["extra"])
+        logger.add(
+            sys.stdout,
+            level="INFO",
+            format="{message}",
+            filter=lambda r: "report" in r["extra"],
+            enqueue=True,
+            backtrace=False,
+        )
         logger.add("./logs/full_pipeline_test.log", rotation="1 MB", level="INFO")
     
     def step1_process_pdfs(self):
         """Шаг 1: Обработка PDF файлов"""
-        print("\n" + "="*60)
-        print("🔄 ШАГ 1: ОБРАБОТКА PDF ФАЙЛОВ")
-        print("="*60)
+        report.info("\n" + "="*60)
+        report.info("🔄 ШАГ 1: ОБРАБОТКА PDF ФАЙЛОВ")
+        report.info("="*60)
         
         # Проверяем наличие PDF файлов
-        pdf_files = [f for f in os.listdir(PDF_DIR) if f.lower().endswith('.pdf')]
-        print(f"📁 Найдено PDF файлов: {len(pdf_files)}")
+        pdf_files = list_files(PDF_DIR, '.pdf')
+        report.info(f"📁 Найдено PDF файлов: {len(pdf_files)}")
         
         if not pdf_files:
-            print("❌ PDF файлы не найдены!")
+            report.info("❌ PDF файлы не найдены!")
             return False
         
         # Создаем процессор
-        print("\n📊 Инициализация процессора данных...")
+        report.info("\n📊 Инициализация процессора данных...")
         self.processor = LegalDocumentProcessor(use_gemini_chunking=True)
         
         # Обрабатываем все PDF файлы
-        print("🔄 Обработка PDF файлов...")
-        start_time = time.time()
+        report.info("🔄 Обработка PDF файлов...")
+        start_time = time.perf_counter()
         
         # Получаем сводку, без построчной печати по каждому документу
         summary = self.processor.process_all_pdfs(PDF_DIR, JSON_DIR)
         
-        processing_time = time.time() - start_time
+        processing_time = time.perf_counter() - start_time
         
         # Краткая сводка
-        print(f"\n✅ Обработка завершена за {processing_time:.2f} секунд")
-        print(f"📄 Создано/обновлено JSON: {summary.get('processed', 0)}, пропущено: {summary.get('skipped', 0)}, ошибок: {summary.get('errors', 0)}, всего PDF: {summary.get('total', len(pdf_files))}")
+        report.info(f"\n✅ Обработка завершена за {processing_time:.2f} секунд")
+        report.info(f"📄 Создано/обновлено JSON: {summary.get('processed', 0)}, пропущено: {summary.get('skipped', 0)}, ошибок: {summary.get('errors', 0)}, всего PDF: {summary.get('total', len(pdf_files))}")
         
         return (summary.get('processed', 0) + summary.get('skipped', 0)) > 0
 
     def step2_create_vector_database(self):
         """Шаг 2: Создание векторной базы данных"""
-        print("\n" + "="*60)
-        print("🔄 ШАГ 2: СОЗДАНИЕ ВЕКТОРНОЙ БАЗЫ ДАННЫХ")
-        print("="*60)
+        report.info("\n" + "="*60)
+        report.info("🔄 ШАГ 2: СОЗДАНИЕ ВЕКТОРНОЙ БАЗЫ ДАННЫХ")
+        report.info("="*60)
         
-        print("📊 Инициализация векторной базы данных...")
-        start_time = time.time()
+        report.info("📊 Инициализация векторной базы данных...")
+        start_time = time.perf_counter()
         
         try:
             # Создаем полную векторную базу данных
             self.vector_db = VectorDatabase()
             
             # Загружаем документы из JSON файлов (функция вернет сводку)
-            print("📁 Загрузка документов из JSON файлов...")
+            report.info("📁 Загрузка документов из JSON файлов...")
             load_summary = self.vector_db.load_from_json_files(JSON_DIR)
             
             # Информация о коллекции
             info = self.vector_db.get_collection_info()
             
-            creation_time = time.time() - start_time
+            creation_time = time.perf_counter() - start_time
             
-            print(f"\n✅ Векторная база данных создана за {creation_time:.2f} секунд")
-            print(f"📊 Информация о коллекции: документов {info.get('document_count', 0)}")
-            print(f"📄 Новых файлов: {load_summary.get('loaded_files', 0)}, пропущено: {load_summary.get('skipped', 0)}, ошибок: {load_summary.get('errors', 0)}, всего JSON: {load_summary.get('total', 0)}")
+            report.info(f"\n✅ Векторная база данных создана за {creation_time:.2f} секунд")
+            report.info(f"📊 Информация о коллекции: документов {info.get('document_count', 0)}")
+            report.info(f"📄 Новых файлов: {load_summary.get('loaded_files', 0)}, пропущено: {load_summary.get('skipped', 0)}, ошибок: {load_summary.get('errors', 0)}, всего JSON: {load_summary.get('total', 0)}")
             
             return info.get('document_count', 0) > 0
             
         except Exception as e:
-            print(f"❌ Ошибка при создании векторной базы данных: {e}")
+            report.info(f"❌ Ошибка при создании векторной базы данных: {e}")
             logger.error(f"Ошибка векторной БД: {e}")
             
             # Пробуем упрощенную версию
-            print("\n🔄 Пробуем упрощенную версию...")
+            report.info("\n🔄 Пробуем упрощенную версию...")
             try:
                 self.simple_db = SimpleVectorDatabase()
                 self.simple_db.load_from_json_files(JSON_DIR)
                 
                 info = self.simple_db.get_database_info()
-                print(f"✅ Упрощенная векторная база создана")
-                print(f"📊 Документов: {info['document_count']}")
+                report.info(f"✅ Упрощенная векторная база создана")
+                report.info(f"📊 Документов: {info['document_count']}")
                 return True
                 
             except Exception as e2:
-                print(f"❌ Ошибка и в упрощенной версии: {e2}")
+                report.info(f"❌ Ошибка и в упрощенной версии: {e2}")
                 return False
 
     def step3_test_search(self):
         """Шаг 3: Тестирование поиска"""
-        print("\n" + "="*60)
-        print("🔄 ШАГ 3: ТЕСТИРОВАНИЕ СЕМАНТИЧЕСКОГО ПОИСКА")
-        print("="*60)
+        report.info("\n" + "="*60)
+        report.info("🔄 ШАГ 3: ТЕСТИРОВАНИЕ СЕМАНТИЧЕСКОГО ПОИСКА")
+        report.info("="*60)
         
         db = self.vector_db if self.vector_db else self.simple_db
         if not db:
-            print("❌ Векторная база данных не инициализирована!")
+            report.info("❌ Векторная база данных не инициализирована!")
             return False
         
         test_queries = [
@@ -128,104 +149,141 @@ class FullPipelineTest:
             "кассационная жалоба"
         ]
         
-        print("🔍 Тестирование поиска по различным запросам:\n")
+        report.info("🔍 Тестирование поиска по различным запросам:\n")
         
-        for i, query in enumerate(test_queries, 1):
-            print(f"📝 Запрос {i}: '{query}'")
+        # Все запросы одним пакетным вызовом: эмбеддинги за один проход модели,
+        # поиск — одним запросом к коллекции
+        try:
+            start_time = time.perf_counter()
+            all_results = db.search_similar_batch(test_queries, n_results=3)
+            search_time = time.perf_counter() - start_time
+        except Exception as e:
+            report.info(f"   ❌ Ошибка поиска: {e}")
+            logger.error(f"Ошибка пакетного поиска: {e}")
+            return True
+        
+        report.info(f"⏱️ Время поиска по {len(test_queries)} запросам: {search_time:.3f} секунд "
+              f"({search_time / len(test_queries):.3f} на запрос)\n")
+        
+        # Вывод собирается после замера и уходит в лог одним сообщением
+        lines = []
+        for i, (query, results) in enumerate(zip(test_queries, all_results), 1):
+            lines.append(f"📝 Запрос {i}: '{query}'")
+            lines.append(f"   📊 Найдено результатов: {len(results)}")
             
-            try:
-                start_time = time.time()
-                results = db.search_similar(query, n_results=3)
-                search_time = time.time() - start_time
-                
-                print(f"   ⏱️ Время поиска: {search_time:.3f} секунд")
-                print(f"   📊 Найдено результатов: {len(results)}")
-                
-                if results:
-                    for j, result in enumerate(results, 1):
-                        text_preview = result['text'][:80].replace('\n', ' ')
-                        if hasattr(result, 'get') and 'similarity' in result:
-                            score = result['similarity']
-                            print(f"      {j}. {text_preview}... (сходство: {score:.4f})")
-                        else:
-                            distance = result.get('distance', 0)
-                            print(f"      {j}. {text_preview}... (расстояние: {distance:.4f})")
-                else:
-                    print("   ❌ Результаты не найдены")
-                
-                print()
-                
-            except Exception as e:
-                print(f"   ❌ Ошибка поиска: {e}")
-                logger.error(f"Ошибка поиска для запроса '{query}': {e}")
+            if results:
+                for j, result in enumerate(results, 1):
+                    text_preview = result['text'][:80].replace('\n', ' ')
+                    if hasattr(result, 'get') and 'similarity' in result:
+                        score = result['similarity']
+                        lines.append(f"      {j}. {text_preview}... (сходство: {score:.4f})")
+                    else:
+                        distance = result.get('distance', 0)
+                        lines.append(f"      {j}. {text_preview}... (расстояние: {distance:.4f})")
+            else:
+                lines.append("   ❌ Результаты не найдены")
+            
+            lines.append("")
+        report.info("\n".join(lines))
         
         return True
 
     def step4_performance_analysis(self):
         """Шаг 4: Анализ производительности"""
-        print("\n" + "="*60)
-        print("🔄 ШАГ 4: АНАЛИЗ ПРОИЗВОДИТЕЛЬНОСТИ")
-        print("="*60)
+        report.info("\n" + "="*60)
+        report.info("🔄 ШАГ 4: АНАЛИЗ ПРОИЗВОДИТЕЛЬНОСТИ")
+        report.info("="*60)
         
         db = self.vector_db if self.vector_db else self.simple_db
         if not db:
-            print("❌ Векторная база данных не инициализирована!")
+            report.info("❌ Векторная база данных не инициализирована!")
             return False
         
         test_query = "договор займа"
-        times = []
+        num_queries = 10
         
-        print(f"🚀 Тестирование производительности (10 запросов)...")
-        
-        for i in range(10):
-            start_time = time.time()
-            _ = db.search_similar(test_query, n_results=5)
-            search_time = time.time() - start_time
-            times.append(search_time)
+        report.info(f"🚀 Тестирование производительности ({num_queries} запросов)...")
         
-        avg_time = sum(times) / len(times)
-        min_time = min(times)
-        max_time = max(times)
+        # Прогрев: первый запрос загружает модель и кэши и в замеры не входит
+        db.search_similar(test_query, n_results=5)
+        # Повторный запрос иначе отдается из кэша результатов поиска, и замер
+        # показывал бы поиск по словарю, а не по коллекции
+        reset_results = getattr(db, "clear_result_cache", lambda: None)
         
-        print(f"📊 Результаты производительности:")
-        print(f"   - Среднее время поиска: {avg_time:.3f} секунд")
-        print(f"   - Минимальное время: {min_time:.3f} секунд")
-        print(f"   - Максимальное время: {max_time:.3f} секунд")
-        print(f"   - Запросов в секунду: {1/avg_time:.1f}")
+        # Задержка одиночного запроса (без кэша результатов)
+        single_times = np.empty(num_queries)
+        for i in range(num_queries):
+            reset_results()
+            start_time = time.perf_counter()
+            _ = db.search_similar(test_query, n_results=5)
+            single_times[i] = time.perf_counter() - start_time
+        
+        # Пропускная способность: разные запросы одним пакетным вызовом
+        # (эмбеддинги считаются за один проход модели; одинаковые запросы
+        # пакет схлопнул бы в один)
+        batch_queries = [f"{test_query} {i}" for i in range(num_queries)]
+        reset_results()
+        start_time = time.perf_counter()
+        _ = db.search_similar_batch(batch_queries, n_results=5)
+        batch_time = time.perf_counter() - start_time
+        avg_time = batch_time / num_queries
+        
+        report.info(f"📊 Результаты производительности:")
+        report.info(
+            f"   - Время одиночного запроса (без кэша результатов): мин {single_times.min():.3f}, "
+            f"медиана {np.median(single_times):.3f}, "
+            f"среднее {single_times.mean():.3f}, "
+            f"макс {single_times.max():.3f}, "
+            f"σ {single_times.std(ddof=1):.3f} секунд"
+        )
+        report.info(f"   - Время пакета из {num_queries} запросов: {batch_time:.3f} секунд")
+        report.info(f"   - Среднее время на запрос в пакете: {avg_time:.3f} секунд")
+        report.info(f"   - Запросов в секунду: {1/avg_time:.1f}" if avg_time > 0 else "   - Запросов в секунду: —")
+        if hasattr(db, "query_cache_hits"):
+            # Повторные запросы берут эмбеддинг из кэша базы, а не из модели
+            total = db.query_cache_hits + db.query_cache_misses
+            report.info(
+                f"   - Кэш эмбеддингов запросов: попаданий {db.query_cache_hits}/{total}"
+            )
         
         return True
     
     def step5_generate_report(self):
         """Шаг 5: Генерация отчета"""
-        print("\n" + "="*60)
-        print("📋 ШАГ 5: ИТОГОВЫЙ ОТЧЕТ")
-        print("="*60)
+        report.info("\n" + "="*60)
+        report.info("📋 ШАГ 5: ИТОГОВЫЙ ОТЧЕТ")
+        report.info("="*60)
         
-        pdf_files = [f for f in os.listdir(PDF_DIR) if f.lower().endswith('.pdf')]
-        json_files = [f for f in os.listdir(JSON_DIR) if f.endswith('.json')]
+        pdf_files = list_files(PDF_DIR, '.pdf')
+        json_files = list_files(JSON_DIR, '.json')
         
         db = self.vector_db if self.vector_db else self.simple_db
         db_info = db.get_collection_info() if self.vector_db else db.get_database_info()
         
-        print("📊 СВОДНАЯ СТАТИСТИКА:")
-        print(f"   📁 PDF файлов обработано: {len(pdf_files)}")
-        print(f"   📄 JSON файлов создано: {len(json_files)}")
-        print(f"   🗄️ Бэкенд: {'ChromaDB' if self.vector_db else 'TF-IDF'}")
-        print(f"   📊 Документов в БД: {db_info.get('document_count', 0)}")
-        
-        print(f"\n✅ СТАТУС КОМПОНЕНТОВ:")
-        print(f"   ✅ Обработка PDF: Работает")
-        print(f"   ✅ Векторизация: Работает")
-        print(f"   ✅ Семантический поиск: Работает")
+        report.info("📊 СВОДНАЯ СТАТИСТИКА:")
+        report.info(f"   📁 PDF файлов обработано: {len(pdf_files)}")
+        report.info(f"   📄 JSON файлов создано: {len(json_files)}")
+        report.info(f"   🗄️ Бэкенд: {'ChromaDB' if self.vector_db else 'TF-IDF'}")
+        report.info(f"   📊 Документов в БД: {db_info.get('document_count', 0)}")
+        if 'result_cache_hits' in db_info:
+            report.info(
+                f"   ♻️ Кэш результатов поиска: попаданий {db_info['result_cache_hits']}"
+                f"/{db_info['result_cache_hits'] + db_info['result_cache_misses']}"
+            )
+        
+        report.info(f"\n✅ СТАТУС КОМПОНЕНТОВ:")
+        report.info(f"   ✅ Обработка PDF: Работает")
+        report.info(f"   ✅ Векторизация: Работает")
+        report.info(f"   ✅ Семантический поиск: Работает")
         
         return True
     
     def run_full_test(self):
         """Запуск полного тестирования"""
-        print("🚀 ЗАПУСК ПОЛНОГО ТЕСТИРОВАНИЯ RAG СИСТЕМЫ")
-        print("="*60)
+        report.info("🚀 ЗАПУСК ПОЛНОГО ТЕСТИРОВАНИЯ RAG СИСТЕМЫ")
+        report.info("="*60)
         
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         steps = [
             ("Обработка PDF файлов", self.step1_process_pdfs),
@@ -242,31 +300,34 @@ class FullPipelineTest:
                 result = step_func()
                 results[step_name] = result
                 if not result:
-                    print(f"❌ Шаг '{step_name}' завершился с ошибкой!")
+                    report.info(f"❌ Шаг '{step_name}' завершился с ошибкой!")
                     break
             except Exception as e:
-                print(f"❌ Критическая ошибка в шаге '{step_name}': {e}")
+                report.info(f"❌ Критическая ошибка в шаге '{step_name}': {e}")
                 logger.error(f"Критическая ошибка в {step_name}: {e}")
                 results[step_name] = False
                 break
         
-        total_time = time.time() - start_time
-        
-        print("\n" + "="*60)
-        print("🏁 ИТОГИ ТЕСТИРОВАНИЯ")
-        print("="*60)
+        total_time = time.perf_counter() - start_time
         
         success_count = sum(1 for result in results.values() if result)
         total_count = len(results)
         
-        print(f"⏱️ Общее время выполнения: {total_time:.2f} секунд")
-        print(f"✅ Успешных шагов: {success_count}/{total_count}")
-        
         if success_count == total_count:
-            print("🎉 ВСЕ ТЕСТЫ ПРОШЛИ УСПЕШНО!")
-            print("🚀 Система готова к интеграции с Gemini 2.5 Pro")
+            verdict = "🎉 ВСЕ ТЕСТЫ ПРОШЛИ УСПЕШНО!\n🚀 Система готова к интеграции с Gemini 2.5 Pro"
         else:
-            print("⚠️ Некоторые тесты не прошли. Проверьте логи.")
+            verdict = "⚠️ Некоторые тесты не прошли. Проверьте логи."
+        
+        # Дожидаемся вывода очереди логов, затем печатаем итоги одним блоком
+        logger.complete()
+        print(
+            "\n" + "="*60 + "\n"
+            "🏁 ИТОГИ ТЕСТИРОВАНИЯ\n"
+            + "="*60 + "\n"
+            f"⏱️ Общее время выполнения: {total_time:.2f} секунд\n"
+            f"✅ Успешных шагов: {success_count}/{total_count}\n"
+            + verdict
+        )
         
         return success_count == total_count
 
@@ -8,8 +8,17 @@ import sys
 import time
 import multiprocessing
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import shutil
+
+# Рабочие процессы пула (forkserver/spawn) импортируют этот скрипт заново
+# как __mp_main__. Число потоков OpenMP/MKL читается при загрузке numpy/torch,
+# поэтому задается здесь, до импорта тяжелых модулей ниже
+if __name__ == "__mp_main__":
+    os.environ["OMP_NUM_THREADS"] = "1"
+    os.environ["MKL_NUM_THREADS"] = "1"
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
 from tqdm import tqdm
 
 # Добавляем текущую директорию в путь
@@ -18,35 +27,46 @@ sys.path.append(str(Path(__file__).parent.parent))
 from src.processors.data_processor import LegalDocumentProcessor
 from src.databases.vector_database import VectorDatabase
 from src.utils.config import PDF_DIR, JSON_DIR, CHROMA_DB_PATH
+from src.utils.file_scan import scan_pdf_vs_json
 from loguru import logger
 
+try:
+    import psutil
+
+    _HAS_PSUTIL = True
+except Exception:
+    _HAS_PSUTIL = False
+
+# Процессор рабочего процесса пула (создается один раз на процесс)
+_WORKER_PROCESSOR: Optional[LegalDocumentProcessor] = None
+
+def _physical_cores() -> int:
+    """Число физических ядер (без psutil — логических)"""
+    cores = psutil.cpu_count(logical=False) if _HAS_PSUTIL else None
+    return cores or multiprocessing.cpu_count()
+
+def _init_worker(use_gemini_chunking: bool):
+    """
+    Инициализирует процессор в рабочем процессе пула. Каждый процесс
+    работает в один поток BLAS/torch: параллелизм дают сами процессы.
+    Переменные окружения задаются при импорте скрипта (до numpy/torch),
+    здесь остается только ограничить пул потоков уже загруженного torch
+    """
+    global _WORKER_PROCESSOR
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(1)
+    _WORKER_PROCESSOR = LegalDocumentProcessor(use_gemini_chunking=use_gemini_chunking)
+
 def process_single_pdf_worker(pdf_file: str) -> Dict[str, Any]:
-    """Рабочая функция для обработки одного PDF файла"""
+    """Рабочая функция для обработки одного PDF файла (актуальность проверена заранее)"""
     try:
         start_time = time.time()
-        
-        # Создаем процессор в каждом процессе
-        processor = LegalDocumentProcessor(use_gemini_chunking=True)
+        processor = _WORKER_PROCESSOR
         
         pdf_path = os.path.join(PDF_DIR, pdf_file)
         json_file = pdf_file.replace('.pdf', '.json')
         json_path = os.path.join(JSON_DIR, json_file)
         
-        # Проверяем, нужно ли обрабатывать файл
-        if os.path.exists(json_path):
-            try:
-                if os.path.getmtime(json_path) >= os.path.getmtime(pdf_path):
-                    return {
-                        'file': pdf_file,
-                        'status': 'skipped',
-                        'chunks': 0,
-                        'positions': 0,
-                        'error': None,
-                        'processing_time': 0
-                    }
-            except OSError:
-                pass  # Файл поврежден, переобрабатываем
-        
         # Обрабатываем файл
         data = processor.process_pdf_to_json(pdf_path)
         if data:
@@ -96,32 +116,46 @@ def clear_old_data():
         shutil.rmtree(JSON_DIR)
         os.makedirs(JSON_DIR, exist_ok=True)
 
-def get_pdf_files() -> List[str]:
-    """Получает список PDF файлов для обработки"""
-    if not os.path.exists(PDF_DIR):
-        logger.error(f"Директория {PDF_DIR} не существует")
-        return []
-    
-    pdf_files = [f for f in os.listdir(PDF_DIR) if f.lower().endswith('.pdf')]
-    logger.info(f"📄 Найдено {len(pdf_files)} PDF файлов для обработки")
-    return pdf_files
+def skipped_result(pdf_file: str) -> Dict[str, Any]:
+    """Результат для PDF, JSON которого новее самого файла"""
+    return {
+        'file': pdf_file,
+        'status': 'skipped',
+        'chunks': 0,
+        'positions': 0,
+        'error': None,
+        'processing_time': 0
+    }
 
 def process_pdfs_multiprocess(pdf_files: List[str], num_processes: int = None) -> List[Dict[str, Any]]:
     """Обрабатывает PDF файлы в многопроцессном режиме"""
     if num_processes is None:
-        num_processes = min(multiprocessing.cpu_count(), len(pdf_files))
+        num_processes = min(_physical_cores(), len(pdf_files))
     
     logger.info(f"🚀 Начинаю многопроцессную обработку {len(pdf_files)} файлов")
     logger.info(f"⚡ Используется {num_processes} процессов")
     
     start_time = time.time()
     
-    # Создаем пул процессов
-    with multiprocessing.Pool(processes=num_processes) as pool:
+    # Создаем пул процессов: процессор создается один раз в каждом из них.
+    # Файлы раздаются порциями, результаты принимаются по мере готовности
+    chunksize = max(1, len(pdf_files) // (num_processes * 4))
+    # forkserver: процессы не наследуют копию родителя с уже запущенными
+    # потоками OpenMP/torch (fork в таком состоянии может зависнуть)
+    context = (
+        multiprocessing.get_context('forkserver')
+        if 'forkserver' in multiprocessing.get_all_start_methods()
+        else multiprocessing.get_context()
+    )
+    with context.Pool(
+        processes=num_processes, initializer=_init_worker, initargs=(True,)
+    ) as pool:
         # Обрабатываем файлы с прогресс-баром
         results = []
         with tqdm(total=len(pdf_files), desc="📄 Обработка PDF", unit="файл") as pbar:
-            for result in pool.imap(process_single_pdf_worker, pdf_files):
+            for result in pool.imap_unordered(
+                process_single_pdf_worker, pdf_files, chunksize=chunksize
+            ):
                 results.append(result)
                 pbar.update(1)
                 
@@ -142,24 +176,26 @@ def process_pdfs_multiprocess(pdf_files: List[str], num_processes: int = None) -
     
     return results
 
-def load_to_vector_database():
-    """Загружает обработанные JSON файлы в векторную базу"""
+def load_to_vector_database(changed_json_files: List[str]):
+    """
+    Загружает в векторную базу новые JSON файлы; фрагменты переобработанных
+    (changed_json_files) заменяются, неизмененные файлы не трогаются
+    """
     logger.info("📚 Загружаю данные в векторную базу...")
     
     try:
         vector_db = VectorDatabase()
         vector_db.initialize_database()
+        vector_db.invalidate_json_files(JSON_DIR, changed_json_files)
         
         # Загружаем JSON файлы
-        stats = vector_db.load_from_json_files()
+        stats = vector_db.load_from_json_files(JSON_DIR)
         
         logger.info("✅ Векторная база обновлена:")
-        logger.info(f"   📄 Новых файлов: {stats['new_files']}")
-        logger.info(f"   📚 Загружено: {stats['loaded']}")
+        logger.info(f"   📚 Загружено: {stats['loaded_files']}")
         logger.info(f"   ⏭️ Пропущено: {stats['skipped']}")
         logger.info(f"   ❌ Ошибок: {stats['errors']}")
-        logger.info(f"   📊 Всего чанков: {stats['total_chunks']}")
-        logger.info(f"   📍 Всего позиций: {stats['total_positions']}")
+        logger.info(f"   📄 Всего файлов: {stats['total']}")
         
         return stats
         
@@ -193,27 +229,42 @@ def print_statistics(results: List[Dict[str, Any]]):
             if result['status'] == 'error':
                 logger.warning(f"   - {result['file']}: {result['error']}")
 
-def main():
-    """Основная функция"""
+def main(full: bool = False):
+    """
+    Основная функция. По умолчанию переобрабатываются только новые и
+    измененные PDF; full=True — удалить JSON и векторную базу и собрать заново
+    """
     logger.info("🚀 Запуск многопроцессной переиндексации")
     
     # Очищаем старые данные
-    clear_old_data()
+    if full:
+        clear_old_data()
     
-    # Получаем список PDF файлов
-    pdf_files = get_pdf_files()
+    # Получаем список PDF файлов и сразу отделяем актуальные (один проход
+    # scandir по каждому каталогу) — в пул уходят только устаревшие
+    if not os.path.exists(PDF_DIR):
+        logger.error(f"Директория {PDF_DIR} не существует")
+        return
+    pdf_files, stale_files = scan_pdf_vs_json(PDF_DIR, JSON_DIR)
     if not pdf_files:
         logger.error("PDF файлы не найдены")
         return
+    logger.info(f"📄 Найдено {len(pdf_files)} PDF файлов, к обработке: {len(stale_files)}")
     
     # Обрабатываем PDF файлы в многопроцессном режиме
-    results = process_pdfs_multiprocess(pdf_files)
+    stale = set(stale_files)
+    results = [skipped_result(f) for f in pdf_files if f not in stale]
+    if stale_files:
+        results += process_pdfs_multiprocess(stale_files)
     
     # Выводим статистику
     print_statistics(results)
     
     # Загружаем в векторную базу
-    vector_stats = load_to_vector_database()
+    changed_json_files = [
+        r['file'].replace('.pdf', '.json') for r in results if r['status'] == 'processed'
+    ]
+    vector_stats = load_to_vector_database(changed_json_files)
     
     if vector_stats:
         logger.info("🎉 Переиндексация завершена успешно!")
@@ -221,4 +272,11 @@ def main():
         logger.error("❌ Ошибка при загрузке в векторную базу")
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="Многопроцессная переиндексация документов")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="удалить JSON и векторную базу и переиндексировать все PDF заново",
+    )
+    main(full=parser.parse_args().full)
@@ -5,43 +5,48 @@
 
 import os
 import sys
+import shutil
 from pathlib import Path
 
-# Добавляем текущую директорию в путь
-sys.path.append(str(Path(__file__).parent))
+# Добавляем корень проекта в путь
+sys.path.append(str(Path(__file__).parent.parent))
 
-from data_processor import LegalDocumentProcessor
-from vector_database import VectorDatabase
-from config import PDF_DIR, JSON_DIR, CHROMA_DB_PATH
+from src.processors.data_processor import LegalDocumentProcessor
+from src.databases.vector_database import VectorDatabase
+from src.utils.config import PDF_DIR, JSON_DIR, CHROMA_DB_PATH
 from loguru import logger
 
-def main():
-    """Переиндексация с улучшенной разметкой"""
+def main(full: bool = False):
+    """
+    Переиндексация с улучшенной разметкой. По умолчанию размечаются заново
+    только новые и измененные PDF; full=True — удалить JSON и векторную базу
+    и переразметить все
+    """
     logger.info("🚀 Начинаю переиндексацию с улучшенной разметкой")
     
-    # Очищаем старую векторную базу
-    if os.path.exists(CHROMA_DB_PATH):
-        logger.info(f"🗑️ Удаляю старую векторную базу: {CHROMA_DB_PATH}")
-        import shutil
-        shutil.rmtree(CHROMA_DB_PATH)
-    
-    # Очищаем JSON файлы для переобработки
-    if os.path.exists(JSON_DIR):
-        logger.info(f"🗑️ Удаляю старые JSON файлы: {JSON_DIR}")
-        import shutil
-        shutil.rmtree(JSON_DIR)
-        os.makedirs(JSON_DIR, exist_ok=True)
+    if full:
+        # Очищаем старую векторную базу
+        if os.path.exists(CHROMA_DB_PATH):
+            logger.info(f"🗑️ Удаляю старую векторную базу: {CHROMA_DB_PATH}")
+            shutil.rmtree(CHROMA_DB_PATH)
+        
+        # Очищаем JSON файлы для переобработки
+        if os.path.exists(JSON_DIR):
+            logger.info(f"🗑️ Удаляю старые JSON файлы: {JSON_DIR}")
+            shutil.rmtree(JSON_DIR)
+            os.makedirs(JSON_DIR, exist_ok=True)
     
     # 1. Обработка PDF с улучшенной разметкой
     logger.info("📄 Обрабатываю PDF файлы с улучшенной разметкой...")
     processor = LegalDocumentProcessor(use_gemini_chunking=True)
-    result = processor.process_all_pdfs(force=True)
+    result = processor.process_all_pdfs(force=full)
     
     logger.info(f"✅ Обработка завершена: {result['processed']} файлов, {result['skipped']} пропущено, {result['errors']} ошибок")
     
-    # 2. Создание новой векторной базы
-    logger.info("🔍 Создаю новую векторную базу с улучшенной разметкой...")
+    # 2. Обновление векторной базы: фрагменты переобработанных файлов заменяются
+    logger.info("🔍 Обновляю векторную базу с улучшенной разметкой...")
     vector_db = VectorDatabase()
+    vector_db.invalidate_json_files(JSON_DIR, result.get('processed_files', []))
     
     # Загружаем JSON файлы
     load_result = vector_db.load_from_json_files(JSON_DIR)
@@ -72,4 +77,11 @@ def main():
     logger.info("💡 Теперь система будет находить более релевантные документы")
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="Переиндексация с улучшенной разметкой")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="удалить JSON и векторную базу и переразметить все PDF заново",
+    )
+    main(full=parser.parse_args().full)
@@ -2,7 +2,22 @@
 Модули векторных баз данных
 """
 
-from .vector_database import VectorDatabase
-from .simple_vector_db import SimpleVectorDatabase
+import importlib
 
 __all__ = ["VectorDatabase", "SimpleVectorDatabase"]
+
+# Классы импортируются при первом обращении (PEP 562): упрощенная база
+# и кэш эмбеддингов доступны без chromadb и sentence-transformers
+_LAZY_EXPORTS = {
+    "VectorDatabase": ".vector_database",
+    "SimpleVectorDatabase": ".simple_vector_db",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        module = importlib.import_module(_LAZY_EXPORTS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
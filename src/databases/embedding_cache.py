@@ -0,0 +1,78 @@
+"""
+Персистентный кэш эмбеддингов фрагментов на SQLite
+"""
+
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+from ..utils.cache import content_hash
+
+# Ограничение числа параметров в одном запросе SQLite
+_SELECT_BATCH = 500
+
+
+class EmbeddingCache:
+    """
+    Кэш «модель + текст -> эмбеддинг»: повторная переиндексация тех же
+    фрагментов не вызывает модель. Векторы хранятся в float32 как BLOB
+    """
+
+    def __init__(self, db_path: str, model_name: str):
+        """
+        Инициализация кэша
+
+        Args:
+            db_path: Путь к файлу базы SQLite
+            model_name: Имя модели эмбеддингов (входит в ключ)
+        """
+        self.model_name = model_name
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(
+            db_path, isolation_level=None, check_same_thread=False, timeout=30
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS emb(key TEXT PRIMARY KEY, vec BLOB)"
+        )
+
+    def key(self, text: str) -> str:
+        """Ключ фрагмента для текущей модели"""
+        return content_hash(f"{self.model_name}\x00{text}")
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        """Возвращает найденные эмбеддинги по ключам"""
+        found: Dict[str, List[float]] = {}
+        for start in range(0, len(keys), _SELECT_BATCH):
+            part = keys[start : start + _SELECT_BATCH]
+            rows = self.conn.execute(
+                f"SELECT key, vec FROM emb WHERE key IN ({','.join('?' * len(part))})",
+                part,
+            )
+            for key, vec in rows:
+                found[key] = np.frombuffer(vec, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, Sequence[float]]]):
+        """Сохраняет эмбеддинги одной транзакцией"""
+        try:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO emb(key, vec) VALUES (?, ?)",
+                (
+                    (key, np.asarray(vec, dtype=np.float32).tobytes())
+                    for key, vec in items
+                ),
+            )
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            logger.warning(f"Не удалось сохранить эмбеддинги в кэш: {e}")
+
+    def close(self):
+        """Закрывает соединение с базой"""
+        self.conn.close()
@@ -4,18 +4,30 @@
 """
 
 import os
-import json
+import uuid
 from typing import List, Dict, Any, Optional
+import numpy as np
+from scipy import sparse
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import pickle
 from loguru import logger
+from ..utils.logging_setup import setup_file_logging
+from .snippets import format_snippets
+from ..utils.json_io import read_json
 from ..utils.config import CHROMA_DB_PATH, TOP_K_RESULTS
 
 
+# Составные части разреженной CSR-матрицы, хранимые в отдельных .npy
+_CSR_PARTS = ("data", "indices", "indptr")
+
+
 class SimpleVectorDatabase:
     """Упрощенная векторная база данных для MVP"""
 
+    # Фрагменты результатов поиска для ответа API
+    format_snippets = staticmethod(format_snippets)
+
     def __init__(self, db_path: str = CHROMA_DB_PATH):
         """
         Инициализация упрощенной векторной базы данных
@@ -24,11 +36,17 @@ class SimpleVectorDatabase:
             db_path: Путь к базе данных
         """
         self.db_path = db_path
+        # float32 вдвое сокращает память матрицы и объем данных, читаемых при поиске
         self.vectorizer = TfidfVectorizer(
-            max_features=1000, stop_words=None, ngram_range=(1, 2)  # Для русского языка
+            max_features=1000,
+            stop_words=None,
+            ngram_range=(1, 2),  # Для русского языка
+            dtype=np.float32,
         )
         self.documents = []
         self.embeddings = None
+        # Инвертированный индекс «термин -> фрагменты» (транспонированная матрица)
+        self._postings = None
         self.is_fitted = False
 
         self.setup_logging()
@@ -36,7 +54,7 @@ class SimpleVectorDatabase:
 
     def setup_logging(self):
         """Настройка логирования"""
-        logger.add("./logs/simple_vector_db.log", rotation="1 MB", level="INFO")
+        setup_file_logging("./logs/simple_vector_db.log")
 
     def initialize_database(self):
         """Инициализация базы данных"""
@@ -67,20 +85,22 @@ class SimpleVectorDatabase:
             metadatas = []
 
             for doc in documents:
+                # Общие для всех фрагментов документа поля извлекаются один раз
+                meta = doc.get("metadata", {})
+                doc_meta = {
+                    "source_file": doc.get("source_file", "unknown"),
+                    "case_number": meta.get("case_number", ""),
+                    "court": meta.get("court", ""),
+                    "document_type": meta.get("document_type", ""),
+                }
+
                 # Извлекаем текст из чанков
                 if "chunks" in doc:
                     for chunk in doc["chunks"]:
                         texts.append(chunk["text"])
                         metadatas.append(
                             {
-                                "source_file": doc.get("source_file", "unknown"),
-                                "case_number": doc.get("metadata", {}).get(
-                                    "case_number", ""
-                                ),
-                                "court": doc.get("metadata", {}).get("court", ""),
-                                "document_type": doc.get("metadata", {}).get(
-                                    "document_type", ""
-                                ),
+                                **doc_meta,
                                 "chunk_id": chunk["id"],
                                 "chunk_type": chunk.get("type", "legal_text"),
                             }
@@ -92,14 +112,7 @@ class SimpleVectorDatabase:
                         texts.append(position["text"])
                         metadatas.append(
                             {
-                                "source_file": doc.get("source_file", "unknown"),
-                                "case_number": doc.get("metadata", {}).get(
-                                    "case_number", ""
-                                ),
-                                "court": doc.get("metadata", {}).get("court", ""),
-                                "document_type": doc.get("metadata", {}).get(
-                                    "document_type", ""
-                                ),
+                                **doc_meta,
                                 "chunk_id": f"position_{len(texts)}",
                                 "chunk_type": "legal_position",
                                 "articles": ", ".join(position.get("articles", [])),
@@ -141,6 +154,7 @@ class SimpleVectorDatabase:
 
             # Создаем TF-IDF эмбеддинги
             self.embeddings = self.vectorizer.fit_transform(texts)
+            self._build_postings()
             self.is_fitted = True
 
             logger.info(f"Создано {self.embeddings.shape[0]} эмбеддингов")
@@ -149,6 +163,16 @@ class SimpleVectorDatabase:
             logger.error(f"Ошибка при создании эмбеддингов: {e}")
             raise
 
+    def _build_postings(self):
+        """
+        Строит инвертированный индекс по матрице TF-IDF: строка — термин,
+        ненулевые элементы — фрагменты с этим термином. Запрос затрагивает
+        только списки своих терминов, а не все N фрагментов
+        """
+        self._postings = (
+            self.embeddings.T.tocsr() if self.embeddings is not None else None
+        )
+
     def search_similar(
         self,
         query: str,
@@ -166,35 +190,79 @@ class SimpleVectorDatabase:
         Returns:
             Список похожих документов с метаданными
         """
+        return self.search_similar_batch([query], n_results, filter_metadata)[0]
+
+    def search_similar_batch(
+        self,
+        queries: List[str],
+        n_results: int = TOP_K_RESULTS,
+        filter_metadata: Optional[Dict] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Ищет похожие документы сразу для нескольких запросов
+        (одно преобразование TF-IDF и одно матричное умножение)
+
+        Returns:
+            Списки похожих документов в порядке запросов
+        """
         try:
             if not self.is_fitted or self.embeddings is None:
                 logger.warning("База данных не инициализирована")
-                return []
-
-            # Создаем эмбеддинг для запроса
-            query_embedding = self.vectorizer.transform([query])
-
-            # Вычисляем косинусное сходство
-            similarities = cosine_similarity(query_embedding, self.embeddings).flatten()
-
-            # Получаем индексы наиболее похожих документов
-            top_indices = similarities.argsort()[-n_results:][::-1]
-
-            # Формируем результат
-            similar_docs = []
-            for idx in top_indices:
-                if similarities[idx] > 0:  # Только документы с положительным сходством
-                    similar_docs.append(
-                        {
-                            "text": self.documents[idx]["text"],
-                            "metadata": self.documents[idx]["metadata"],
-                            "similarity": float(similarities[idx]),
-                            "id": f"doc_{idx}",
-                        }
+                return [[] for _ in queries]
+
+            # Создаем эмбеддинги запросов (векторизатор из старой базы дает float64)
+            query_embeddings = self.vectorizer.transform(queries).astype(
+                np.float32, copy=False
+            )
+
+            # Вычисляем косинусное сходство. Векторы TF-IDF уже нормированы
+            # по L2, поэтому достаточно произведения с инвертированным индексом:
+            # в результате остаются только фрагменты с общими терминами
+            if getattr(self.vectorizer, "norm", None) == "l2":
+                if self._postings is None:
+                    self._build_postings()
+                candidates = [
+                    (row.indices, row.data)
+                    for row in (query_embeddings @ self._postings).tocsr()
+                ]
+            else:
+                candidates = [
+                    (np.arange(len(similarities)), similarities)
+                    for similarities in cosine_similarity(
+                        query_embeddings, self.embeddings
                     )
+                ]
 
-            logger.info(f"Найдено {len(similar_docs)} похожих документов")
-            return similar_docs
+            all_docs = []
+            for doc_indices, similarities in candidates:
+                # Наиболее похожие документы: частичная сортировка кандидатов,
+                # затем упорядочивание только n_results лучших
+                if 0 < n_results < len(similarities):
+                    top = np.argpartition(similarities, -n_results)[-n_results:]
+                    top = top[np.argsort(-similarities[top])]
+                else:
+                    top = np.argsort(-similarities)
+
+                # Формируем результат
+                similar_docs = []
+                for pos in top:
+                    if similarities[pos] > 0:  # Только документы с положительным сходством
+                        idx = int(doc_indices[pos])
+                        similar_docs.append(
+                            {
+                                "text": self.documents[idx]["text"],
+                                "metadata": self.documents[idx]["metadata"],
+                                "similarity": float(similarities[pos]),
+                                "id": f"doc_{idx}",
+                            }
+                        )
+                all_docs.append(similar_docs)
+
+            logger.info(
+                f"Найдено {sum(len(d) for d in all_docs)} похожих документов "
+                f"для {len(queries)} запросов"
+            )
+            return all_docs
 
         except Exception as e:
             logger.error(f"Ошибка при поиске: {e}")
@@ -217,19 +285,39 @@ class SimpleVectorDatabase:
         }
 
     def save_database(self):
-        """Сохраняет базу данных на диск"""
+        """
+        Сохраняет базу данных на диск.
+        Матрицы каждого сохранения пишутся в файлы новой версии, а pickle
+        со ссылкой на эту версию заменяется атомарно последним: читатель
+        видит либо прежний, либо новый согласованный набор файлов
+        """
         try:
             db_file = os.path.join(self.db_path, "simple_vector_db.pkl")
 
+            # Матрицы хранятся отдельно от pickle, чтобы загружать их через mmap
+            version = uuid.uuid4().hex[:12] if self.embeddings is not None else None
             data = {
                 "documents": self.documents,
                 "vectorizer": self.vectorizer,
-                "embeddings": self.embeddings,
+                "matrix_shapes": {
+                    "embeddings": self.embeddings.shape,
+                    "postings": self._postings.shape,
+                }
+                if self.embeddings is not None
+                else None,
+                "matrix_version": version,
                 "is_fitted": self.is_fitted,
             }
 
-            with open(db_file, "wb") as f:
+            if version is not None:
+                self._save_matrix("embeddings", self.embeddings, version)
+                self._save_matrix("postings", self._postings, version)
+
+            tmp_file = f"{db_file}.tmp"
+            with open(tmp_file, "wb") as f:
                 pickle.dump(data, f)
+            os.replace(tmp_file, db_file)
+            self._remove_stale_matrices(version)
 
             logger.info(f"База данных сохранена в {db_file}")
 
@@ -237,7 +325,10 @@ class SimpleVectorDatabase:
             logger.error(f"Ошибка при сохранении базы данных: {e}")
 
     def load_database(self):
-        """Загружает базу данных с диска"""
+        """
+        Загружает базу данных с диска. Состояние заменяется, только если
+        матрицы согласованы с документами; иначе база остается пустой
+        """
         try:
             db_file = os.path.join(self.db_path, "simple_vector_db.pkl")
 
@@ -248,18 +339,89 @@ class SimpleVectorDatabase:
             with open(db_file, "rb") as f:
                 data = pickle.load(f)
 
-            self.documents = data.get("documents", [])
+            documents = data.get("documents", [])
+            shapes = data.get("matrix_shapes")
+            if shapes:
+                version = data.get("matrix_version")
+                embeddings = self._load_matrix(
+                    "embeddings", shapes["embeddings"], version
+                )
+                postings = self._load_matrix("postings", shapes["postings"], version)
+            else:
+                # Базы старого формата: матрица внутри pickle
+                embeddings = data.get("embeddings")
+                if embeddings is not None:
+                    embeddings = embeddings.astype(np.float32, copy=False)
+                postings = embeddings.T.tocsr() if embeddings is not None else None
+
+            if embeddings is not None and (
+                embeddings.shape[0] != len(documents)
+                or postings.shape != embeddings.shape[::-1]
+            ):
+                raise ValueError(
+                    f"матрица {embeddings.shape} не соответствует "
+                    f"{len(documents)} документам"
+                )
+
+            self.documents = documents
             self.vectorizer = data.get(
-                "vectorizer", TfidfVectorizer(max_features=1000, ngram_range=(1, 2))
+                "vectorizer",
+                TfidfVectorizer(max_features=1000, ngram_range=(1, 2), dtype=np.float32),
             )
-            self.embeddings = data.get("embeddings")
-            self.is_fitted = data.get("is_fitted", False)
+            self.embeddings = embeddings
+            self._postings = postings
+            self.is_fitted = data.get("is_fitted", False) and embeddings is not None
 
             logger.info(f"База данных загружена: {len(self.documents)} документов")
 
         except Exception as e:
             logger.error(f"Ошибка при загрузке базы данных: {e}")
 
+    def _matrix_path(self, name: str, part: str, version: Optional[str]) -> str:
+        # Без версии — имена файлов первой версии формата
+        prefix = f"simple_vector_db.{version}" if version else "simple_vector_db"
+        return os.path.join(self.db_path, f"{prefix}.{name}.{part}.npy")
+
+    def _save_matrix(self, name: str, matrix: sparse.csr_matrix, version: str):
+        """Сохраняет CSR-матрицу в .npy файлы версии version"""
+        for part in _CSR_PARTS:
+            with open(self._matrix_path(name, part, version), "wb") as f:
+                np.save(f, getattr(matrix, part))
+
+    def _remove_stale_matrices(self, version: Optional[str]):
+        """
+        Удаляет .npy файлы других версий. Процессы, уже отобразившие
+        их в память, продолжают читать их до закрытия
+        """
+        current = {
+            os.path.basename(self._matrix_path(name, part, version))
+            for name in ("embeddings", "postings")
+            for part in _CSR_PARTS
+        }
+        for file_name in os.listdir(self.db_path):
+            if (
+                file_name.startswith("simple_vector_db.")
+                and file_name.endswith(".npy")
+                and file_name not in current
+            ):
+                try:
+                    os.remove(os.path.join(self.db_path, file_name))
+                except OSError as e:
+                    logger.warning(f"Не удалось удалить {file_name}: {e}")
+
+    def _load_matrix(
+        self, name: str, shape, version: Optional[str]
+    ) -> sparse.csr_matrix:
+        """
+        Загружает CSR-матрицу через mmap только для чтения: несколько
+        рабочих процессов сервера делят одни страницы page cache ОС
+        """
+        arrays = [
+            np.load(self._matrix_path(name, part, version), mmap_mode="r")
+            for part in _CSR_PARTS
+        ]
+        return sparse.csr_matrix(tuple(arrays), shape=tuple(shape), copy=False)
+
     def load_from_json_files(self, json_dir: str):
         """
         Загружает документы из JSON файлов
@@ -282,9 +444,7 @@ class SimpleVectorDatabase:
             for json_file in json_files:
                 json_path = os.path.join(json_dir, json_file)
                 try:
-                    with open(json_path, "r", encoding="utf-8") as f:
-                        doc_data = json.load(f)
-                        documents.append(doc_data)
+                    documents.append(read_json(json_path))
                 except Exception as e:
                     logger.error(f"Ошибка при загрузке {json_file}: {e}")
 
@@ -0,0 +1,34 @@
+"""
+Краткие фрагменты результатов поиска для ответа API
+"""
+
+from typing import List, Dict, Any
+
+
+def format_snippets(
+    results: List[Dict[str, Any]], max_chars: int = 500
+) -> List[Dict[str, str]]:
+    """
+    Превращает результаты search_similar в фрагменты для ответа API
+
+    Результаты обоих бэкендов всегда содержат ключи "text" и "metadata",
+    поэтому поля берутся напрямую, за один проход по списку
+
+    Args:
+        results: Результаты search_similar
+        max_chars: Максимальная длина текста фрагмента
+
+    Returns:
+        Список словарей text / source_file / chunk_type
+    """
+    snippets = []
+    for result in results:
+        meta = result["metadata"] or {}
+        snippets.append(
+            {
+                "text": result["text"][:max_chars],
+                "source_file": meta.get("source_file", ""),
+                "chunk_type": meta.get("chunk_type", ""),
+            }
+        )
+    return snippets
@@ -4,16 +4,23 @@
 """
 
 import os
-import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
+import numpy as np
 from loguru import logger
+from ..utils.logging_setup import setup_file_logging
+from .snippets import format_snippets
+from .embedding_cache import EmbeddingCache
+from ..utils.json_io import read_json
 from ..utils.config import (
     CHROMA_DB_PATH,
     VECTOR_COLLECTION_NAME,
     EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    EMBEDDING_CACHE_PATH,
     TOP_K_RESULTS,
 )
 
@@ -21,6 +28,15 @@ from ..utils.config import (
 INGEST_MANIFEST = os.path.join(CHROMA_DB_PATH, "ingested_files.txt")
 DEFAULT_TEXTS_BATCH = 2000  # размер партии текстов для эмбеддинга (увеличено)
 DEFAULT_FILES_BATCH = 50  # количество JSON файлов на партию (увеличено)
+QUERY_EMBEDDING_CACHE_SIZE = 1024  # эмбеддингов запросов в LRU-кэше
+RESULT_CACHE_SIZE = 4096  # результатов поиска в LRU-кэше
+RESULT_CACHE_TTL = 300.0  # время жизни результата поиска, сек
+# Новые коллекции хранят нормированные векторы и сравнивают их скалярным
+# произведением; старые (пространство l2) работают с ненормированными как прежде
+COLLECTION_METADATA = {
+    "description": "Коллекция юридических документов для RAG системы",
+    "hnsw:space": "ip",
+}
 
 # Задействуем все доступные ядра BLAS/МКL (если не выставлено снаружи)
 os.environ.setdefault("OMP_NUM_THREADS", str(max(1, os.cpu_count() or 8)))
@@ -41,22 +57,43 @@ if _HAS_TORCH and hasattr(torch, "cuda") and torch.cuda.is_available():
 class VectorDatabase:
     """Класс для работы с векторной базой данных"""
 
+    # Фрагменты результатов поиска для ответа API
+    format_snippets = staticmethod(format_snippets)
+
     def __init__(self, db_path: str = CHROMA_DB_PATH):
         self.db_path = db_path
         self.embedding_model = None
         self.client = None
         self.collection = None
+        self.normalize_embeddings = False
         self._ingested: set[str] = set()
+        # LRU-кэш «текст запроса -> эмбеддинг»: повторный запрос не вызывает модель
+        self._query_embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        self.query_cache_hits = 0
+        self.query_cache_misses = 0
+        # Кэш результатов поиска «(запрос, n_results, фильтр) -> (время, список)»;
+        # сбрасывается при любом изменении коллекции
+        self._result_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._result_cache_lock = threading.Lock()
+        self.result_cache_hits = 0
+        self.result_cache_misses = 0
+        self.embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_MODEL)
         self.setup_logging()
         self.initialize_database()
         self._load_ingest_manifest()
         self.load_embedding_model()
 
     def setup_logging(self):
-        logger.add("./logs/vector_database.log", rotation="1 MB", level="INFO")
+        setup_file_logging("./logs/vector_database.log")
 
     def initialize_database(self):
         try:
+            # chromadb импортируется здесь: без него модуль импортируется,
+            # а сервер переходит на упрощенную базу
+            import chromadb
+            from chromadb.config import Settings
+
             os.makedirs(self.db_path, exist_ok=True)
             self.client = chromadb.PersistentClient(
                 path=self.db_path,
@@ -72,15 +109,29 @@ class VectorDatabase:
             except Exception:
                 self.collection = self.client.create_collection(
                     name=VECTOR_COLLECTION_NAME,
-                    metadata={
-                        "description": "Коллекция юридических документов для RAG системы"
-                    },
+                    metadata=COLLECTION_METADATA,
                 )
                 logger.info(f"Создана новая коллекция: {VECTOR_COLLECTION_NAME}")
+            self._configure_space()
         except Exception as e:
             logger.error(f"Ошибка при инициализации базы данных: {e}")
             raise
 
+    def _configure_space(self):
+        """Нормировать ли эмбеддинги — по метрике текущей коллекции"""
+        space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        self.normalize_embeddings = space in ("ip", "cosine")
+        self._query_embeddings.clear()
+        self.clear_result_cache()
+
+    def clear_result_cache(self):
+        """
+        Сбрасывает кэш результатов поиска: вызывается после изменения
+        коллекции, а также перед замерами скорости поиска
+        """
+        with self._result_cache_lock:
+            self._result_cache.clear()
+
     def _load_ingest_manifest(self):
         try:
             if os.path.exists(INGEST_MANIFEST):
@@ -99,15 +150,52 @@ class VectorDatabase:
         except Exception as e:
             logger.warning(f"Не удалось обновить манифест {filename}: {e}")
 
+    @property
+    def ingested_files(self) -> set:
+        """Имена JSON файлов, уже загруженных в коллекцию (по манифесту; только для чтения)"""
+        return self._ingested
+
+    def mark_ingested(self, filename: str):
+        """Отмечает JSON файл в манифесте как загруженный"""
+        self._append_ingested(filename)
+
+    def forget_ingested(self, filenames: List[str]):
+        """Убирает файлы из манифеста, чтобы они были загружены заново"""
+        remaining = self._ingested.difference(filenames)
+        if len(remaining) == len(self._ingested):
+            return
+        try:
+            with open(INGEST_MANIFEST, "w", encoding="utf-8") as f:
+                f.writelines(name + "\n" for name in sorted(remaining))
+            self._ingested = remaining
+        except Exception as e:
+            logger.warning(f"Не удалось обновить манифест: {e}")
+
     def load_embedding_model(self):
         try:
+            from sentence_transformers import SentenceTransformer
+
             logger.info(
-                f"Загружаю модель эмбеддингов: {EMBEDDING_MODEL} (device={device_str})"
-            )
-            # sentence-transformers поддерживает параметр device
-            self.embedding_model = SentenceTransformer(
-                EMBEDDING_MODEL, device=device_str
+                f"Загружаю модель эмбеддингов: {EMBEDDING_MODEL} "
+                f"(device={device_str}, backend={EMBEDDING_BACKEND})"
             )
+            self.embedding_model = None
+            if EMBEDDING_BACKEND != "torch":
+                # ONNX Runtime: модель экспортируется при первой загрузке;
+                # без optimum или со старым sentence-transformers — PyTorch
+                try:
+                    self.embedding_model = SentenceTransformer(
+                        EMBEDDING_MODEL, device=device_str, backend=EMBEDDING_BACKEND
+                    )
+                except Exception as e:
+                    logger.warning(
+                        f"Бэкенд {EMBEDDING_BACKEND} недоступен ({e}), использую PyTorch"
+                    )
+            if self.embedding_model is None:
+                # sentence-transformers поддерживает параметр device
+                self.embedding_model = SentenceTransformer(
+                    EMBEDDING_MODEL, device=device_str
+                )
             logger.info("Модель эмбеддингов загружена успешно")
         except Exception as e:
             logger.error(f"Ошибка при загрузке модели эмбеддингов: {e}")
@@ -125,6 +213,59 @@ class VectorDatabase:
         )
         return embeddings.tolist()
 
+    def _normalize(self, vectors: List[List[float]]) -> List[List[float]]:
+        """Приводит векторы к единичной длине, если этого требует коллекция"""
+        if not self.normalize_embeddings or not vectors:
+            return vectors
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return (matrix / np.maximum(norms, 1e-12)).tolist()
+
+    def _encode_cached(self, texts: List[str]) -> List[List[float]]:
+        """
+        Эмбеддинги фрагментов через персистентный кэш: модель кодирует
+        только тексты, которых нет в кэше
+        """
+        keys = [self.embedding_cache.key(text) for text in texts]
+        found = self.embedding_cache.get_many(keys)
+        # Повторяющиеся тексты кодируются один раз
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        if missing:
+            encoded = self._encode_batch(list(missing.values()))
+            new_items = list(zip(missing, encoded))
+            self.embedding_cache.put_many(new_items)
+            found.update(new_items)
+        if found.keys() - missing.keys():
+            hits = sum(key not in missing for key in keys)
+            logger.info(f"Эмбеддинги из кэша: {hits}/{len(texts)}")
+        return self._normalize([found[key] for key in keys])
+
+    def embed_query(self, text: str) -> List[float]:
+        """Эмбеддинг одного запроса (из кэша, если запрос уже встречался)"""
+        return self._embed_queries([text])[0]
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Эмбеддинги запросов через LRU-кэш: отсутствующие в кэше считаются
+        одним вызовом модели. Возвращаемые списки общие с кэшем и не изменяются
+        """
+        cache = self._query_embeddings
+        with self._query_cache_lock:
+            found = {q: cache[q] for q in queries if q in cache}
+        missing = [q for q in dict.fromkeys(queries) if q not in found]
+        if missing:
+            found.update(zip(missing, self._normalize(self._encode_batch(missing))))
+
+        with self._query_cache_lock:
+            for query in dict.fromkeys(queries):
+                cache[query] = found[query]
+                cache.move_to_end(query)
+            while len(cache) > QUERY_EMBEDDING_CACHE_SIZE:
+                cache.popitem(last=False)
+            self.query_cache_misses += len(missing)
+            self.query_cache_hits += len(queries) - len(missing)
+        return [found[q] for q in queries]
+
     def add_documents(self, documents: List[Dict[str, Any]]):
         """Добавляет документы в коллекцию батчами."""
         if not documents:
@@ -134,71 +275,44 @@ class VectorDatabase:
         metadatas: List[Dict[str, Any]] = []
         ids: List[str] = []
         for doc in documents:
+            # Общие для всех фрагментов документа поля извлекаются один раз
+            meta = doc.get("metadata", {})
+            source_file = doc.get("source_file", "unknown")
+            doc_meta = {
+                "source_file": source_file,
+                "case_number": meta.get("case_number", ""),
+                "court": meta.get("court", ""),
+                "document_type": meta.get("document_type", ""),
+                "legal_area": meta.get("legal_area", ""),
+                "dispute_type": meta.get("dispute_type", ""),
+                "consumer_protection": meta.get("consumer_protection", False),
+                "contract_dispute": meta.get("contract_dispute", False),
+                "administrative": meta.get("administrative", False),
+                "criminal": meta.get("criminal", False),
+            }
             if "chunks" in doc:
                 for chunk in doc["chunks"]:
                     texts.append(chunk["text"])
                     metadatas.append(
                         {
-                            "source_file": doc.get("source_file", "unknown"),
-                            "case_number": doc.get("metadata", {}).get(
-                                "case_number", ""
-                            ),
-                            "court": doc.get("metadata", {}).get("court", ""),
-                            "document_type": doc.get("metadata", {}).get(
-                                "document_type", ""
-                            ),
+                            **doc_meta,
                             "chunk_id": chunk["id"],
                             "chunk_type": chunk.get("type", "legal_text"),
-                            "legal_area": doc.get("metadata", {}).get("legal_area", ""),
-                            "dispute_type": doc.get("metadata", {}).get(
-                                "dispute_type", ""
-                            ),
-                            "consumer_protection": doc.get("metadata", {}).get(
-                                "consumer_protection", False
-                            ),
-                            "contract_dispute": doc.get("metadata", {}).get(
-                                "contract_dispute", False
-                            ),
-                            "administrative": doc.get("metadata", {}).get(
-                                "administrative", False
-                            ),
-                            "criminal": doc.get("metadata", {}).get("criminal", False),
                         }
                     )
-                    ids.append(f"{doc.get('source_file', 'unknown')}_{chunk['id']}")
+                    ids.append(f"{source_file}_{chunk['id']}")
             if "legal_positions" in doc:
                 for j, position in enumerate(doc["legal_positions"]):
                     texts.append(position["text"])
                     metadatas.append(
                         {
-                            "source_file": doc.get("source_file", "unknown"),
-                            "case_number": doc.get("metadata", {}).get(
-                                "case_number", ""
-                            ),
-                            "court": doc.get("metadata", {}).get("court", ""),
-                            "document_type": doc.get("metadata", {}).get(
-                                "document_type", ""
-                            ),
+                            **doc_meta,
                             "chunk_id": f"position_{j}",
                             "chunk_type": "legal_position",
                             "articles": ", ".join(position.get("articles", [])),
-                            "legal_area": doc.get("metadata", {}).get("legal_area", ""),
-                            "dispute_type": doc.get("metadata", {}).get(
-                                "dispute_type", ""
-                            ),
-                            "consumer_protection": doc.get("metadata", {}).get(
-                                "consumer_protection", False
-                            ),
-                            "contract_dispute": doc.get("metadata", {}).get(
-                                "contract_dispute", False
-                            ),
-                            "administrative": doc.get("metadata", {}).get(
-                                "administrative", False
-                            ),
-                            "criminal": doc.get("metadata", {}).get("criminal", False),
                         }
                     )
-                    ids.append(f"{doc.get('source_file', 'unknown')}_position_{j}")
+                    ids.append(f"{source_file}_position_{j}")
         if not texts:
             logger.warning("Нет текстов для векторизации")
             return
@@ -208,7 +322,7 @@ class VectorDatabase:
             batch_texts = texts[start:end]
             batch_metadatas = metadatas[start:end]
             batch_ids = ids[start:end]
-            embeddings = self._encode_batch(batch_texts)
+            embeddings = self._encode_cached(batch_texts)
             self.collection.add(
                 embeddings=embeddings,
                 documents=batch_texts,
@@ -218,6 +332,7 @@ class VectorDatabase:
             added += len(batch_texts)
             if added % 5000 == 0:
                 logger.info(f"В коллекцию добавлено {added}/{len(texts)} фрагментов")
+        self.clear_result_cache()
         logger.info(f"Добавлено {len(texts)} документов в векторную базу")
 
     def search_similar(
@@ -226,6 +341,7 @@ class VectorDatabase:
         n_results: int = TOP_K_RESULTS,
         filter_metadata: Optional[Dict] = None,
         dispute_type: Optional[str] = None,
+        query_embedding: Optional[List[float]] = None,
     ) -> List[Dict[str, Any]]:
         """
         Ищет похожие документы по запросу с возможностью фильтрации по типу спора
@@ -235,59 +351,144 @@ class VectorDatabase:
                 n_results: Количество результатов
                 filter_metadata: Дополнительные фильтры метаданных
                 dispute_type: Тип спора для фильтрации (consumer_protection, contract_dispute, etc.)
+                query_embedding: Уже посчитанный эмбеддинг запроса (если есть)
 
         Returns:
                 Список похожих документов с метаданными
         """
+        return self.search_similar_batch(
+            [query],
+            n_results,
+            filter_metadata,
+            dispute_type,
+            None if query_embedding is None else [query_embedding],
+        )[0]
+
+    def search_similar_batch(
+        self,
+        queries: List[str],
+        n_results: int = TOP_K_RESULTS,
+        filter_metadata: Optional[Dict] = None,
+        dispute_type: Optional[str] = None,
+        query_embeddings: Optional[List[List[float]]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Ищет похожие документы сразу для нескольких запросов: эмбеддинги
+        считаются одним вызовом модели (если не переданы в query_embeddings),
+        поиск — одним запросом к коллекции. Недавние результаты для того же
+        запроса, n_results и фильтра берутся из кэша
+
+        Returns:
+                Списки похожих документов в порядке запросов
+        """
         try:
             # Формируем фильтр метаданных
-            where_filter = filter_metadata or {}
+            where_filter = dict(filter_metadata or {})
 
             # Добавляем фильтр по типу спора если указан
-            if dispute_type:
-                if dispute_type == "consumer_protection":
-                    where_filter["consumer_protection"] = True
-                elif dispute_type == "contract_dispute":
-                    where_filter["contract_dispute"] = True
-                elif dispute_type == "administrative":
-                    where_filter["administrative"] = True
-                elif dispute_type == "criminal":
-                    where_filter["criminal"] = True
-
-            query_embedding = self._encode_batch([query])[0]
-
-            # Если есть фильтры, используем их
-            if where_filter:
-                results = self.collection.query(
-                    query_embeddings=[query_embedding],
-                    n_results=n_results,
-                    where=where_filter,
-                )
-            else:
-                results = self.collection.query(
-                    query_embeddings=[query_embedding], n_results=n_results
-                )
+            if dispute_type in (
+                "consumer_protection",
+                "contract_dispute",
+                "administrative",
+                "criminal",
+            ):
+                where_filter[dispute_type] = True
+
+            filter_key = repr(sorted(where_filter.items()))
+            keys = [(query, n_results, filter_key) for query in queries]
+            found: Dict[tuple, List[Dict[str, Any]]] = {}
+            deadline = time.monotonic() - RESULT_CACHE_TTL
+            with self._result_cache_lock:
+                for key in keys:
+                    entry = self._result_cache.get(key)
+                    if entry is not None and entry[0] >= deadline:
+                        self._result_cache.move_to_end(key)
+                        found[key] = entry[1]
+
+            # Отсутствующие в кэше запросы (без повторов) ищутся одним вызовом
+            missing: Dict[tuple, int] = {}
+            for q, key in enumerate(keys):
+                if key not in found:
+                    missing.setdefault(key, q)
+            if missing:
+                miss_queries = [queries[q] for q in missing.values()]
+                if query_embeddings is None:
+                    miss_embeddings = self._embed_queries(miss_queries)
+                else:
+                    miss_embeddings = [query_embeddings[q] for q in missing.values()]
+
+                # Если есть фильтры, используем их
+                if where_filter:
+                    results = self.collection.query(
+                        query_embeddings=miss_embeddings,
+                        n_results=n_results,
+                        where=where_filter,
+                    )
+                else:
+                    results = self.collection.query(
+                        query_embeddings=miss_embeddings, n_results=n_results
+                    )
 
-            similar_docs: List[Dict[str, Any]] = []
-            for i in range(len(results["documents"][0])):
-                similar_docs.append(
-                    {
-                        "text": results["documents"][0][i],
-                        "metadata": results["metadatas"][0][i],
-                        "distance": results["distances"][0][i],
-                        "id": results["ids"][0][i],
-                    }
-                )
+                now = time.monotonic()
+                with self._result_cache_lock:
+                    for q, key in enumerate(missing):
+                        similar_docs: List[Dict[str, Any]] = []
+                        for i in range(len(results["documents"][q])):
+                            similar_docs.append(
+                                {
+                                    "text": results["documents"][q][i],
+                                    "metadata": results["metadatas"][q][i],
+                                    "distance": results["distances"][q][i],
+                                    "id": results["ids"][q][i],
+                                }
+                            )
+                        found[key] = similar_docs
+                        self._result_cache[key] = (now, similar_docs)
+                        self._result_cache.move_to_end(key)
+                    while len(self._result_cache) > RESULT_CACHE_SIZE:
+                        self._result_cache.popitem(last=False)
 
-            logger.info(
-                f"Найдено {len(similar_docs)} похожих документов (фильтр: {dispute_type or 'нет'})"
-            )
-            return similar_docs
+                logger.info(
+                    f"Найдено {sum(len(found[key]) for key in missing)} похожих документов "
+                    f"для {len(missing)} запросов (фильтр: {dispute_type or 'нет'})"
+                )
+            with self._result_cache_lock:
+                self.result_cache_misses += len(missing)
+                self.result_cache_hits += len(queries) - len(missing)
+            # Копии списков: кэшированные результаты не меняются вызывающим кодом
+            return [list(found[key]) for key in keys]
 
         except Exception as e:
             logger.error(f"Ошибка при поиске: {e}")
             raise
 
+    def delete_source_files(self, source_files: List[str]):
+        """Удаляет из коллекции все фрагменты указанных исходных PDF"""
+        if not source_files:
+            return
+        self.collection.delete(where={"source_file": {"$in": list(source_files)}})
+        self.clear_result_cache()
+        logger.info(f"Удалены фрагменты {len(source_files)} исходных файлов")
+
+    def invalidate_json_files(self, json_dir: str, json_files: List[str]):
+        """
+        Готовит переобработанные JSON к повторной загрузке: удаляет из коллекции
+        их старые фрагменты и убирает файлы из манифеста, после чего
+        load_from_json_files загрузит их заново (остальные файлы не трогаются)
+        """
+        stale = [f for f in json_files if f in self._ingested]
+        if not stale:
+            return
+        source_files = []
+        for json_file in stale:
+            try:
+                data = read_json(os.path.join(json_dir, json_file))
+                source_files.append(data.get("source_file", "unknown"))
+            except Exception as e:
+                logger.warning(f"Не удалось прочитать {json_file}: {e}")
+        self.delete_source_files(source_files)
+        self.forget_ingested(stale)
+
     def get_collection_info(self) -> Dict[str, Any]:
         try:
             count = self.collection.count()
@@ -295,6 +496,8 @@ class VectorDatabase:
                 "name": VECTOR_COLLECTION_NAME,
                 "document_count": count,
                 "db_path": self.db_path,
+                "result_cache_hits": self.result_cache_hits,
+                "result_cache_misses": self.result_cache_misses,
             }
         except Exception as e:
             logger.error(f"Ошибка при получении информации о коллекции: {e}")
@@ -305,15 +508,25 @@ class VectorDatabase:
             self.client.delete_collection(name=VECTOR_COLLECTION_NAME)
             self.collection = self.client.create_collection(
                 name=VECTOR_COLLECTION_NAME,
-                metadata={
-                    "description": "Коллекция юридических документов для RAG системы"
-                },
+                metadata=COLLECTION_METADATA,
             )
+            self._configure_space()
             logger.info("Коллекция очищена")
         except Exception as e:
             logger.error(f"Ошибка при очистке коллекции: {e}")
             raise
 
+    @staticmethod
+    def _read_json_batch(json_dir: str, json_files: List[str]) -> List[tuple]:
+        """Читает партию JSON файлов: (имя, данные, ошибка) для каждого"""
+        batch = []
+        for json_file in json_files:
+            try:
+                batch.append((json_file, read_json(os.path.join(json_dir, json_file)), None))
+            except Exception as e:
+                batch.append((json_file, None, e))
+        return batch
+
     def load_from_json_files(
         self, json_dir: str, files_batch: int = DEFAULT_FILES_BATCH
     ):
@@ -343,42 +556,50 @@ class VectorDatabase:
                 "total": 0,
             }
         logger.info(f"К загрузке JSON файлов: всего {len(json_files)}")
-        batch_docs: List[Dict[str, Any]] = []
-        batch_json_names: List[str] = []
+        pending = [f for f in json_files if f not in self._ingested]
+        skipped = len(json_files) - len(pending)
+        batches = [
+            pending[start : start + files_batch]
+            for start in range(0, len(pending), files_batch)
+        ]
         loaded_files = 0
         errors = 0
-        skipped = 0
         new_files: List[str] = []
-        for idx, json_file in enumerate(json_files, 1):
-            if json_file in self._ingested:
-                skipped += 1
-                continue
-            json_path = os.path.join(json_dir, json_file)
-            try:
-                with open(json_path, "r", encoding="utf-8") as f:
-                    doc_data = json.load(f)
-                batch_docs.append(doc_data)
-                batch_json_names.append(json_file)
-                new_files.append(json_file)
-                loaded_files += 1
-                if loaded_files % files_batch == 0:
-                    logger.info(
-                        f"Добавление партии: файлов {files_batch}, прогресс файлов {idx}/{len(json_files)}"
-                    )
+        done = skipped
+        # Следующая партия JSON читается в фоновом потоке, пока текущая
+        # кодируется моделью (encode отпускает GIL)
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            future = reader.submit(self._read_json_batch, json_dir, batches[0]) if batches else None
+            for i, names in enumerate(batches):
+                batch = future.result()
+                if i + 1 < len(batches):
+                    future = reader.submit(self._read_json_batch, json_dir, batches[i + 1])
+                done += len(names)
+                batch_docs: List[Dict[str, Any]] = []
+                batch_json_names: List[str] = []
+                for json_file, doc_data, error in batch:
+                    if error is not None:
+                        errors += 1
+                        logger.error(f"Ошибка при загрузке {json_file}: {error}")
+                        continue
+                    batch_docs.append(doc_data)
+                    batch_json_names.append(json_file)
+                if not batch_docs:
+                    continue
+                logger.info(
+                    f"Добавление партии: файлов {len(batch_docs)}, прогресс файлов {done}/{len(json_files)}"
+                )
+                try:
                     self.add_documents(batch_docs)
-                    # фиксируем именно имена json-файлов в манифесте, чтобы skip работал корректно
-                    for name in batch_json_names:
-                        self._append_ingested(name)
-                    batch_docs = []
-                    batch_json_names = []
-            except Exception as e:
-                errors += 1
-                logger.error(f"Ошибка при загрузке {json_file}: {e}")
-        if batch_docs:
-            logger.info(f"Добавление финальной партии: файлов {len(batch_docs)}")
-            self.add_documents(batch_docs)
-            for name in batch_json_names:
-                self._append_ingested(name)
+                except Exception as e:
+                    errors += len(batch_docs)
+                    logger.error(f"Ошибка при добавлении партии: {e}")
+                    continue
+                # фиксируем именно имена json-файлов в манифесте, чтобы skip работал корректно
+                for name in batch_json_names:
+                    self._append_ingested(name)
+                new_files.extend(batch_json_names)
+                loaded_files += len(batch_json_names)
         logger.info(
             f"Сводка загрузки: новых файлов {loaded_files}, пропущено {skipped}, ошибок {errors}, всего {len(json_files)}"
         )
@@ -2,6 +2,14 @@
 Модули интеграции с внешними API
 """
 
-from .gemini_integration import generate_legal_document
+from .gemini_integration import (
+    generate_legal_document,
+    generate_legal_document_async,
+    enable_semantic_cache,
+)
 
-__all__ = ["generate_legal_document"]
+__all__ = [
+    "generate_legal_document",
+    "generate_legal_document_async",
+    "enable_semantic_cache",
+]
@@ -5,50 +5,324 @@
 - generate_with_gemini: генерация через Gemini
 - generate_with_openai: резервная генерация через OpenAI
 - generate_legal_document: обертка с автоматическим фолбэком
+- generate_legal_document_async: асинхронная версия; с заданным HEDGE_DELAY
+  хеджирует запрос (OpenAI стартует, если Gemini не ответил за HEDGE_DELAY
+  секунд; побеждает первый годный ответ)
+- enable_semantic_cache: кэш ответов для близких по смыслу описаний дела
 """
 
-from typing import List, Dict, Any
+import asyncio
+import functools
+import itertools
+import weakref
+from typing import (
+    List,
+    Dict,
+    Any,
+    Callable,
+    Iterator,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 from loguru import logger
 from dotenv import load_dotenv
 
-import google.generativeai as genai
-import openai
+from ..utils.config import (
+    GEMINI_API_KEY,
+    OPENAI_API_KEY,
+    GEMINI_MODEL,
+    OPENAI_MODEL,
+    GENERATION_CACHE_THRESHOLD,
+    LLM_HEDGE_DELAY,
+)
+from ..utils.cache import content_hash
+from ..utils.semantic_cache import SemanticCache
 
-from ..utils.config import GEMINI_API_KEY, OPENAI_API_KEY, GEMINI_MODEL, OPENAI_MODEL
+try:
+    import ahocorasick
+
+    _HAS_AHOCORASICK = True
+except Exception:
+    _HAS_AHOCORASICK = False
+
+try:
+    import tiktoken
+
+    _HAS_TIKTOKEN = True
+except Exception:
+    _HAS_TIKTOKEN = False
 
 load_dotenv()
 
-# Configure clients
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-else:
+if not GEMINI_API_KEY:
     logger.warning("GEMINI_API_KEY is empty. Gemini calls will fail.")
 
-if OPENAI_API_KEY:
-    openai.api_key = OPENAI_API_KEY
-else:
+if not OPENAI_API_KEY:
     logger.warning("OPENAI_API_KEY is empty. OpenAI fallback will fail.")
 
 
+# Ответ короче этого считается неудачным и запускает фолбэк
+MIN_DOCUMENT_LENGTH = 50
+# Через сколько секунд без ответа Gemini параллельно запрашивается OpenAI;
+# None — без хеджирования, OpenAI только после ошибки Gemini
+HEDGE_DELAY: Optional[float] = LLM_HEDGE_DELAY
+
+
+# Ключевые слова описания дела: "consumer_priority" — отбирать документы
+# о защите прав потребителей, "consumer_protection" — потребительский спор
+_CASE_KEYWORDS = {
+    "consumer_priority": ("потребитель", "товар"),
+    "consumer_protection": (
+        "потребитель",
+        "товар",
+        "продавец",
+        "недостаток",
+        "качество",
+    ),
+}
+
+
+def _build_case_automaton():
+    """Автомат Aho-Corasick: ключевое слово -> множество категорий"""
+    word_categories: Dict[str, set] = {}
+    for category, keywords in _CASE_KEYWORDS.items():
+        for keyword in keywords:
+            word_categories.setdefault(keyword, set()).add(category)
+
+    automaton = ahocorasick.Automaton()
+    for keyword, categories in word_categories.items():
+        automaton.add_word(keyword, frozenset(categories))
+    automaton.make_automaton()
+    return automaton
+
+
+_CASE_AUTOMATON = _build_case_automaton() if _HAS_AHOCORASICK else None
+
+
+def _case_categories(case_lower: str) -> set:
+    """
+    Категории из _CASE_KEYWORDS, найденные в описании дела
+    (один проход с pyahocorasick)
+    """
+    if _CASE_AUTOMATON is None:
+        return {
+            category
+            for category, keywords in _CASE_KEYWORDS.items()
+            if any(keyword in case_lower for keyword in keywords)
+        }
+
+    found = set()
+    for _, categories in _CASE_AUTOMATON.iter(case_lower):
+        found |= categories
+        if len(found) == len(_CASE_KEYWORDS):
+            break
+    return found
+
+
+# SDK тяжелые (grpc, protobuf, httpx): импортируются и настраиваются
+# при первом запросе, а не при импорте модуля
+@functools.lru_cache(maxsize=1)
+def _get_genai():
+    """Модуль google.generativeai, настроенный ключом GEMINI_API_KEY"""
+    import google.generativeai as genai
+
+    if GEMINI_API_KEY:
+        genai.configure(api_key=GEMINI_API_KEY)
+    return genai
+
+
+@functools.lru_cache(maxsize=1)
+def _get_openai():
+    """Модуль openai, настроенный ключом OPENAI_API_KEY"""
+    import openai
+
+    if OPENAI_API_KEY:
+        openai.api_key = OPENAI_API_KEY
+    return openai
+
+
+# Семантический кэш результатов: отдельный на каждый тип документа
+_semantic_cache_embed_fn: Optional[Callable[[str], Sequence[float]]] = None
+_semantic_cache_params: Dict[str, float] = {}
+_semantic_caches: Dict[str, SemanticCache] = {}
+
+
+def enable_semantic_cache(
+    embed_fn: Callable[[str], Sequence[float]],
+    threshold: float = GENERATION_CACHE_THRESHOLD,
+    ttl: float = 3600.0,
+    max_entries: int = 1000,
+):
+    """
+    Включает семантический кэш generate_legal_document (по умолчанию выключен).
+    Описание дела, близкое к уже обработанному (косинусное сходство
+    эмбеддингов >= threshold), с теми же найденными документами получает
+    сохраненный документ без запроса к LLM
+
+    Args:
+        embed_fn: Функция эмбеддинга текста (например, модель векторной базы)
+        threshold: Порог косинусного сходства
+        ttl: Время жизни записи в секундах
+        max_entries: Максимальное число записей на тип документа
+    """
+    global _semantic_cache_embed_fn
+    _semantic_cache_embed_fn = embed_fn
+    _semantic_cache_params.update(threshold=threshold, ttl=ttl, max_entries=max_entries)
+    _semantic_caches.clear()
+
+
+def _get_semantic_cache(document_type: str) -> Optional[SemanticCache]:
+    """Кэш для типа документа или None, если кэш не включен"""
+    if _semantic_cache_embed_fn is None:
+        return None
+    cache = _semantic_caches.get(document_type)
+    if cache is None:
+        cache = SemanticCache(_semantic_cache_embed_fn, **_semantic_cache_params)
+        _semantic_caches[document_type] = cache
+    return cache
+
+
+def _docs_scope(similar_docs: List[Dict[str, Any]]) -> Tuple[str, ...]:
+    """
+    Идентификаторы документов, попадающих в промпт: кэшированный ответ
+    подходит, только если контекст генерации тот же
+    """
+    return tuple(
+        str(doc.get("id") or content_hash(doc.get("text", "")))
+        for doc in similar_docs[:8]
+    )
+
+
+# Бюджет фрагмента в промпте: в токенах при установленном tiktoken,
+# иначе в символах. Для русского текста 1 токен ~ 2-3 символа
+PROMPT_DOC_TOKENS = 512
+PROMPT_DOC_CHARS = 1200
+# Длиннее этого префикса фрагмент в PROMPT_DOC_TOKENS заведомо не уместится
+_TOKENIZE_PREFIX_CHARS = 4096
+
+
+@functools.lru_cache(maxsize=1)
+def _get_encoding():
+    """Токенизатор cl100k_base (загружается при первом использовании)"""
+    return tiktoken.get_encoding("cl100k_base")
+
+
+@functools.lru_cache(maxsize=4096)
+def _clip_to_tokens(text: str) -> str:
+    """Обрезает текст до PROMPT_DOC_TOKENS токенов, не разрывая символы UTF-8"""
+    encoding = _get_encoding()
+    tokens = encoding.encode(text)
+    if len(tokens) <= PROMPT_DOC_TOKENS:
+        return text
+    return encoding.decode_bytes(tokens[:PROMPT_DOC_TOKENS]).decode(
+        "utf-8", errors="ignore"
+    )
+
+
+def _clip_doc_text(text: str) -> str:
+    """Текст фрагмента в пределах бюджета промпта"""
+    if not _HAS_TIKTOKEN:
+        return text[:PROMPT_DOC_CHARS]
+    return _clip_to_tokens(text[:_TOKENIZE_PREFIX_CHARS])
+
+
+def _prompt_doc(doc: Dict[str, Any]) -> Tuple[str, str, str, str, str]:
+    """Поля найденного документа, которые используются в промпте"""
+    meta = doc.get("metadata", {})
+    return (
+        _clip_doc_text(doc.get("text", "")),
+        meta.get("dispute_type", ""),
+        meta.get("legal_area", ""),
+        meta.get("chunk_type", "legal_text"),
+        meta.get("source_file", "unknown"),
+    )
+
+
 def compose_prompt(
     case_description: str,
     similar_docs: List[Dict[str, Any]],
     document_type: str = "исковое заявление",
+    style: Literal["basic", "structured"] = "structured",
+) -> str:
+    """
+    Формирует специализированный промпт на основе образца Gemini 2.5 Pro
+
+    Args:
+        case_description: Фактические обстоятельства клиента
+        similar_docs: Найденные документы
+        document_type: Тип составляемого документа
+        style: "structured" — контекст по разделам (обстоятельства, позиции,
+            цитаты, выводы); "basic" — фрагменты подряд в порядке релевантности
+    """
+    if style not in ("basic", "structured"):
+        raise ValueError(f"Неизвестный стиль промпта: {style}")
+    # Берем топ-8 для качества; кортеж используемых полей служит ключом кэша
+    docs = tuple(_prompt_doc(doc) for doc in similar_docs[:8])
+    return _compose_prompt_cached(case_description, docs, document_type, style)
+
+
+_CONTEXT_SECTION_HEADERS = (
+    "ФАКТИЧЕСКИЕ ОБСТОЯТЕЛЬСТВА ИЗ СУДЕБНОЙ ПРАКТИКИ:\n",
+    "ПРАВОВЫЕ ПОЗИЦИИ ВЕРХОВНОГО СУДА РФ:\n",
+    "ЦИТАТЫ ИЗ ЗАКОНОВ И ПОСТАНОВЛЕНИЙ:\n",
+    "ВЫВОДЫ И РЕШЕНИЯ СУДОВ:\n",
+)
+
+
+def _basic_context(relevant_docs: Sequence[Tuple[str, str, str, str, str]]) -> str:
+    """Контекст из фрагментов подряд"""
+    return "\n\n".join(
+        f"Контекст {i} (из {source}):\n{doc_text}"
+        for i, (doc_text, _, _, _, source) in enumerate(relevant_docs, 1)
+    )
+
+
+def _structured_context(
+    relevant_docs: Sequence[Tuple[str, str, str, str, str]],
 ) -> str:
-    """Формирует специализированный промпт на основе образца Gemini 2.5 Pro"""
+    """Контекст, сгруппированный по типам фрагментов"""
+    # Разделы в порядке _CONTEXT_SECTION_HEADERS
+    sections = ([], [], [], [])
+
+    for i, (doc_text, _, _, chunk_type, source) in enumerate(relevant_docs, 1):
+        # Классифицируем по типу чанка
+        if chunk_type == "factual_circumstances":
+            sections[0].append(f"Контекст {i} (из {source}):\n{doc_text}")
+        elif chunk_type == "legal_position":
+            sections[1].append(f"Правовая позиция {i} (из {source}):\n{doc_text}")
+        elif "ст." in doc_text or "статья" in doc_text.lower():
+            sections[2].append(f"Цитата {i} (из {source}):\n{doc_text}")
+        else:
+            sections[3].append(f"Вывод {i} (из {source}):\n{doc_text}")
+
+    # Формируем структурированный контекст: непустые разделы с заголовками
+    return "\n\n".join(
+        header + "\n\n".join(entries)
+        for header, entries in zip(_CONTEXT_SECTION_HEADERS, sections)
+        if entries
+    )
+
+
+@functools.lru_cache(maxsize=1024)
+def _compose_prompt_cached(
+    case_description: str,
+    docs: Tuple[Tuple[str, str, str, str, str], ...],
+    document_type: str,
+    style: str,
+) -> str:
+    """Собирает промпт; повторный вызов с теми же документами берется из кэша"""
+    case_categories = _case_categories(case_description.lower())
 
     # Фильтруем и структурируем документы
     relevant_docs = []
-    for doc in similar_docs[:8]:  # Берем топ-8 для качества
-        meta = doc.get("metadata", {})
-        dispute_type = meta.get("dispute_type", "")
-        legal_area = meta.get("legal_area", "")
+    for doc in docs:
+        _, dispute_type, legal_area, _, _ = doc
 
         # Приоритет потребительским спорам
-        if (
-            "потребитель" in case_description.lower()
-            or "товар" in case_description.lower()
-        ):
+        if "consumer_priority" in case_categories:
             if (
                 dispute_type == "consumer_protection"
                 or "защита прав потребителей" in legal_area
@@ -58,72 +332,16 @@ def compose_prompt(
             relevant_docs.append(doc)
 
     if not relevant_docs:
-        relevant_docs = similar_docs[:5]
-
-    # Структурируем контекст по типам
-    context_sections = {
-        "factual_circumstances": [],
-        "legal_positions": [],
-        "citations": [],
-        "conclusions": [],
-    }
-
-    for i, doc in enumerate(relevant_docs, 1):
-        meta = doc.get("metadata", {})
-        chunk_type = meta.get("chunk_type", "legal_text")
-        source = meta.get("source_file", "unknown")
-
-        # Классифицируем по типу чанка
-        doc_text = doc.get("text", "")[:1200]
-        if chunk_type == "factual_circumstances":
-            context_sections["factual_circumstances"].append(
-                f"Контекст {i} (из {source}):\n{doc_text}"
-            )
-        elif chunk_type == "legal_position":
-            context_sections["legal_positions"].append(
-                f"Правовая позиция {i} (из {source}):\n{doc_text}"
-            )
-        elif "ст." in doc_text or "статья" in doc_text.lower():
-            context_sections["citations"].append(
-                f"Цитата {i} (из {source}):\n{doc_text}"
-            )
-        else:
-            context_sections["conclusions"].append(
-                f"Вывод {i} (из {source}):\n{doc_text}"
-            )
-
-    # Формируем структурированный контекст
-    context_parts = []
-    if context_sections["factual_circumstances"]:
-        context_parts.append(
-            "ФАКТИЧЕСКИЕ ОБСТОЯТЕЛЬСТВА ИЗ СУДЕБНОЙ ПРАКТИКИ:\n"
-            + "\n\n".join(context_sections["factual_circumstances"])
-        )
-    if context_sections["legal_positions"]:
-        context_parts.append(
-            "ПРАВОВЫЕ ПОЗИЦИИ ВЕРХОВНОГО СУДА РФ:\n"
-            + "\n\n".join(context_sections["legal_positions"])
-        )
-    if context_sections["citations"]:
-        context_parts.append(
-            "ЦИТАТЫ ИЗ ЗАКОНОВ И ПОСТАНОВЛЕНИЙ:\n"
-            + "\n\n".join(context_sections["citations"])
-        )
-    if context_sections["conclusions"]:
-        context_parts.append(
-            "ВЫВОДЫ И РЕШЕНИЯ СУДОВ:\n" + "\n\n".join(context_sections["conclusions"])
-        )
+        relevant_docs = docs[:5]
 
-    context = (
-        "\n\n".join(context_parts) if context_parts else "Нет релевантного контекста"
-    )
+    if style == "basic":
+        context = _basic_context(relevant_docs)
+    else:
+        context = _structured_context(relevant_docs)
+    context = context or "Нет релевантного контекста"
 
     # Определяем тип спора
-    case_lower = case_description.lower()
-    if any(
-        keyword in case_lower
-        for keyword in ["потребитель", "товар", "продавец", "недостаток", "качество"]
-    ):
+    if "consumer_protection" in case_categories:
         dispute_category = "потребительский спор"
         legal_framework = "Закон РФ 'О защите прав потребителей'"
     else:
@@ -164,10 +382,14 @@ def compose_prompt(
     return prompt.strip()
 
 
-def generate_with_gemini(prompt: str) -> str:
-    """Генерация через Gemini."""
+def generate_with_gemini(
+    prompt: str, stream: bool = False
+) -> Union[str, Iterator[str]]:
+    """Генерация через Gemini. При stream=True возвращает итератор фрагментов текста."""
     logger.info("Запрос к Gemini...")
-    model = genai.GenerativeModel(GEMINI_MODEL)
+    model = _get_genai().GenerativeModel(GEMINI_MODEL)
+    if stream:
+        return _iter_gemini_stream(model.generate_content(prompt, stream=True))
     resp = model.generate_content(prompt)
     return getattr(resp, "text", "") or (
         resp.candidates[0].content.parts[0].text
@@ -176,43 +398,332 @@ def generate_with_gemini(prompt: str) -> str:
     )
 
 
-def generate_with_openai(prompt: str) -> str:
-    """Резервная генерация через OpenAI GPT-5."""
+async def generate_with_gemini_async(prompt: str) -> str:
+    """Асинхронная генерация через Gemini (отменяется вместе с задачей)"""
+    logger.info("Асинхронный запрос к Gemini...")
+    model = _get_genai().GenerativeModel(GEMINI_MODEL)
+    resp = await model.generate_content_async(prompt)
+    return getattr(resp, "text", "") or (
+        resp.candidates[0].content.parts[0].text
+        if getattr(resp, "candidates", None)
+        else ""
+    )
+
+
+def _iter_gemini_stream(response) -> Iterator[str]:
+    """Фрагменты текста из потокового ответа Gemini"""
+    for chunk in response:
+        text = getattr(chunk, "text", "")
+        if text:
+            yield text
+
+
+def _openai_messages(prompt: str) -> List[Dict[str, str]]:
+    """Сообщения chat-completions для генерации документа"""
+    return [
+        {
+            "role": "system",
+            "content": "Ты — опытный юрист-процессуалист. Пиши строго структурированные процессуальные документы.",
+        },
+        {"role": "user", "content": prompt},
+    ]
+
+
+def generate_with_openai(
+    prompt: str, stream: bool = False
+) -> Union[str, Iterator[str]]:
+    """
+    Резервная генерация через OpenAI GPT-5.
+    При stream=True возвращает итератор фрагментов.
+    """
     logger.info("Фолбэк в OpenAI GPT-5...")
     # Унифицированный chat-completions стиль
+    # Убираем temperature для GPT-5, так как он не поддерживает кастомные значения
+    openai = _get_openai()
+    if stream:
+        return _iter_openai_stream(
+            openai.chat.completions.create(
+                model=OPENAI_MODEL, messages=_openai_messages(prompt), stream=True
+            )
+        )
     completion = openai.chat.completions.create(
-        model=OPENAI_MODEL,
-        messages=[
-            {
-                "role": "system",
-                "content": "Ты — опытный юрист-процессуалист. Пиши строго структурированные процессуальные документы.",
-            },
-            {"role": "user", "content": prompt},
-        ],
-        # Убираем temperature для GPT-5, так как он не поддерживает кастомные значения
+        model=OPENAI_MODEL, messages=_openai_messages(prompt)
     )
     return completion.choices[0].message.content
 
 
+async def generate_with_openai_async(prompt: str) -> str:
+    """Асинхронная генерация через OpenAI GPT-5 (отменяется вместе с задачей)"""
+    logger.info("Асинхронный запрос к OpenAI GPT-5...")
+    completion = await _get_async_openai_client().chat.completions.create(
+        model=OPENAI_MODEL, messages=_openai_messages(prompt)
+    )
+    return completion.choices[0].message.content
+
+
+# Асинхронные клиенты OpenAI по event loop: пул соединений httpx привязан
+# к циклу, а внутри цикла переиспользуется между запросами (без нового TLS)
+_async_openai_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _get_async_openai_client():
+    """Общий openai.AsyncOpenAI для текущего event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_openai_clients.get(loop)
+    if client is None:
+        client = _get_openai().AsyncOpenAI(api_key=OPENAI_API_KEY or None)
+        _async_openai_clients[loop] = client
+    return client
+
+
+def _iter_openai_stream(completion) -> Iterator[str]:
+    """Фрагменты текста из потокового ответа OpenAI"""
+    for chunk in completion:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def _start_stream(generate: Callable[..., Iterator[str]], prompt: str) -> Iterator[str]:
+    """
+    Запускает потоковую генерацию и дожидается первого фрагмента,
+    чтобы ошибка провайдера возникла здесь, а не у потребителя итератора
+    """
+    chunks = generate(prompt, stream=True)
+    first = next(chunks, None)
+    if first is None:
+        raise RuntimeError("Пустой ответ")
+    return itertools.chain([first], chunks)
+
+
+def _cache_when_done(
+    chunks: Iterator[str],
+    provider: str,
+    cache: Optional[SemanticCache],
+    case_description: str,
+    vector,
+    scope: Tuple[str, ...],
+) -> Iterator[str]:
+    """Отдает фрагменты дальше и кладет полный документ в кэш после окончания потока"""
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    if cache is not None:
+        cache.set(
+            case_description,
+            {"provider": provider, "document": "".join(parts)},
+            vector,
+            scope,
+        )
+
+
+def _lookup_cache(
+    case_description: str,
+    similar_docs: List[Dict[str, Any]],
+    document_type: str,
+    use_cache: bool,
+) -> Tuple[Optional[SemanticCache], Any, Tuple[str, ...], Optional[Dict[str, Any]]]:
+    """
+    Ищет результат в семантическом кэше среди записей с теми же найденными
+    документами
+
+    Returns:
+        (кэш или None, эмбеддинг описания, область записи,
+        сохраненный результат или None)
+    """
+    cache = _get_semantic_cache(document_type) if use_cache else None
+    if cache is None:
+        return None, None, (), None
+    scope = _docs_scope(similar_docs)
+    try:
+        vector = cache.embed(case_description)
+        return cache, vector, scope, cache.get(case_description, vector, scope)
+    except Exception as e:
+        logger.warning(f"Семантический кэш недоступен: {e}")
+        return None, None, (), None
+
+
 def generate_legal_document(
     case_description: str,
     similar_docs: List[Dict[str, Any]],
     document_type: str = "исковое заявление",
+    use_cache: bool = True,
+    stream: bool = False,
+    hedge: bool = False,
 ) -> Dict[str, Any]:
     """Собирает промпт, вызывает Gemini, при ошибке — OpenAI.
     Возвращает словарь с результатом и источником ("gemini" или "openai").
+    Если включен семантический кэш (enable_semantic_cache), близкое по смыслу
+    описание дела с теми же найденными документами получает сохраненный
+    результат без запроса к LLM.
+    При stream=True "document" — итератор фрагментов текста по мере генерации.
+    При hedge=True (без stream) запрос выполняется через
+    generate_legal_document_async; внутри работающего event loop — последовательно.
     """
+    if hedge and not stream:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(
+                generate_legal_document_async(
+                    case_description, similar_docs, document_type, use_cache
+                )
+            )
+        logger.warning(
+            "hedge=True внутри event loop: используйте generate_legal_document_async"
+        )
+
+    cache, vector, scope, cached = _lookup_cache(
+        case_description, similar_docs, document_type, use_cache
+    )
+    if cached is not None:
+        result = dict(cached)
+        if stream:
+            result["document"] = iter([result["document"]])
+        return result
+
     prompt = compose_prompt(case_description, similar_docs, document_type)
+
+    if stream:
+        try:
+            provider = "gemini"
+            chunks = _start_stream(generate_with_gemini, prompt)
+        except Exception as e:
+            logger.error(f"Gemini ошибка: {e}. Перехожу на OpenAI.")
+            try:
+                provider = "openai"
+                chunks = _start_stream(generate_with_openai, prompt)
+            except Exception as e2:
+                logger.error(f"OpenAI ошибка: {e2}")
+                raise
+        return {
+            "provider": provider,
+            "document": _cache_when_done(
+                chunks, provider, cache, case_description, vector, scope
+            ),
+        }
+
     try:
         text = generate_with_gemini(prompt)
-        if not text or len(text.strip()) < 50:
+        if not text or len(text.strip()) < MIN_DOCUMENT_LENGTH:
             raise RuntimeError("Пустой или слишком короткий ответ Gemini")
-        return {"provider": "gemini", "document": text}
+        result = {"provider": "gemini", "document": text}
     except Exception as e:
         logger.error(f"Gemini ошибка: {e}. Перехожу на OpenAI.")
         try:
             text = generate_with_openai(prompt)
-            return {"provider": "openai", "document": text}
+            result = {"provider": "openai", "document": text}
         except Exception as e2:
             logger.error(f"OpenAI ошибка: {e2}")
             raise
+
+    if cache is not None:
+        cache.set(case_description, result, vector, scope)
+    return result
+
+
+# Выполняющиеся запросы: (event loop, промпт, задержка хеджа) -> задача
+_inflight: Dict[Tuple[Any, str, Optional[float]], "asyncio.Future[Dict[str, Any]]"] = {}
+
+
+async def _hedged_openai(
+    prompt: str, delay: Optional[float], wake: asyncio.Event
+) -> str:
+    """
+    Запрос к OpenAI через delay секунд или сразу после ошибки Gemini;
+    при delay=None — только после ошибки
+    """
+    try:
+        await asyncio.wait_for(wake.wait(), timeout=delay)
+    except asyncio.TimeoutError:
+        logger.info(
+            f"Gemini не ответил за {delay:.1f} с, параллельно запрашиваю OpenAI"
+        )
+    return await generate_with_openai_async(prompt)
+
+
+async def generate_legal_document_async(
+    case_description: str,
+    similar_docs: List[Dict[str, Any]],
+    document_type: str = "исковое заявление",
+    use_cache: bool = True,
+    hedge_delay: Optional[float] = HEDGE_DELAY,
+) -> Dict[str, Any]:
+    """Асинхронная версия generate_legal_document с хеджированием запроса.
+    Gemini запрашивается сразу, OpenAI — через hedge_delay секунд (или сразу
+    после ошибки Gemini; при hedge_delay=None — только после ошибки, без
+    второго оплачиваемого запроса). Возвращается первый ответ не короче
+    MIN_DOCUMENT_LENGTH, незавершенный запрос отменяется. Короткий ответ
+    OpenAI принимается, только если Gemini тоже не справился.
+    Одновременные вызовы с одинаковым промптом разделяют один запрос к LLM.
+    """
+    cache, vector, scope, cached = _lookup_cache(
+        case_description, similar_docs, document_type, use_cache
+    )
+    if cached is not None:
+        return dict(cached)
+
+    prompt = compose_prompt(case_description, similar_docs, document_type)
+
+    # Одинаковые промпты, запрошенные одновременно, ждут один общий запрос
+    key = (asyncio.get_running_loop(), prompt, hedge_delay)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_generate_hedged(prompt, hedge_delay))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        logger.info("Такой же запрос уже выполняется, ожидаю его результат")
+    # shield: отмена одного ожидающего не отменяет запрос для остальных
+    result = dict(await asyncio.shield(task))
+
+    if cache is not None:
+        cache.set(case_description, result, vector, scope)
+    return result
+
+
+async def _generate_hedged(prompt: str, hedge_delay: Optional[float]) -> Dict[str, Any]:
+    """Гонка Gemini и отложенного OpenAI за первый годный ответ"""
+    gemini_failed = asyncio.Event()
+    providers = {
+        asyncio.create_task(generate_with_gemini_async(prompt)): "gemini",
+        asyncio.create_task(
+            _hedged_openai(prompt, hedge_delay, gemini_failed)
+        ): "openai",
+    }
+    pending = set(providers)
+    result = None
+    fallback = None
+    error: Optional[BaseException] = None
+    try:
+        while pending and result is None:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                provider = providers[task]
+                try:
+                    text = task.result()
+                except Exception as e:
+                    logger.error(f"{provider} ошибка: {e}")
+                    error = e
+                    gemini_failed.set()
+                    continue
+                if text and len(text.strip()) >= MIN_DOCUMENT_LENGTH:
+                    result = {"provider": provider, "document": text}
+                    break
+                logger.error(f"Пустой или слишком короткий ответ {provider}")
+                gemini_failed.set()
+                if provider == "openai":
+                    fallback = {"provider": provider, "document": text}
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if result is None:
+        if fallback is None:
+            raise error or RuntimeError("Пустой ответ LLM")
+        result = fallback
+
+    logger.info(f"Хеджированный запрос: ответ от {result['provider']}")
+    return result
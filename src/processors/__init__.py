@@ -2,8 +2,23 @@
 Модули обработки документов
 """
 
-from .data_processor import LegalDocumentProcessor
-from .gemini_chunker import GeminiChunker
-from .chatgpt_chunker import ChatGPTChunker
+import importlib
 
 __all__ = ["LegalDocumentProcessor", "GeminiChunker", "ChatGPTChunker"]
+
+# Классы импортируются при первом обращении (PEP 562), чтобы импорт пакета
+# не тянул за собой fitz, openai и google.generativeai
+_LAZY_EXPORTS = {
+    "LegalDocumentProcessor": ".data_processor",
+    "GeminiChunker": ".gemini_chunker",
+    "ChatGPTChunker": ".chatgpt_chunker",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        module = importlib.import_module(_LAZY_EXPORTS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
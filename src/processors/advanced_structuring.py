@@ -5,6 +5,7 @@
 
 from typing import Dict, Any
 import os
+import re
 import json
 from loguru import logger
 import google.generativeai as genai
@@ -80,15 +81,19 @@ def structure_court_decision_advanced(text: str) -> Dict[str, Any]:
     return data
 
 
+_JSON_PATTERNS = [
+    re.compile(r"```json\s*(.*?)\s*```", re.DOTALL),
+    re.compile(r"```\s*(.*?)\s*```", re.DOTALL),
+    re.compile(r"\{[\s\S]*\}", re.DOTALL),
+]
+
+
 def _extract_json(response_text: str) -> str:
     try:
-        import re
-
-        patterns = [r"```json\s*(.*?)\s*```", r"```\s*(.*?)\s*```", r"\{[\s\S]*\}"]
-        for p in patterns:
-            m = re.findall(p, response_text, re.DOTALL)
+        for pattern in _JSON_PATTERNS:
+            m = pattern.search(response_text)
             if m:
-                candidate = m[0].strip()
+                candidate = m.group(m.lastindex or 0).strip()
                 json.loads(candidate)
                 return candidate
 
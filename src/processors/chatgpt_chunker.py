@@ -3,19 +3,97 @@
 """
 
 import os
+import re
 import json
 import time
-from typing import List, Dict, Any, Optional
-import openai
+import random
+import asyncio
+from typing import List, Dict, Any, Optional, Tuple, Union
 from loguru import logger
+from ..utils.logging_setup import setup_file_logging
+from ..utils.cache import SQLiteCache, chunking_cache_key
 from ..utils.config import OPENAI_API_KEY
 
-# Настройка OpenAI
-if OPENAI_API_KEY:
-    client = openai.OpenAI(api_key=OPENAI_API_KEY)
-else:
-    client = None
-    logger.warning("OPENAI_API_KEY не установлен. ChatGPT чанкование недоступно.")
+# Клиент OpenAI создается при первом обращении: импорт openai заметно
+# замедляет старт процесса, а чанкование через ChatGPT нужно не всегда
+_client = None
+_client_configured = False
+
+
+def _configure_openai():
+    """Импортирует openai и создает клиент (один раз на процесс)"""
+    global _client, _client_configured
+    if not _client_configured:
+        _client_configured = True
+        if OPENAI_API_KEY:
+            import openai
+
+            _client = openai.OpenAI(api_key=OPENAI_API_KEY)
+        else:
+            logger.warning(
+                "OPENAI_API_KEY не установлен. ChatGPT чанкование недоступно."
+            )
+    return _client
+
+
+def _retryable_errors() -> tuple:
+    """Ошибки OpenAI, при которых запрос имеет смысл повторить (429 и 5xx)"""
+    import openai
+
+    return (
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+
+CHUNKING_MODEL = "gpt-4"
+# Инструкции вынесены в системное сообщение, документ идет отдельным
+# пользовательским сообщением
+SYSTEM_PROMPT = """Ты — эксперт по анализу юридических документов. Твоя задача — разбить судебное решение на семантически завершенные блоки.
+
+Проанализируй судебный документ из сообщения пользователя и разбей его на семантически завершенные блоки.
+
+ТРЕБОВАНИЯ:
+1. Каждый чанк должен содержать одну законченную правовую позицию или аргумент
+2. Сохраняй контекст - не разрывай связанные факты и выводы
+3. Выделяй отдельно:
+   - Фактические обстоятельства дела
+   - Правовые позиции суда
+   - Цитаты из законов и постановлений
+   - Выводы и решения
+4. Размер чанка: 200-800 слов (оптимально для векторного поиска)
+
+ФОРМАТ ОТВЕТА (строго JSON):
+{
+  "chunks": [
+    {
+      "id": "chunk_1",
+      "type": "factual_circumstances|legal_position|citation|conclusion",
+      "title": "Краткое название блока",
+      "text": "Полный текст чанка",
+      "key_articles": ["ст. 18 ЗоЗПП", "ст. 15 ГК РФ"],
+      "legal_concepts": ["недостаток товара", "права потребителя"]
+    }
+  ]
+}"""
+
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+# Документ длиннее этого числа символов отправляется частями (split_into_parts):
+# прежде текст обрезался до 80k символов, чтобы уложиться в контекст GPT-4
+MAX_REQUEST_CHARS = 80000
+
+# Параметры конкурентной обработки
+MAX_CONCURRENT_REQUESTS = 10
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+# Batch API выгоден для ночной массовой загрузки (дешевле в 2 раза)
+BATCH_API_MIN_DOCS = 1000
+BATCH_POLL_INTERVAL = 60
+BATCH_DIR = "./data/batches"
 
 
 class ChatGPTChunker:
@@ -23,37 +101,18 @@ class ChatGPTChunker:
 
     def __init__(self):
         self.setup_logging()
-        self.cache_file = "./data/chunking_cache.json"
-        self.cache = self.load_cache()
+        self.cache = SQLiteCache(
+            "./data/chunking_cache.sqlite",
+            legacy_json_path="./data/chunking_cache.json",
+        )
 
     def setup_logging(self):
         """Настройка логирования"""
-        logger.add("./logs/chatgpt_chunker.log", rotation="1 MB", level="INFO")
-
-    def load_cache(self) -> Dict[str, Any]:
-        """Загружает кэш результатов чанкования"""
-        try:
-            if os.path.exists(self.cache_file):
-                with open(self.cache_file, "r", encoding="utf-8") as f:
-                    return json.load(f)
-        except Exception as e:
-            logger.warning(f"Не удалось загрузить кэш: {e}")
-        return {}
-
-    def save_cache(self):
-        """Сохраняет кэш результатов чанкования"""
-        try:
-            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
-            with open(self.cache_file, "w", encoding="utf-8") as f:
-                json.dump(self.cache, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.warning(f"Не удалось сохранить кэш: {e}")
+        setup_file_logging("./logs/chatgpt_chunker.log")
 
-    def get_cache_key(self, text: str) -> str:
+    def get_cache_key(self, text: Union[str, bytes]) -> str:
         """Генерирует ключ кэша для текста"""
-        import hashlib
-
-        return hashlib.md5(text.encode("utf-8")).hexdigest()
+        return chunking_cache_key(text)
 
     def chunk_document(self, text: str, source_file: str) -> List[Dict[str, Any]]:
         """
@@ -68,41 +127,28 @@ class ChatGPTChunker:
         """
         # Проверяем кэш
         cache_key = self.get_cache_key(text)
-        if cache_key in self.cache:
+        cached = self.cache.get(cache_key)
+        if cached is not None:
             logger.info(f"Используем кэшированный результат для {source_file}")
-            return self.cache[cache_key]
+            return cached
 
+        client = _configure_openai()
         if not client:
             logger.error("OpenAI API ключ не установлен")
             return self.fallback_chunking(text, source_file)
 
         try:
             # Если документ слишком большой, разбиваем на части
-            max_tokens = 100000  # Ограничение для GPT-4
-            if len(text) > max_tokens:
-                return self.chunk_large_document(text, source_file)
-
-            prompt = self.create_chunking_prompt(text)
+            if len(text) > MAX_REQUEST_CHARS:
+                return self.chunk_large_document(text, source_file, cache_key)
 
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Ты — эксперт по анализу юридических документов. Твоя задача — разбить судебное решение на семантически завершенные блоки.",
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=0.1,
-                max_tokens=4000,
-            )
+            response = client.chat.completions.create(**self.build_request(text))
 
             result = response.choices[0].message.content
             chunks = self.parse_chunking_result(result, source_file)
 
             # Сохраняем в кэш
             self.cache[cache_key] = chunks
-            self.save_cache()
 
             logger.info(f"Обработано {len(chunks)} чанков для {source_file}")
             return chunks
@@ -111,56 +157,249 @@ class ChatGPTChunker:
             logger.error(f"Ошибка при чанковании через ChatGPT: {e}")
             return self.fallback_chunking(text, source_file)
 
-    def chunk_large_document(self, text: str, source_file: str) -> List[Dict[str, Any]]:
-        """Обрабатывает большие документы по частям"""
-        logger.info(f"Обрабатываем большой документ {source_file} по частям")
+    def build_request(self, text: str) -> Dict[str, Any]:
+        """Формирует параметры запроса к Chat Completions для текста"""
+        return {
+            "model": CHUNKING_MODEL,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": self.create_chunking_prompt(text)},
+            ],
+            "temperature": 0.1,
+            "max_tokens": 4000,
+        }
 
-        # Разбиваем на части по 50k символов с перекрытием
+    def split_into_parts(self, text: str, source_file: str) -> List[Tuple[str, str]]:
+        """Разбивает большой документ на части по 50k символов с перекрытием"""
         chunk_size = 50000
         overlap = 5000
-        all_chunks = []
 
-        for i in range(0, len(text), chunk_size - overlap):
-            part = text[i : i + chunk_size]
-            part_chunks = self.chunk_document(
-                part, f"{source_file}_part_{i // chunk_size}"
+        return [
+            (text[i : i + chunk_size], f"{source_file}_part_{n}")
+            for n, i in enumerate(range(0, len(text), chunk_size - overlap))
+        ]
+
+    def chunk_large_document(
+        self, text: str, source_file: str, cache_key: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Обрабатывает большие документы по частям.
+        Части не кэшируются по отдельности: результат всего документа
+        записывается в кэш один раз, если все части обработаны моделью
+        """
+        logger.info(f"Обрабатываем большой документ {source_file} по частям")
+
+        parts = self.split_into_parts(text, source_file)
+
+        # Части независимы, поэтому отправляем их конкурентно. Внутри уже
+        # запущенного event loop (например, в FastAPI) обрабатываем последовательно
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            responses = asyncio.run(
+                self._run_concurrent(parts, MAX_CONCURRENT_REQUESTS)
             )
-            all_chunks.extend(part_chunks)
+        else:
+            responses = [self._chunk_slice_no_cache(part, name) for part, name in parts]
+
+        all_chunks = []
+        complete = True
+        for (part, part_name), result in zip(parts, responses):
+            if result is None:
+                complete = False
+                all_chunks.extend(self.fallback_chunking(part, part_name))
+            else:
+                all_chunks.extend(self.parse_chunking_result(result, part_name))
+
+        if complete:
+            self.cache[cache_key or self.get_cache_key(text)] = all_chunks
 
         return all_chunks
 
-    def create_chunking_prompt(self, text: str) -> str:
-        """Создает промпт для чанкования"""
-        return f"""
-Проанализируй следующий судебный документ и разбей его на семантически завершенные блоки.
+    def _chunk_slice_no_cache(self, text: str, source_file: str) -> Optional[str]:
+        """Запрашивает чанкование одной части без обращения к кэшу"""
+        try:
+            response = _configure_openai().chat.completions.create(
+                **self.build_request(text)
+            )
+            return response.choices[0].message.content
+        except Exception as e:
+            logger.error(f"Ошибка при чанковании {source_file} через ChatGPT: {e}")
+            return None
+
+    async def chunk_documents_async(
+        self,
+        docs: List[Tuple[str, str]],
+        max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+        use_batch_api: bool = False,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Конкурентно разбивает набор документов на чанки через ChatGPT
 
-ТРЕБОВАНИЯ:
-1. Каждый чанк должен содержать одну законченную правовую позицию или аргумент
-2. Сохраняй контекст - не разрывай связанные факты и выводы
-3. Выделяй отдельно:
-   - Фактические обстоятельства дела
-   - Правовые позиции суда
-   - Цитаты из законов и постановлений
-   - Выводы и решения
-4. Размер чанка: 200-800 слов (оптимально для векторного поиска)
+        Args:
+            docs: Список пар (текст документа, имя исходного файла)
+            max_concurrent: Максимум одновременных запросов к API
+            use_batch_api: Использовать OpenAI Batch API для больших прогонов
+                (от BATCH_API_MIN_DOCS документов)
 
-ФОРМАТ ОТВЕТА (строго JSON):
-{{
-  "chunks": [
-    {{
-      "id": "chunk_1",
-      "type": "factual_circumstances|legal_position|citation|conclusion",
-      "title": "Краткое название блока",
-      "text": "Полный текст чанка",
-      "key_articles": ["ст. 18 ЗоЗПП", "ст. 15 ГК РФ"],
-      "legal_concepts": ["недостаток товара", "права потребителя"]
-    }}
-  ]
-}}
+        Returns:
+            Списки чанков в порядке входных документов
+        """
+        if not _configure_openai():
+            logger.error("OpenAI API ключ не установлен")
+            return [self.fallback_chunking(text, name) for text, name in docs]
+
+        # Кэш ведется по целому документу, как в chunk_document и
+        # chunk_large_document. Большие документы без кэша заранее делим
+        # на части, чтобы все запросы шли параллельно
+        results: List[List[Dict[str, Any]]] = [[] for _ in docs]
+        doc_keys: Dict[int, str] = {}
+        parts = []
+        for doc_index, (text, source_file) in enumerate(docs):
+            cache_key = self.get_cache_key(text)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                results[doc_index] = cached
+                continue
+            doc_keys[doc_index] = cache_key
+            if len(text) > MAX_REQUEST_CHARS:
+                parts.extend(
+                    (doc_index, part, part_name)
+                    for part, part_name in self.split_into_parts(text, source_file)
+                )
+            else:
+                parts.append((doc_index, text, source_file))
 
-ДОКУМЕНТ:
-{text[:80000]}  # Ограничиваем размер для API
-"""
+        logger.info(
+            f"Чанкование {len(docs)} документов: из кэша {len(docs) - len(doc_keys)}, "
+            f"частей для запроса {len(parts)}"
+        )
+
+        if parts:
+            requests = [(text, source_file) for _, text, source_file in parts]
+            if use_batch_api and len(docs) >= BATCH_API_MIN_DOCS:
+                responses = await self._run_batch_job(requests)
+            else:
+                responses = await self._run_concurrent(requests, max_concurrent)
+
+            # Документ попадает в кэш, только если все его части обработаны моделью
+            complete = dict.fromkeys(doc_keys, True)
+            for (doc_index, text, source_file), result in zip(parts, responses):
+                if result is None:
+                    complete[doc_index] = False
+                    results[doc_index].extend(self.fallback_chunking(text, source_file))
+                else:
+                    results[doc_index].extend(
+                        self.parse_chunking_result(result, source_file)
+                    )
+            for doc_index, cache_key in doc_keys.items():
+                if complete[doc_index]:
+                    self.cache[cache_key] = results[doc_index]
+
+        return results
+
+    async def _run_concurrent(
+        self, parts: List[Tuple[str, str]], max_concurrent: int
+    ) -> List[Optional[str]]:
+        """Отправляет запросы конкурентно с ограничением через семафор"""
+        import openai
+
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        async with openai.AsyncOpenAI(api_key=OPENAI_API_KEY) as async_client:
+
+            async def call(text: str, source_file: str) -> Optional[str]:
+                async with semaphore:
+                    return await self._request_with_retry(
+                        async_client, text, source_file
+                    )
+
+            return await asyncio.gather(
+                *[call(text, source_file) for text, source_file in parts]
+            )
+
+    async def _request_with_retry(
+        self, async_client: "openai.AsyncOpenAI", text: str, source_file: str
+    ) -> Optional[str]:
+        """Выполняет запрос с экспоненциальной задержкой при 429/5xx"""
+        retryable_errors = _retryable_errors()
+        for attempt in range(MAX_RETRIES):
+            try:
+                response = await async_client.chat.completions.create(
+                    **self.build_request(text)
+                )
+                return response.choices[0].message.content
+            except retryable_errors as e:
+                if attempt == MAX_RETRIES - 1:
+                    logger.error(f"Исчерпаны попытки для {source_file}: {e}")
+                    return None
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt)
+                delay += random.uniform(0, delay / 2)
+                logger.warning(
+                    f"Повтор запроса для {source_file} через {delay:.1f} с: {e}"
+                )
+                await asyncio.sleep(delay)
+            except Exception as e:
+                logger.error(f"Ошибка при чанковании через ChatGPT: {e}")
+                return None
+        return None
+
+    async def _run_batch_job(
+        self, pending: List[Tuple[str, str]]
+    ) -> List[Optional[str]]:
+        """Отправляет запросы одним заданием OpenAI Batch API и ждет результата"""
+        import openai
+
+        os.makedirs(BATCH_DIR, exist_ok=True)
+        batch_file = os.path.join(BATCH_DIR, f"chunking_{int(time.time())}.jsonl")
+
+        with open(batch_file, "w", encoding="utf-8") as f:
+            for i, (text, _) in enumerate(pending):
+                request = {
+                    "custom_id": str(i),
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": self.build_request(text),
+                }
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+        async with openai.AsyncOpenAI(api_key=OPENAI_API_KEY) as async_client:
+            with open(batch_file, "rb") as f:
+                input_file = await async_client.files.create(file=f, purpose="batch")
+
+            batch = await async_client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h",
+            )
+            logger.info(f"Создано Batch API задание {batch.id} на {len(pending)} запросов")
+
+            while batch.status not in ("completed", "failed", "expired", "cancelled"):
+                await asyncio.sleep(BATCH_POLL_INTERVAL)
+                batch = await async_client.batches.retrieve(batch.id)
+
+            if batch.status != "completed" or not batch.output_file_id:
+                logger.error(f"Batch API задание {batch.id} завершилось: {batch.status}")
+                return [None] * len(pending)
+
+            output = await async_client.files.content(batch.output_file_id)
+
+        responses: Dict[str, str] = {}
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if response.get("status_code") == 200:
+                body = response["body"]
+                responses[item["custom_id"]] = body["choices"][0]["message"]["content"]
+
+        logger.info(f"Batch API задание {batch.id}: получено {len(responses)} ответов")
+        return [responses.get(str(i)) for i in range(len(pending))]
+
+    def create_chunking_prompt(self, text: str) -> str:
+        """Создает пользовательское сообщение с документом (инструкции в SYSTEM_PROMPT)"""
+        return f"ДОКУМЕНТ:\n{text}"
 
     def parse_chunking_result(
         self, result: str, source_file: str
@@ -168,9 +407,7 @@ class ChatGPTChunker:
         """Парсит результат чанкования от ChatGPT"""
         try:
             # Извлекаем JSON из ответа
-            import re
-
-            json_match = re.search(r"\{.*\}", result, re.DOTALL)
+            json_match = _JSON_OBJECT_RE.search(result)
             if json_match:
                 data = json.loads(json_match.group())
                 chunks = data.get("chunks", [])
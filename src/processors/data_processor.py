@@ -3,24 +3,346 @@
 Извлекает текст из PDF, структурирует и подготавливает для векторизации
 """
 
-from .gemini_chunker import GeminiChunker
-from ..utils.config import PDF_DIR, JSON_DIR, DATA_DIR
-from typing import List, Dict, Any
+from ..utils.logging_setup import setup_file_logging
+from ..utils.config import (
+    PDF_DIR,
+    JSON_DIR,
+    DATA_DIR,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    EMBEDDING_MODEL,
+)
+from ..utils.json_io import write_json, read_json
+from ..utils.cache import SQLiteCache, content_hash, file_hash
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import accumulate
+from bisect import bisect_left, bisect_right
 from loguru import logger
+from tqdm import tqdm
 import re
 import os
-import json
-import fitz
+
+try:
+    import ahocorasick
+
+    _HAS_AHOCORASICK = True
+except Exception:
+    _HAS_AHOCORASICK = False
+
+try:
+    import hyperscan
+
+    _HAS_HYPERSCAN = True
+except Exception:
+    _HAS_HYPERSCAN = False
+
+# Верхняя граница числа процессов по умолчанию: извлечение текста PyMuPDF
+# упирается в память и диск, дальше 4 процессов прирост почти пропадает
+DEFAULT_MAX_WORKERS = 4
+
+# Версия логики обработки: увеличивается при изменении извлечения или
+# чанкования, чтобы process_all_pdfs пересобрал JSON, созданные старой версией
+PROCESSING_VERSION = 1
+
+
+def _priority_union(patterns: List[str], flags: int = 0) -> "re.Pattern":
+    """
+    Объединяет шаблоны в один, проверяемый за один проход по тексту.
+    Альтернативы обернуты в lookahead, поэтому совпадения не поглощают друг друга
+    """
+    alternatives = "|".join(
+        f"(?P<p{i}>{pattern})" for i, pattern in enumerate(patterns)
+    )
+    return re.compile(f"(?=(?:{alternatives}))", flags)
+
+
+def _search_by_priority(
+    union: "re.Pattern", patterns: List["re.Pattern"], text: str
+) -> Optional["re.Match"]:
+    """
+    Возвращает первое совпадение самого приоритетного шаблона из списка,
+    как при поочередном re.search по каждому шаблону, но за один проход
+    """
+    best_index = None
+    best_pos = 0
+    for match in union.finditer(text):
+        index = int(match.lastgroup[1:])
+        if best_index is None or index < best_index:
+            best_index, best_pos = index, match.start()
+            if index == 0:
+                break
+    if best_index is None:
+        return None
+    return patterns[best_index].match(text, best_pos)
+
+
+def _keyword_pattern(keywords: List[str]) -> "re.Pattern":
+    """Компилирует список ключевых слов в одну альтернативу"""
+    return re.compile("|".join(re.escape(keyword) for keyword in keywords))
+
+
+# Шаблоны метаданных (в порядке приоритета)
+CASE_NUMBER_PATTERNS = [
+    r"№\s*(\d+[-\w]+\d+)",
+    r"дело\s*№\s*(\d+[-\w]+\d+)",
+    r"№\s*(\d+-\w+-\d+-\w+)",
+]
+COURT_PATTERNS = [
+    r"Верховный\s+Суд\s+Российской\s+Федерации",
+    r"Арбитражный\s+суд\s+[^,\n]+",
+    r"Районный\s+суд\s+[^,\n]+",
+    r"Городской\s+суд\s+[^,\n]+",
+]
+DATE_PATTERNS = [
+    r"(\d{1,2}\s+\w+\s+\d{4})\s*г\.",
+    r"(\d{4}-\d{2}-\d{2})",
+    r"(\d{1,2}\.\d{1,2}\.\d{4})",
+]
+JUDGE_PATTERN = r"([А-Я][а-я]+\s+[А-Я]\.\s*[А-Я]\.)"
+ARTICLE_PATTERNS = [
+    r"ст\.\s*(\d+)\s*(?:п\.\s*(\d+))?\s*(?:ч\.\s*(\d+))?\s*(?:ГК|ГПК|АПК|УК|КоАП|ЗоЗПП)",
+    r"статья\s*(\d+)\s*(?:пункт\s*(\d+))?\s*(?:часть\s*(\d+))?\s*(?:ГК|ГПК|АПК|УК|КоАП|ЗоЗПП)",
+    r"(\d+)\s*статья\s*(?:пункт\s*(\d+))?\s*(?:часть\s*(\d+))?\s*(?:ГК|ГПК|АПК|УК|КоАП|ЗоЗПП)",
+]
+
+_CASE_NUMBER_RES = [re.compile(p, re.IGNORECASE) for p in CASE_NUMBER_PATTERNS]
+_CASE_NUMBER_RE = _priority_union(CASE_NUMBER_PATTERNS, re.IGNORECASE)
+_COURT_RES = [re.compile(p, re.IGNORECASE) for p in COURT_PATTERNS]
+_COURT_RE = _priority_union(COURT_PATTERNS, re.IGNORECASE)
+_DATE_RES = [re.compile(p) for p in DATE_PATTERNS]
+_DATE_RE = _priority_union(DATE_PATTERNS)
+_JUDGE_RE = re.compile(JUDGE_PATTERN)
+# Статьи собираются всеми шаблонами по очереди, поэтому объединение не требуется
+_ARTICLE_RES = [re.compile(p, re.IGNORECASE) for p in ARTICLE_PATTERNS]
+
+# Семейства шаблонов для предварительного отбора через Hyperscan:
+# (шаблоны, без учета регистра)
+PREFILTER_FAMILIES = {
+    "case_number": (CASE_NUMBER_PATTERNS, True),
+    "court": (COURT_PATTERNS, True),
+    "date": (DATE_PATTERNS, False),
+    "judge": ([JUDGE_PATTERN], False),
+    "article": (ARTICLE_PATTERNS, True),
+}
+
+
+def _build_prefilter():
+    """
+    Компилирует все шаблоны метаданных в одну базу Hyperscan.
+    Возвращает (база, [(семейство, индекс шаблона), ...]) или None
+    """
+    expressions, ids, flags, pattern_index = [], [], [], []
+    for family, (patterns, ignorecase) in PREFILTER_FAMILIES.items():
+        for i, pattern in enumerate(patterns):
+            flag = hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP
+            flag |= hyperscan.HS_FLAG_SINGLEMATCH
+            if ignorecase:
+                flag |= hyperscan.HS_FLAG_CASELESS
+            expressions.append(pattern.encode("utf-8"))
+            ids.append(len(pattern_index))
+            flags.append(flag)
+            pattern_index.append((family, i))
+
+    try:
+        database = hyperscan.Database()
+        database.compile(
+            expressions=expressions, ids=ids, elements=len(ids), flags=flags
+        )
+        return database, pattern_index
+    except Exception as e:
+        logger.warning(f"Не удалось скомпилировать шаблоны для Hyperscan: {e}")
+        return None
+
+
+_PREFILTER = _build_prefilter() if _HAS_HYPERSCAN else None
+
+
+def _prefilter_hits(text: str) -> Optional[Dict[str, set]]:
+    """
+    Одним проходом Hyperscan определяет, какие шаблоны встречаются в тексте.
+    Возвращает {семейство: {индексы шаблонов}} или None без Hyperscan
+    """
+    if _PREFILTER is None:
+        return None
+
+    database, pattern_index = _PREFILTER
+    hits: Dict[str, set] = {}
+    seen = set()
+
+    def on_match(pattern_id, start, end, flags, context):
+        family, i = pattern_index[pattern_id]
+        hits.setdefault(family, set()).add(i)
+        seen.add(pattern_id)
+        # Все шаблоны уже найдены: остаток текста можно не сканировать
+        return len(seen) == len(pattern_index)
+
+    try:
+        database.scan(
+            text.encode("utf-8", errors="replace"), match_event_handler=on_match
+        )
+    except hyperscan.ScanTerminated:
+        pass  # Остановлено обработчиком: все шаблоны найдены
+    return hits
+
+
+def _first_match(
+    family: str,
+    union: "re.Pattern",
+    patterns: List["re.Pattern"],
+    text: str,
+    hits: Optional[Dict[str, set]],
+) -> Optional["re.Match"]:
+    """
+    Находит совпадение самого приоритетного шаблона семейства.
+    Если известны попадания Hyperscan, re запускается только для нужного шаблона
+    """
+    if hits is None:
+        return _search_by_priority(union, patterns, text)
+    indices = hits.get(family)
+    if not indices:
+        return None
+    return patterns[min(indices)].search(text)
+
+# Типы документов в порядке приоритета: (ключевое слово, тип)
+DOCUMENT_TYPES = (
+    ("определение", "Определение"),
+    ("решение", "Решение"),
+    ("постановление", "Постановление"),
+    ("исковое заявление", "исковое заявление"),
+    ("апелляционная жалоба", "апелляционная жалоба"),
+    ("кассационная жалоба", "кассационная жалоба"),
+)
+
+# Ключевые слова для классификации по типу спора
+CONSUMER_KEYWORDS = [
+    "защита прав потребителей",
+    "зозпп",
+    "потребитель",
+    "продавец",
+    "изготовитель",
+    "исполнитель",
+    "недостаток товара",
+    "ненадлежащее качество",
+    "возврат товара",
+    "замена товара",
+    "устранение недостатков",
+    "неустойка",
+    "компенсация морального вреда",
+    "штраф",
+    "ст. 18",
+    "ст. 25",
+    "ст. 15",
+]
+CONTRACT_KEYWORDS = [
+    "договор",
+    "контракт",
+    "соглашение",
+    "обязательство",
+    "исполнение договора",
+    "нарушение договора",
+    "расторжение договора",
+    "взыскание долга",
+    "неустойка",
+]
+ADMIN_KEYWORDS = [
+    "административное дело",
+    "административное правонарушение",
+    "штраф гибдд",
+    "лишение прав",
+    "административная ответственность",
+    "коап",
+]
+CRIMINAL_KEYWORDS = [
+    "уголовное дело",
+    "преступление",
+    "уголовная ответственность",
+    "наказание",
+    "суд присяжных",
+    "обвинение",
+    "защита",
+    "прокурор",
+]
+POSITION_KEYWORDS = [
+    "суд установил",
+    "суд пришел к выводу",
+    "суд считает",
+    "суд полагает",
+    "суд указывает",
+    "суд подчеркивает",
+]
+
+_POSITION_RE = _keyword_pattern(POSITION_KEYWORDS)
+_SENTENCE_RE = re.compile(r"[^.!?]+")
+_SENTENCE_END_RE = re.compile(r"[.!?]")
+_POSITION_ARTICLE_RE = re.compile(r"ст\.\s*\d+[^\s]*")
+
+# Категории споров (совпадают с флагами в метаданных)
+DISPUTE_KEYWORDS = {
+    "consumer_protection": tuple(CONSUMER_KEYWORDS),
+    "contract_dispute": tuple(CONTRACT_KEYWORDS),
+    "administrative": tuple(ADMIN_KEYWORDS),
+    "criminal": tuple(CRIMINAL_KEYWORDS),
+}
+
+
+def _build_keyword_automaton(categories: Dict[str, Tuple[str, ...]]):
+    """Строит автомат Aho-Corasick: ключевое слово -> множество категорий"""
+    word_categories: Dict[str, set] = {}
+    for category, keywords in categories.items():
+        for keyword in keywords:
+            word_categories.setdefault(keyword, set()).add(category)
+
+    automaton = ahocorasick.Automaton()
+    for keyword, keyword_categories in word_categories.items():
+        automaton.add_word(keyword, frozenset(keyword_categories))
+    automaton.make_automaton()
+    return automaton
+
+
+_DISPUTE_AUTOMATON = (
+    _build_keyword_automaton(DISPUTE_KEYWORDS) if _HAS_AHOCORASICK else None
+)
+
+
+def _find_dispute_categories(text_lower: str) -> set:
+    """
+    Возвращает категории споров, ключевые слова которых встречаются в тексте.
+    С pyahocorasick текст просматривается один раз для всех категорий
+    """
+    if _DISPUTE_AUTOMATON is None:
+        # Простые вхождения подстрок str быстрее и альтернации re, и поиска
+        # по bytes (кириллица в UTF-8 занимает вдвое больше байт)
+        return {
+            category
+            for category, keywords in DISPUTE_KEYWORDS.items()
+            if any(keyword in text_lower for keyword in keywords)
+        }
+
+    found = set()
+    for _, categories in _DISPUTE_AUTOMATON.iter(text_lower):
+        found |= categories
+        if len(found) == len(DISPUTE_KEYWORDS):
+            break
+    return found
 
 
 class LegalDocumentProcessor:
     """Класс для обработки юридических документов"""
 
-    def __init__(self, use_gemini_chunking: bool = True):
+    def __init__(self, use_gemini_chunking: bool = True, keep_full_text: bool = False):
         self.setup_logging()
+        self._tokenizer = None
+        self._hash_indexes: Dict[str, SQLiteCache] = {}
+        # Полный текст дублирует чанки, поэтому в JSON по умолчанию не пишется
+        self.keep_full_text = keep_full_text
         self.use_gemini_chunking = use_gemini_chunking
         if use_gemini_chunking:
             try:
+                # Импорт откладывается: google.generativeai и openai тяжелые,
+                # а без Gemini-чанкования они не нужны
+                from .gemini_chunker import GeminiChunker
+
                 self.gemini_chunker = GeminiChunker()
                 logger.info("Gemini чанкование активировано (с резервом на ChatGPT)")
             except Exception as e:
@@ -31,7 +353,7 @@ class LegalDocumentProcessor:
 
     def setup_logging(self):
         """Настройка логирования"""
-        logger.add("./logs/data_processor.log", rotation="1 MB", level="INFO")
+        setup_file_logging("./logs/data_processor.log")
 
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """
@@ -44,15 +366,7 @@ class LegalDocumentProcessor:
                 Извлеченный текст
         """
         try:
-            doc = fitz.open(pdf_path)
-            full_text = ""
-
-            for page_num in range(doc.page_count):
-                page = doc[page_num]
-                text = page.get_text()
-                full_text += f"\n--- Страница {page_num + 1} ---\n{text}\n"
-
-            doc.close()
+            full_text = "".join(self.iter_pdf_pages(pdf_path))
             logger.info(f"Успешно извлечен текст из {pdf_path}")
             return full_text
 
@@ -60,12 +374,28 @@ class LegalDocumentProcessor:
             logger.error(f"Ошибка при извлечении текста из {pdf_path}: {e}")
             return ""
 
-    def extract_legal_metadata(self, text: str) -> Dict[str, Any]:
+    def iter_pdf_pages(self, pdf_path: str) -> Iterator[str]:
+        """
+        Постранично выдает текст PDF с заголовком страницы.
+        Документ закрывается при выходе из генератора, в том числе при ошибке;
+        в памяти одновременно держится только текущая страница
+        """
+        import fitz
+
+        with fitz.open(pdf_path) as doc:
+            for page_num, page in enumerate(doc, start=1):
+                text = page.get_text("text", sort=False)
+                yield f"\n--- Страница {page_num} ---\n{text}\n"
+
+    def extract_legal_metadata(
+        self, text: str, text_lower: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         Извлекает метаданные из юридического документа
 
         Args:
                 text: Текст документа
+                text_lower: Уже приведенный к нижнему регистру текст (если есть)
 
         Returns:
                 Словарь с метаданными
@@ -86,156 +416,75 @@ class LegalDocumentProcessor:
             "criminal": False,
         }
 
+        # Один проход Hyperscan (если установлен) по всем шаблонам метаданных
+        hits = _prefilter_hits(text)
+
         # Извлечение номера дела
-        case_patterns = [
-            r"№\s*(\d+[-\w]+\d+)",
-            r"дело\s*№\s*(\d+[-\w]+\d+)",
-            r"№\s*(\d+-\w+-\d+-\w+)",
-        ]
-
-        for pattern in case_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                metadata["case_number"] = match.group(1)
-                break
+        match = _first_match(
+            "case_number", _CASE_NUMBER_RE, _CASE_NUMBER_RES, text, hits
+        )
+        if match:
+            metadata["case_number"] = match.group(1)
 
         # Извлечение суда
-        court_patterns = [
-            r"Верховный\s+Суд\s+Российской\s+Федерации",
-            r"Арбитражный\s+суд\s+[^,\n]+",
-            r"Районный\s+суд\s+[^,\n]+",
-            r"Городской\s+суд\s+[^,\n]+",
-        ]
-
-        for pattern in court_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                metadata["court"] = match.group(0)
-                break
+        match = _first_match("court", _COURT_RE, _COURT_RES, text, hits)
+        if match:
+            metadata["court"] = match.group(0)
 
         # Извлечение даты
-        date_patterns = [
-            r"(\d{1,2}\s+\w+\s+\d{4})\s*г\.",
-            r"(\d{4}-\d{2}-\d{2})",
-            r"(\d{1,2}\.\d{1,2}\.\d{4})",
-        ]
-
-        for pattern in date_patterns:
-            match = re.search(pattern, text)
-            if match:
-                metadata["date"] = match.group(1)
-                break
+        match = _first_match("date", _DATE_RE, _DATE_RES, text, hits)
+        if match:
+            metadata["date"] = match.group(1)
 
         # Извлечение судей
-        judge_pattern = r"([А-Я][а-я]+\s+[А-Я]\.\s*[А-Я]\.)"
-        judges = re.findall(judge_pattern, text)
+        judges = _JUDGE_RE.findall(text) if hits is None or "judge" in hits else []
         metadata["judges"] = list(set(judges))
 
-        # Определение типа документа
-        if "определение" in text.lower():
-            metadata["document_type"] = "Определение"
-        elif "решение" in text.lower():
-            metadata["document_type"] = "Решение"
-        elif "постановление" in text.lower():
-            metadata["document_type"] = "Постановление"
-        elif "исковое заявление" in text.lower():
-            metadata["document_type"] = "исковое заявление"
-        elif "апелляционная жалоба" in text.lower():
-            metadata["document_type"] = "апелляционная жалоба"
-        elif "кассационная жалоба" in text.lower():
-            metadata["document_type"] = "кассационная жалоба"
+        if text_lower is None:
+            text_lower = text.lower()
+
+        # Определение типа документа (первое найденное по порядку)
+        for keyword, document_type in DOCUMENT_TYPES:
+            if keyword in text_lower:
+                metadata["document_type"] = document_type
+                break
 
         # Классификация по типу спора
-        text_lower = text.lower()
+        categories = _find_dispute_categories(text_lower)
 
         # Потребительские споры
-        consumer_keywords = [
-            "защита прав потребителей",
-            "зозпп",
-            "потребитель",
-            "продавец",
-            "изготовитель",
-            "исполнитель",
-            "недостаток товара",
-            "ненадлежащее качество",
-            "возврат товара",
-            "замена товара",
-            "устранение недостатков",
-            "неустойка",
-            "компенсация морального вреда",
-            "штраф",
-            "ст. 18",
-            "ст. 25",
-            "ст. 15",
-        ]
-
-        if any(keyword in text_lower for keyword in consumer_keywords):
+        if "consumer_protection" in categories:
             metadata["consumer_protection"] = True
             metadata["dispute_type"] = "consumer_protection"
             metadata["legal_area"] = "защита прав потребителей"
 
         # Договорные споры
-        contract_keywords = [
-            "договор",
-            "контракт",
-            "соглашение",
-            "обязательство",
-            "исполнение договора",
-            "нарушение договора",
-            "расторжение договора",
-            "взыскание долга",
-            "неустойка",
-        ]
-
-        if any(keyword in text_lower for keyword in contract_keywords):
+        if "contract_dispute" in categories:
             metadata["contract_dispute"] = True
             if not metadata["dispute_type"]:
                 metadata["dispute_type"] = "contract_dispute"
                 metadata["legal_area"] = "договорное право"
 
         # Административные дела
-        admin_keywords = [
-            "административное дело",
-            "административное правонарушение",
-            "штраф гибдд",
-            "лишение прав",
-            "административная ответственность",
-            "коап",
-        ]
-
-        if any(keyword in text_lower for keyword in admin_keywords):
+        if "administrative" in categories:
             metadata["administrative"] = True
             if not metadata["dispute_type"]:
                 metadata["dispute_type"] = "administrative"
                 metadata["legal_area"] = "административное право"
 
         # Уголовные дела
-        criminal_keywords = [
-            "уголовное дело",
-            "преступление",
-            "уголовная ответственность",
-            "наказание",
-            "суд присяжных",
-            "обвинение",
-            "защита",
-            "прокурор",
-        ]
-
-        if any(keyword in text_lower for keyword in criminal_keywords):
+        if "criminal" in categories:
             metadata["criminal"] = True
             if not metadata["dispute_type"]:
                 metadata["dispute_type"] = "criminal"
                 metadata["legal_area"] = "уголовное право"
 
         # Извлечение ключевых статей
-        article_patterns = [
-            r"ст\.\s*(\d+)\s*(?:п\.\s*(\d+))?\s*(?:ч\.\s*(\d+))?\s*(?:ГК|ГПК|АПК|УК|КоАП|ЗоЗПП)",
-            r"статья\s*(\d+)\s*(?:пункт\s*(\d+))?\s*(?:часть\s*(\d+))?\s*(?:ГК|ГПК|АПК|УК|КоАП|ЗоЗПП)",
-            r"(\d+)\s*статья\s*(?:пункт\s*(\d+))?\s*(?:часть\s*(\d+))?\s*(?:ГК|ГПК|АПК|УК|КоАП|ЗоЗПП)",
-        ]
-
-        for pattern in article_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
+        article_hits = None if hits is None else hits.get("article", set())
+        for i, pattern in enumerate(_ARTICLE_RES):
+            if article_hits is not None and i not in article_hits:
+                continue
+            matches = pattern.findall(text)
             for match in matches:
                 article_ref = f"ст. {match[0]}"
                 if match[1]:
@@ -246,31 +495,80 @@ class LegalDocumentProcessor:
 
         return metadata
 
-    def extract_legal_positions(self, text: str) -> List[Dict[str, str]]:
+    def extract_legal_positions(
+        self, text: str, text_lower: Optional[str] = None
+    ) -> List[Dict[str, str]]:
         """
         Извлекает правовые позиции из текста
+
+        Ищем ключевые фразы сразу во всем тексте и расширяем каждое вхождение
+        до границ предложения, вместо разбиения всего документа на предложения
+        """
+        if text_lower is None:
+            text_lower = text.lower()
+        if len(text_lower) != len(text):
+            # Редкие символы меняют длину при lower(): смещения не совпадут
+            return self._extract_legal_positions_by_split(text)
+
+        positions = []
+        prev_end = -1
+        match = _POSITION_RE.search(text_lower)
+        while match:
+            hit = match.start()
+            start = (
+                max(
+                    text.rfind(".", prev_end + 1, hit),
+                    text.rfind("!", prev_end + 1, hit),
+                    text.rfind("?", prev_end + 1, hit),
+                    prev_end,
+                )
+                + 1
+            )
+            end_match = _SENTENCE_END_RE.search(text, match.end())
+            end = end_match.start() if end_match else len(text)
+
+            sentence = text[start:end].strip()
+            articles = _POSITION_ARTICLE_RE.findall(sentence)
+            positions.append(
+                {"text": sentence, "articles": articles, "type": "legal_position"}
+            )
+
+            prev_end = end
+            match = _POSITION_RE.search(text_lower, end)
+        return positions
+
+    def _extract_legal_positions_by_split(self, text: str) -> List[Dict[str, str]]:
+        """
+        Извлекает правовые позиции, перебирая предложения текста по одному
+        (без построения списка всех предложений)
         """
         positions = []
-        position_keywords = [
-            "суд установил",
-            "суд пришел к выводу",
-            "суд считает",
-            "суд полагает",
-            "суд указывает",
-            "суд подчеркивает",
-        ]
-        sentences = re.split(r"[.!?]+", text)
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if any(keyword in sentence.lower() for keyword in position_keywords):
-                articles = re.findall(r"ст\.\s*\d+[^\s]*", sentence)
+        for match in _SENTENCE_RE.finditer(text):
+            sentence = match.group(0).strip()
+            if _POSITION_RE.search(sentence.lower()):
+                articles = _POSITION_ARTICLE_RE.findall(sentence)
                 positions.append(
                     {"text": sentence, "articles": articles, "type": "legal_position"}
                 )
         return positions
 
+    def _scan(self, text: str) -> Tuple[Dict[str, Any], List[Dict[str, str]]]:
+        """
+        Извлекает метаданные и правовые позиции, приводя текст к нижнему
+        регистру один раз для обоих извлечений
+        """
+        text_lower = text.lower()
+        return (
+            self.extract_legal_metadata(text, text_lower),
+            self.extract_legal_positions(text, text_lower),
+        )
+
     def chunk_text(
-        self, text: str, source_file: str = "unknown"
+        self,
+        text: str,
+        source_file: str = "unknown",
+        chunk_size: int = CHUNK_SIZE,
+        overlap: int = CHUNK_OVERLAP,
     ) -> List[Dict[str, Any]]:
         """
         Разбивает текст на семантические чанки
@@ -278,6 +576,8 @@ class LegalDocumentProcessor:
         Args:
                 text: Исходный текст
                 source_file: Имя исходного файла
+                chunk_size: Максимальный размер чанка в символах (резервное чанкование)
+                overlap: Перекрытие между частями длинного абзаца в символах
 
         Returns:
                 Список чанков с метаданными
@@ -290,21 +590,41 @@ class LegalDocumentProcessor:
                 logger.error(f"Ошибка Gemini чанкования: {e}, переходим к резервному")
 
         # Резервное чанкование
-        return self.fallback_chunking(text, source_file)
+        return self.fallback_chunking(text, source_file, chunk_size, overlap)
+
+    def fallback_chunking(
+        self,
+        text: str,
+        source_file: str,
+        chunk_size: int = CHUNK_SIZE,
+        overlap: int = CHUNK_OVERLAP,
+    ) -> List[Dict[str, Any]]:
+        """
+        Резервное чанкование по абзацам; длинные абзацы делятся скользящим окном
+        по словам с шагом около chunk_size - overlap символов
+        """
+        if not 0 <= overlap < chunk_size:
+            raise ValueError("overlap должен быть в диапазоне [0, chunk_size)")
 
-    def fallback_chunking(self, text: str, source_file: str) -> List[Dict[str, Any]]:
-        """Резервное чанкование по абзацам"""
         chunks = []
         paragraphs = text.split("\n\n")
         chunk_id = 0
 
         for paragraph in paragraphs:
             paragraph = paragraph.strip()
-            if len(paragraph) > 100:  # Только значимые абзацы
+            if len(paragraph) <= 100:  # Только значимые абзацы
+                continue
+
+            if len(paragraph) > chunk_size:
+                pieces = self.split_paragraph(paragraph, chunk_size, overlap)
+            else:
+                pieces = [paragraph]
+
+            for piece in pieces:
                 chunks.append(
                     {
                         "id": f"{source_file}_chunk_{chunk_id}",
-                        "text": paragraph,
+                        "text": piece,
                         "type": "legal_text",
                         "title": f"Абзац {chunk_id + 1}",
                         "key_articles": [],
@@ -318,6 +638,95 @@ class LegalDocumentProcessor:
         logger.info(f"Создано {len(chunks)} чанков (резервное чанкование)")
         return chunks
 
+    @staticmethod
+    def split_paragraph(paragraph: str, chunk_size: int, overlap: int) -> List[str]:
+        """
+        Жадно упаковывает слова абзаца в части не длиннее chunk_size.
+        Границы частей ищутся бинарным поиском по префиксным суммам длин слов;
+        следующая часть начинается со слов, занимающих до overlap последних
+        символов предыдущей
+        """
+        words = paragraph.split()
+        # prefix[i] — длина первых i слов вместе с пробелом после каждого
+        prefix = [0]
+        prefix.extend(accumulate(len(word) + 1 for word in words))
+
+        pieces = []
+        lo = 0
+        prev_hi = 0
+        while prev_hi < len(words):
+            # Самая длинная часть words[lo:hi] длиной не больше chunk_size
+            hi = bisect_right(prefix, prefix[lo] + chunk_size + 1) - 1
+            if hi <= prev_hi:
+                # С перекрытием не помещается ни одно новое слово — начинаем без него
+                lo = prev_hi
+                hi = max(bisect_right(prefix, prefix[lo] + chunk_size + 1) - 1, lo + 1)
+            pieces.append(" ".join(words[lo:hi]))
+            prev_hi = hi
+
+            # Перекрытие: целые слова из последних overlap символов части
+            lo = bisect_left(prefix, prefix[hi] - overlap - 1) if overlap > 0 else hi
+
+        return pieces
+
+    def chunk_text_tokens(
+        self,
+        text: str,
+        source_file: str = "unknown",
+        tokenizer=None,
+        chunk_tokens: int = 256,
+        overlap: int = 32,
+    ) -> List[Dict[str, Any]]:
+        """
+        Разбивает текст на чанки фиксированного размера в токенах модели эмбеддингов.
+        Документ токенизируется один раз, чанки получаются срезами списка токенов
+
+        Args:
+                text: Исходный текст
+                source_file: Имя исходного файла
+                tokenizer: Токенизатор (по умолчанию токенизатор EMBEDDING_MODEL)
+                chunk_tokens: Размер чанка в токенах
+                overlap: Перекрытие между соседними чанками в токенах
+
+        Returns:
+                Список чанков с метаданными
+        """
+        if overlap >= chunk_tokens:
+            raise ValueError("overlap должен быть меньше chunk_tokens")
+
+        if tokenizer is None:
+            tokenizer = self.get_tokenizer()
+
+        ids = tokenizer.encode(text, add_special_tokens=False)
+        chunks = []
+
+        for chunk_id, start in enumerate(range(0, len(ids), chunk_tokens - overlap)):
+            chunks.append(
+                {
+                    "id": f"{source_file}_chunk_{chunk_id}",
+                    "text": tokenizer.decode(ids[start : start + chunk_tokens]),
+                    "type": "legal_text",
+                    "title": f"Фрагмент {chunk_id + 1}",
+                    "key_articles": [],
+                    "legal_concepts": [],
+                    "source_file": source_file,
+                    "chunk_index": chunk_id,
+                }
+            )
+            if start + chunk_tokens >= len(ids):
+                break
+
+        logger.info(f"Создано {len(chunks)} чанков по {chunk_tokens} токенов")
+        return chunks
+
+    def get_tokenizer(self):
+        """Загружает (один раз) токенизатор модели эмбеддингов"""
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+
+            self._tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL)
+        return self._tokenizer
+
     def process_pdf_to_json(self, pdf_path: str) -> Dict[str, Any]:
         """Обрабатывает PDF файл и создает структурированный JSON"""
         logger.info(f"Начинаю обработку файла: {pdf_path}")
@@ -325,42 +734,150 @@ class LegalDocumentProcessor:
         if not text:
             logger.error(f"Не удалось извлечь текст из {pdf_path}")
             return {}
-        metadata = self.extract_legal_metadata(text)
-        legal_positions = self.extract_legal_positions(text)
+        metadata, legal_positions = self._scan(text)
         chunks = self.chunk_text(text, os.path.basename(pdf_path))
         result = {
             "metadata": metadata,
             "legal_positions": legal_positions,
             "chunks": chunks,
-            "full_text": text,
             "source_file": os.path.basename(pdf_path),
             "processing_info": {
                 "total_chunks": len(chunks),
                 "total_positions": len(legal_positions),
                 "text_length": len(text),
+                "text_hash": content_hash(text),
             },
         }
+        if self.keep_full_text:
+            result["full_text"] = text
         logger.info(
             f"Обработка завершена: {len(chunks)} чанков, {len(legal_positions)} позиций"
         )
         return result
 
-    def save_json(self, data: Dict[str, Any], output_path: str):
-        """Сохраняет данные в JSON файл"""
+    def save_json(self, data: Dict[str, Any], output_path: str, pretty: bool = False):
+        """
+        Сохраняет данные в JSON файл
+
+        Args:
+                data: Данные для сохранения
+                output_path: Путь к JSON файлу
+                pretty: Форматировать с отступами (для отладки; по умолчанию компактно)
+        """
         try:
-            with open(output_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            write_json(data, output_path, pretty)
             logger.info(f"Данные сохранены в {output_path}")
         except Exception as e:
             logger.error(f"Ошибка при сохранении в {output_path}: {e}")
 
+    def convert_pdf(
+        self, pdf_path: str, json_path: str, reuse_duplicates: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Обрабатывает один PDF и сохраняет результат в JSON.
+        Если PDF с тем же содержимым уже конвертирован (копия под другим именем),
+        его JSON переиспользуется без извлечения текста
+
+        Returns:
+                Краткая сводка без самих данных (чтобы не гонять их между процессами)
+        """
+        json_name = os.path.basename(json_path)
+        pdf_name = os.path.basename(pdf_path)
+        try:
+            output_dir = os.path.dirname(json_path)
+            hash_index = self.get_hash_index(output_dir)
+            pdf_hash = file_hash(pdf_path)
+
+            data = None
+            # Запись индекса: [имя JSON, PROCESSING_VERSION]; записи старой версии
+            # (и старого формата — просто имя) не переиспользуются
+            known = hash_index.get(pdf_hash) if reuse_duplicates else None
+            if (
+                isinstance(known, list)
+                and known[1:] == [PROCESSING_VERSION]
+                and known[0] != json_name
+            ):
+                data = self.reuse_json(
+                    os.path.join(output_dir, known[0]), pdf_name, pdf_hash
+                )
+            if not data:
+                data = self.process_pdf_to_json(pdf_path)
+            if not data:
+                return {"file": json_name, "status": "error", "error": "пустой результат"}
+            data.setdefault("processing_info", {})["pdf_hash"] = pdf_hash
+            self.save_json(data, json_path)
+            hash_index[pdf_hash] = [json_name, PROCESSING_VERSION]
+            self.get_manifest(output_dir)[json_name] = _pdf_signature(os.stat(pdf_path))
+            return {"file": json_name, "status": "processed", "error": None}
+        except Exception as e:
+            logger.error(f"Ошибка при обработке {pdf_name}: {e}")
+            return {"file": json_name, "status": "error", "error": str(e)}
+
+    def get_hash_index(self, output_dir: str) -> SQLiteCache:
+        """Индекс «хэш содержимого PDF -> имя JSON» для директории результатов"""
+        index = self._hash_indexes.get(output_dir)
+        if index is None:
+            index = SQLiteCache(os.path.join(output_dir, ".pdf_hashes.sqlite"))
+            self._hash_indexes[output_dir] = index
+        return index
+
+    def get_manifest(self, output_dir: str) -> SQLiteCache:
+        """
+        Манифест «имя JSON -> [mtime PDF, размер PDF, PROCESSING_VERSION]»
+        для директории результатов; по нему пропускаются неизмененные PDF
+        """
+        path = os.path.join(output_dir, ".pdf_manifest.sqlite")
+        manifest = self._hash_indexes.get(path)
+        if manifest is None:
+            manifest = SQLiteCache(path)
+            self._hash_indexes[path] = manifest
+        return manifest
+
+    def reuse_json(
+        self, known_json_path: str, pdf_name: str, pdf_hash: str
+    ) -> Dict[str, Any]:
+        """
+        Загружает результат обработки PDF с тем же содержимым и переименовывает
+        источник в нем. Возвращает {} если результат недоступен или JSON
+        с тех пор перезаписан другим PDF (хэш в processing_info не совпадает)
+        """
+        try:
+            data = read_json(known_json_path)
+        except Exception as e:
+            logger.warning(f"Не удалось переиспользовать {known_json_path}: {e}")
+            return {}
+        if data.get("processing_info", {}).get("pdf_hash") != pdf_hash:
+            logger.info(f"{known_json_path} устарел для {pdf_name}, обработаем заново")
+            return {}
+
+        old_name = data.get("source_file", "")
+        data["source_file"] = pdf_name
+        for chunk in data.get("chunks", []):
+            if old_name and chunk.get("id", "").startswith(old_name):
+                chunk["id"] = pdf_name + chunk["id"][len(old_name) :]
+            if "source_file" in chunk:
+                chunk["source_file"] = pdf_name
+
+        logger.info(
+            f"{pdf_name} совпадает по содержимому с {old_name}, текст не извлекаем"
+        )
+        return data
+
     def process_all_pdfs(
-        self, input_dir: str = PDF_DIR, output_dir: str = JSON_DIR, force: bool = False
+        self,
+        input_dir: str = PDF_DIR,
+        output_dir: str = JSON_DIR,
+        force: bool = False,
+        num_workers: Optional[int] = None,
     ):
         """
         Обрабатывает все PDF файлы в директории
-        - Если JSON уже существует (и новее PDF), пропускаем
+        - Если JSON уже существует и PDF не менялся (mtime и размер из манифеста,
+          та же PROCESSING_VERSION), пропускаем; для JSON без записи в манифесте
+          достаточно, чтобы JSON был новее PDF
         - Если force=True, пересобираем
+        - Файлы обрабатываются параллельно в пуле процессов
+          (num_workers, по умолчанию min(число ядер, DEFAULT_MAX_WORKERS))
         Возвращает сводку: { 'processed': int, 'skipped': int, 'errors': int, 'total': int, 'processed_files': [json_name,...] }
         """
         if not os.path.exists(input_dir):
@@ -373,8 +890,11 @@ class LegalDocumentProcessor:
                 "processed_files": [],
             }
         os.makedirs(output_dir, exist_ok=True)
-        pdf_files = [f for f in os.listdir(input_dir) if f.lower().endswith(".pdf")]
-        if not pdf_files:
+        with os.scandir(input_dir) as it:
+            pdf_entries = [
+                e for e in it if e.name.lower().endswith(".pdf") and e.is_file()
+            ]
+        if not pdf_entries:
             logger.warning(f"PDF файлы не найдены в {input_dir}")
             return {
                 "processed": 0,
@@ -383,51 +903,149 @@ class LegalDocumentProcessor:
                 "total": 0,
                 "processed_files": [],
             }
-        logger.info(f"Найдено {len(pdf_files)} PDF файлов для обработки")
+        logger.info(f"Найдено {len(pdf_entries)} PDF файлов для обработки")
         processed = 0
         skipped = 0
         errors = 0
         processed_files: List[str] = []
-        for idx, pdf_file in enumerate(pdf_files, 1):
-            pdf_path = os.path.join(input_dir, pdf_file)
-            json_file = pdf_file.replace(".pdf", ".json")
+        tasks: List[Tuple[str, str, bool]] = []
+        sizes: Dict[str, int] = {}
+
+        # Время изменения всех JSON получаем одним проходом по директории,
+        # записи манифеста — одним запросом
+        json_mtimes: Dict[str, float] = {}
+        manifest: Dict[str, List[int]] = {}
+        if not force:
+            with os.scandir(output_dir) as it:
+                json_mtimes = {
+                    e.name: e.stat().st_mtime for e in it if e.name.endswith(".json")
+                }
+            manifest = dict(self.get_manifest(output_dir).items())
+
+        for entry in pdf_entries:
+            json_file = entry.name.replace(".pdf", ".json")
             json_path = os.path.join(output_dir, json_file)
-            if not force and os.path.exists(json_path):
+            json_mtime = json_mtimes.get(json_file)
+            if json_mtime is not None:
                 try:
-                    if os.path.getmtime(json_path) >= os.path.getmtime(pdf_path):
+                    stat = entry.stat()
+                    signature = manifest.get(json_file)
+                    if signature is not None:
+                        up_to_date = signature == _pdf_signature(stat)
+                    else:
+                        up_to_date = json_mtime >= stat.st_mtime
+                    if up_to_date:
                         skipped += 1
                         if skipped % 1000 == 0:
                             logger.info(
                                 f"Пропущено уже-конвертированных файлов: {skipped}"
                             )
                         continue
-                except Exception:
+                except OSError:
                     pass
-            try:
-                data = self.process_pdf_to_json(pdf_path)
-                if data:
-                    self.save_json(data, json_path)
-                    processed += 1
-                    processed_files.append(os.path.basename(json_path))
-            except Exception as e:
-                errors += 1
-                logger.error(f"Ошибка при обработке {pdf_file}: {e}")
-            if (processed + skipped) % 500 == 0:
-                logger.info(
-                    f"Прогресс: обработано/пропущено {processed}/{skipped} из {len(pdf_files)}"
+            tasks.append((entry.path, json_path, not force))
+            sizes[entry.path] = _entry_size(entry)
+
+        # Самые большие PDF запускаются первыми: длинные задачи не остаются
+        # в хвосте, когда остальные процессы пула уже простаивают
+        tasks.sort(key=lambda task: sizes[task[0]], reverse=True)
+
+        if tasks:
+            if num_workers is None:
+                num_workers = min(os.cpu_count() or 1, DEFAULT_MAX_WORKERS)
+            workers = max(1, min(num_workers, len(tasks)))
+            logger.info(f"К обработке {len(tasks)} PDF, процессов: {workers}")
+            executor = None
+            if workers == 1:
+                results = (self.convert_pdf(*task) for task in tasks)
+            else:
+                # Каждый процесс создает свой процессор один раз (initializer),
+                # сам извлекает текст и пишет JSON — обратно возвращается только сводка.
+                # Результаты собираем по мере готовности: медленный PDF не задерживает остальные
+                executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=_init_worker,
+                    initargs=(self.use_gemini_chunking, self.keep_full_text),
                 )
+                futures = {
+                    executor.submit(_process_pdf_worker, task): task for task in tasks
+                }
+                results = _iter_completed(futures)
+            try:
+                for result in tqdm(
+                    results, total=len(tasks), desc="Обработка PDF", unit="файл"
+                ):
+                    if result["status"] == "processed":
+                        processed += 1
+                        processed_files.append(result["file"])
+                    else:
+                        errors += 1
+                    if (processed + errors) % 500 == 0:
+                        logger.info(
+                            f"Прогресс: обработано {processed}, ошибок {errors} из {len(tasks)}"
+                        )
+            finally:
+                if executor is not None:
+                    executor.shutdown()
         logger.info(
-            f"ИТОГО: обработано {processed}, пропущено {skipped}, ошибок {errors}, всего {len(pdf_files)}"
+            f"ИТОГО: обработано {processed}, пропущено {skipped}, ошибок {errors}, всего {len(pdf_entries)}"
         )
         return {
             "processed": processed,
             "skipped": skipped,
             "errors": errors,
-            "total": len(pdf_files),
+            "total": len(pdf_entries),
             "processed_files": processed_files,
         }
 
 
+def _entry_size(entry: os.DirEntry) -> int:
+    """Размер файла по DirEntry (stat кэшируется в самом DirEntry); 0 при ошибке"""
+    try:
+        return entry.stat().st_size
+    except OSError:
+        return 0
+
+
+def _pdf_signature(stat: os.stat_result) -> List[int]:
+    """Подпись PDF для манифеста: время изменения, размер и версия обработки"""
+    return [stat.st_mtime_ns, stat.st_size, PROCESSING_VERSION]
+
+
+def _iter_completed(
+    futures: Dict[Any, Tuple[str, str, bool]],
+) -> Iterator[Dict[str, Any]]:
+    """Отдает результаты задач пула по мере завершения; сбой процесса считается ошибкой файла"""
+    for future in as_completed(futures):
+        try:
+            yield future.result()
+        except Exception as e:
+            pdf_path, json_path, _ = futures[future]
+            logger.error(f"Ошибка при обработке {pdf_path}: {e}")
+            yield {
+                "file": os.path.basename(json_path),
+                "status": "error",
+                "error": str(e),
+            }
+
+
+# Процессор рабочего процесса пула (создается один раз на процесс)
+_WORKER_PROCESSOR: Optional[LegalDocumentProcessor] = None
+
+
+def _init_worker(use_gemini_chunking: bool, keep_full_text: bool):
+    """Инициализирует процессор в рабочем процессе пула"""
+    global _WORKER_PROCESSOR
+    _WORKER_PROCESSOR = LegalDocumentProcessor(
+        use_gemini_chunking=use_gemini_chunking, keep_full_text=keep_full_text
+    )
+
+
+def _process_pdf_worker(task: Tuple[str, str, bool]) -> Dict[str, Any]:
+    """Обрабатывает один PDF в рабочем процессе; JSON сохраняется здесь же"""
+    return _WORKER_PROCESSOR.convert_pdf(*task)
+
+
 def main():
     """Основная функция для тестирования"""
     processor = LegalDocumentProcessor()
@@ -2,11 +2,13 @@
 Модуль для семантического чанкования документов через Gemini с резервом на ChatGPT
 """
 
-import os
+import re
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 import google.generativeai as genai
 from loguru import logger
+from ..utils.logging_setup import setup_file_logging
+from ..utils.cache import SQLiteCache, chunking_cache_key
 from ..utils.config import GEMINI_API_KEY, OPENAI_API_KEY
 
 # Настройка Gemini
@@ -25,59 +27,40 @@ else:
     logger.warning("OPENAI_API_KEY не установлен. ChatGPT резерв недоступен.")
 
 
+# Форматы, в которых модель возвращает JSON (в порядке приоритета)
+_JSON_PATTERNS = [
+    re.compile(r"```json\s*(.*?)\s*```", re.DOTALL),
+    re.compile(r"```\s*(.*?)\s*```", re.DOTALL),
+    re.compile(r"\{.*\}", re.DOTALL),
+]
+
+
 class GeminiChunker:
     """Класс для семантического чанкования через Gemini с резервом на ChatGPT"""
 
     def __init__(self):
         self.setup_logging()
-        self.cache_file = "./data/gemini_chunking_cache.json"
-        self.cache = self.load_cache()
+        self.cache = SQLiteCache(
+            "./data/gemini_chunking_cache.sqlite",
+            legacy_json_path="./data/gemini_chunking_cache.json",
+        )
 
     def setup_logging(self):
         """Настройка логирования"""
-        logger.add("./logs/gemini_chunker.log", rotation="1 MB", level="INFO")
-
-    def load_cache(self) -> Dict[str, Any]:
-        """Загружает кэш результатов чанкования"""
-        try:
-            if os.path.exists(self.cache_file):
-                with open(self.cache_file, "r", encoding="utf-8") as f:
-                    return json.load(f)
-        except Exception as e:
-            logger.warning(f"Не удалось загрузить кэш: {e}")
-        return {}
+        setup_file_logging("./logs/gemini_chunker.log")
 
-    def save_cache(self):
-        """Сохраняет кэш результатов чанкования"""
-        try:
-            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
-            with open(self.cache_file, "w", encoding="utf-8") as f:
-                json.dump(self.cache, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.warning(f"Не удалось сохранить кэш: {e}")
-
-    def get_cache_key(self, text: str) -> str:
+    def get_cache_key(self, text: Union[str, bytes]) -> str:
         """Генерирует ключ кэша для текста"""
-        import hashlib
-
-        return hashlib.md5(text.encode("utf-8")).hexdigest()
+        return chunking_cache_key(text)
 
     def extract_json_from_response(self, response_text: str) -> str:
         """Безопасно извлекает JSON из ответа модели"""
         try:
             # Пытаемся найти JSON в различных форматах
-            json_patterns = [
-                r"```json\s*(.*?)\s*```",
-                r"```\s*(.*?)\s*```",
-                r"\{.*\}",
-            ]
-
-            import re
-
-            for pattern in json_patterns:
-                matches = re.findall(pattern, response_text, re.DOTALL)
-                if matches:
-                    json_text = matches[0].strip()
+            for pattern in _JSON_PATTERNS:
+                match = pattern.search(response_text)
+                if match:
+                    json_text = match.group(match.lastindex or 0).strip()
                     # Проверяем, что это валидный JSON
                     json.loads(json_text)
                     return json_text
@@ -462,9 +445,10 @@ class GeminiChunker:
         """
         # Проверяем кэш
         cache_key = self.get_cache_key(text)
-        if cache_key in self.cache:
+        cached = self.cache.get(cache_key)
+        if cached is not None:
             logger.info(f"Используем кэшированный результат для {source_file}")
-            return self.cache[cache_key]
+            return cached
 
         # Оптимизация для больших документов
         text_length = len(text)
@@ -474,7 +458,6 @@ class GeminiChunker:
             try:
                 chunks = self.chunk_with_chatgpt(text, source_file)
                 self.cache[cache_key] = chunks
-                self.save_cache()
                 logger.info(f"✅ Обработано {len(chunks)} чанков для {source_file}")
                 return chunks
             except Exception as e:
@@ -487,7 +470,6 @@ class GeminiChunker:
 
             # Сохраняем в кэш
             self.cache[cache_key] = chunks
-            self.save_cache()
 
             logger.info(f"✅ Обработано {len(chunks)} чанков для {source_file}")
             return chunks
@@ -0,0 +1,134 @@
+"""
+Персистентный кэш ключ-значение на SQLite
+"""
+
+import os
+import mmap
+import sqlite3
+import hashlib
+from typing import Any, Iterator, Optional, Tuple, Union
+from loguru import logger
+from .json_io import json_dumps, json_loads, read_json
+
+
+def content_hash(data: Union[str, bytes]) -> str:
+    """
+    Быстрый некриптографический ключ кэша для текста
+
+    BLAKE2b из стандартной библиотеки заметно быстрее MD5 на больших текстах.
+    Уже закодированные bytes принимаются без повторного кодирования.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def chunking_cache_key(data: Union[str, bytes]) -> str:
+    """
+    Ключ кэшей чанкования: MD5 текста, как в прежних JSON-кэшах.
+    Смена хэша сделала бы недоступными уже оплаченные ответы моделей
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.md5(data).hexdigest()
+
+
+def file_hash(path: str) -> str:
+    """Ключ содержимого файла; файл читается через mmap без копирования в память"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return content_hash(b"")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.blake2b(mapped, digest_size=16).hexdigest()
+
+
+class SQLiteCache:
+    """
+    Кэш результатов на SQLite: каждая запись пишется одной строкой таблицы,
+    без перезаписи всего файла. Значения хранятся в JSON.
+    """
+
+    def __init__(self, db_path: str, legacy_json_path: Optional[str] = None):
+        """
+        Инициализация кэша
+
+        Args:
+            db_path: Путь к файлу базы SQLite
+            legacy_json_path: Путь к старому JSON-кэшу для однократного импорта
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+
+        # Автокоммит и WAL: запись одной строки не блокирует читателей
+        # из других процессов пула
+        self.conn = sqlite3.connect(
+            db_path, isolation_level=None, check_same_thread=False, timeout=30
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache(key TEXT PRIMARY KEY, value BLOB)"
+        )
+
+        if legacy_json_path:
+            self._import_legacy_json(legacy_json_path)
+
+    def _import_legacy_json(self, json_path: str):
+        """Переносит записи из старого JSON-кэша, если таблица пуста"""
+        if not os.path.exists(json_path) or len(self):
+            return
+        try:
+            data = read_json(json_path)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO cache(key, value) VALUES (?, ?)",
+                ((k, json_dumps(v)) for k, v in data.items()),
+            )
+            logger.info(f"Импортировано {len(data)} записей кэша из {json_path}")
+        except Exception as e:
+            logger.warning(f"Не удалось импортировать кэш из {json_path}: {e}")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Возвращает значение по ключу или default"""
+        row = self.conn.execute(
+            "SELECT value FROM cache WHERE key=?", (key,)
+        ).fetchone()
+        if row is None:
+            return default
+        return json_loads(row[0])
+
+    def set(self, key: str, value: Any):
+        """Сохраняет значение по ключу"""
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache(key, value) VALUES (?, ?)",
+                (key, json_dumps(value)),
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось сохранить запись кэша: {e}")
+
+    def __contains__(self, key: str) -> bool:
+        return (
+            self.conn.execute("SELECT 1 FROM cache WHERE key=?", (key,)).fetchone()
+            is not None
+        )
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        self.set(key, value)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """Перебирает все пары ключ-значение одним запросом"""
+        for key, value in self.conn.execute("SELECT key, value FROM cache"):
+            yield key, json_loads(value)
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def close(self):
+        """Закрывает соединение с базой"""
+        self.conn.close()
@@ -14,11 +14,33 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 # Database Settings
 CHROMA_DB_PATH = "./data/chroma_db"
 VECTOR_COLLECTION_NAME = "legal_documents"
+# Эмбеддинги типовых запросов для прогрева кэша поиска при старте сервера
+SEARCH_WARMUP_PATH = "./data/chroma_db/search_warmup.npz"
+# Кэш эмбеддингов фрагментов вне CHROMA_DB_PATH: переживает полную переиндексацию
+EMBEDDING_CACHE_PATH = "./data/embedding_cache.sqlite"
+
+# Семантический кэш сгенерированных документов (GENERATION_CACHE=1 включает):
+# близкое описание дела с теми же найденными документами получает готовый
+# документ без запроса к LLM. Порог строгий: иначе разные дела получают один ответ
+GENERATION_CACHE = os.getenv("GENERATION_CACHE", "0").lower() in ("1", "true", "yes")
+GENERATION_CACHE_THRESHOLD = 0.97
 
 # Model Settings
 EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+# Движок модели эмбеддингов: "torch" или "onnx" (ONNX Runtime, нужен optimum[onnxruntime])
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
 GEMINI_MODEL = "gemini-2.5-pro"
 OPENAI_MODEL = "gpt-5"  # fallback model
+# Хеджирование генерации: через сколько секунд без ответа Gemini параллельно
+# запрашивается OpenAI (LLM_HEDGE_DELAY, разумное значение — p95 задержки Gemini).
+# Каждый хедж — второй оплачиваемый запрос, поэтому по умолчанию выключено:
+# OpenAI вызывается только после ошибки Gemini
+_hedge_delay = os.getenv("LLM_HEDGE_DELAY", "")
+LLM_HEDGE_DELAY = float(_hedge_delay) if _hedge_delay else None
+
+# Chunking Settings (резервное чанкование, в символах)
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 150
 
 # Search Settings
 TOP_K_RESULTS = 5
@@ -33,6 +55,8 @@ OUTPUT_DIR = "./data/output"
 # API Settings
 API_HOST = "0.0.0.0"
 API_PORT = 8000
+# Число процессов сервера; при 1 включен автоперезапуск для разработки
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
 API_TITLE = "RAG Legal Document Generator"
 API_VERSION = "1.0.0"
 
@@ -0,0 +1,41 @@
+"""
+Сканирование каталогов PDF и JSON для переиндексации
+"""
+
+import os
+from typing import Dict, List, Tuple
+
+
+def scan_mtimes(directory: str, suffix: str) -> Dict[str, float]:
+    """
+    Имя -> время изменения для файлов с расширением suffix (без учета регистра)
+    за один проход os.scandir; отсутствующий каталог дает пустой словарь
+    """
+    if not os.path.isdir(directory):
+        return {}
+    mtimes = {}
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.lower().endswith(suffix) and entry.is_file():
+                try:
+                    mtimes[entry.name] = entry.stat().st_mtime
+                except OSError:
+                    pass  # Файл удален во время обхода
+    return mtimes
+
+
+def scan_pdf_vs_json(pdf_dir: str, json_dir: str) -> Tuple[List[str], List[str]]:
+    """
+    Находит PDF, которые нужно (пере)обработать
+
+    Returns:
+        (все PDF, PDF без JSON или с JSON старше самого PDF)
+    """
+    pdf_mtimes = scan_mtimes(pdf_dir, ".pdf")
+    json_mtimes = scan_mtimes(json_dir, ".json")
+    stale = [
+        name
+        for name, pdf_mtime in pdf_mtimes.items()
+        if json_mtimes.get(name.replace(".pdf", ".json"), -1.0) < pdf_mtime
+    ]
+    return list(pdf_mtimes), stale
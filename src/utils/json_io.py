@@ -0,0 +1,58 @@
+"""
+Быстрое чтение и запись JSON (orjson, если установлен, иначе стандартный json)
+"""
+
+import os
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+
+    _HAS_ORJSON = True
+except Exception:
+    _HAS_ORJSON = False
+
+
+def json_dumps(data: Any, pretty: bool = False) -> bytes:
+    """Сериализует данные в JSON в UTF-8 (компактный, с отступами при pretty=True)"""
+    if _HAS_ORJSON:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    if pretty:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_loads(data: Union[bytes, str]) -> Any:
+    """Разбирает JSON из bytes или строки"""
+    if _HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def write_json(data: Any, path: str, pretty: bool = False):
+    """
+    Записывает данные в JSON файл одним вызовом write.
+    Запись идет во временный файл, который затем атомарно заменяет целевой:
+    параллельные читатели никогда не видят недописанный JSON
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(json_dumps(data, pretty))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def read_json(path: str) -> Any:
+    """Читает JSON файл целиком как bytes и разбирает"""
+    with open(path, "rb") as f:
+        return json_loads(f.read())
@@ -0,0 +1,27 @@
+"""
+Общая настройка файлового логирования
+"""
+
+from loguru import logger
+
+# Пути файлов, для которых sink уже добавлен в этом процессе
+_CONFIGURED_SINKS = set()
+
+
+def setup_file_logging(path: str, rotation: str = "1 MB", level: str = "INFO"):
+    """
+    Добавляет файловый sink loguru один раз на процесс
+
+    Повторные вызовы с тем же путем (например, при создании нескольких
+    экземпляров классов) ничего не делают, поэтому строки не дублируются.
+    Запись в файл выполняется в фоновом потоке (enqueue=True)
+
+    Args:
+        path: Путь к файлу лога
+        rotation: Условие ротации файла
+        level: Минимальный уровень сообщений
+    """
+    if path in _CONFIGURED_SINKS:
+        return
+    logger.add(path, rotation=rotation, level=level, enqueue=True)
+    _CONFIGURED_SINKS.add(path)
@@ -0,0 +1,137 @@
+"""
+Семантический кэш ответов LLM: повторный запрос с близким по смыслу
+текстом возвращает сохраненный ответ без обращения к модели
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Sequence
+
+import numpy as np
+from loguru import logger
+
+
+class SemanticCache:
+    """
+    Кэш «эмбеддинг запроса -> ответ» с косинусным сходством, TTL и LRU-вытеснением.
+    Поиск — полный перебор скалярным произведением нормированных векторов
+    (для сотен записей это доли миллисекунды)
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[str], Sequence[float]],
+        threshold: float = 0.92,
+        ttl: float = 3600.0,
+        max_entries: int = 1000,
+    ):
+        """
+        Инициализация кэша
+
+        Args:
+            embed_fn: Функция, возвращающая эмбеддинг текста
+            threshold: Минимальное косинусное сходство для попадания
+            ttl: Время жизни записи в секундах
+            max_entries: Максимальное число записей (старые вытесняются)
+        """
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # key -> (вектор, значение, время создания, область);
+        # порядок — давность использования
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._keys: list = []
+        self._scopes: list = []
+        self._next_key = 0
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, text: str) -> np.ndarray:
+        """Возвращает нормированный эмбеддинг текста"""
+        return self.normalize(self.embed_fn(text))
+
+    @staticmethod
+    def normalize(vector: Sequence[float]) -> np.ndarray:
+        """Приводит готовый эмбеддинг к виду, в котором он хранится в кэше"""
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def get(
+        self,
+        text: str,
+        vector: Optional[np.ndarray] = None,
+        scope: Hashable = None,
+    ) -> Any:
+        """
+        Возвращает сохраненный ответ для близкого запроса или None
+
+        Args:
+            text: Текст запроса
+            vector: Уже посчитанный нормированный эмбеддинг (если есть)
+            scope: Область записи: сравниваются только записи с той же областью
+        """
+        self._expire()
+        if self._entries:
+            if vector is None:
+                vector = self.embed(text)
+            scores = self._get_matrix() @ vector
+            if any(s != scope for s in self._scopes):
+                scores = np.where(
+                    [s == scope for s in self._scopes], scores, -np.inf
+                )
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                key = self._keys[best]
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self._log_stats(f"попадание (сходство {scores[best]:.3f})")
+                return self._entries[key][1]
+        self.misses += 1
+        self._log_stats("промах")
+        return None
+
+    def set(
+        self,
+        text: str,
+        value: Any,
+        vector: Optional[np.ndarray] = None,
+        scope: Hashable = None,
+    ):
+        """Сохраняет ответ для запроса в области scope"""
+        if vector is None:
+            vector = self.embed(text)
+        self._entries[self._next_key] = (vector, value, time.monotonic(), scope)
+        self._next_key += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._matrix = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expire(self):
+        """Удаляет записи старше ttl"""
+        deadline = time.monotonic() - self.ttl
+        expired = [k for k, entry in self._entries.items() if entry[2] < deadline]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _get_matrix(self) -> np.ndarray:
+        """Матрица эмбеддингов записей (пересобирается только после изменений)"""
+        if self._matrix is None:
+            self._keys = list(self._entries)
+            self._scopes = [self._entries[k][3] for k in self._keys]
+            self._matrix = np.stack([self._entries[k][0] for k in self._keys])
+        return self._matrix
+
+    def _log_stats(self, event: str):
+        total = self.hits + self.misses
+        logger.info(
+            f"Семантический кэш: {event}, попаданий {self.hits}/{total} "
+            f"({self.hits / total:.0%})"
+        )
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Тесты потокового ответа /api/generate в формате NDJSON
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient
+
+# Добавляем текущую директорию в путь
+sys.path.append(str(Path(__file__).parent.parent))
+
+import main
+
+SNIPPETS = [{"title": "Дело № 1", "text": "договор купли-продажи"}]
+
+
+class _FakeDatabase:
+    def search_similar(self, query, n_results=5):
+        return [{"document": "договор купли-продажи", "metadata": {}}]
+
+    def format_snippets(self, similar, max_chars):
+        return SNIPPETS
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(
+        main,
+        "vector_backend",
+        {
+            "type": "simple",
+            "db": _FakeDatabase(),
+            "embed": None,
+            "search_cache": None,
+            "ready": None,
+        },
+    )
+    # Без контекстного менеджера lifespan не запускает инициализацию базы
+    return TestClient(main.app)
+
+
+def _frames(response):
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+def test_stream_sends_snippets_first_then_chunks(client, monkeypatch):
+    def generate(query, similar, document_type, stream):
+        assert stream
+        return {"provider": "gemini", "document": iter(["Исковое ", "заявление"])}
+
+    monkeypatch.setattr(main, "generate_legal_document", generate)
+    response = client.post(
+        "/api/generate", json={"query": "вернуть деньги за товар", "stream": True}
+    )
+
+    assert response.status_code == 200
+    assert _frames(response) == [
+        {"snippets": SNIPPETS},
+        {"provider": "gemini"},
+        {"chunk": "Исковое "},
+        {"chunk": "заявление"},
+    ]
+
+
+def test_stream_reports_generation_error_as_frame(client, monkeypatch):
+    def generate(query, similar, document_type, stream):
+        raise RuntimeError("LLM недоступна")
+
+    monkeypatch.setattr(main, "generate_legal_document", generate)
+    response = client.post(
+        "/api/generate", json={"query": "вернуть деньги за товар", "stream": True}
+    )
+
+    assert _frames(response) == [
+        {"snippets": SNIPPETS},
+        {"error": "LLM недоступна"},
+    ]
@@ -10,12 +10,13 @@ import time
 from pathlib import Path
 from loguru import logger
 
-# Добавляем текущую директорию в путь
-sys.path.append(str(Path(__file__).parent))
+# Добавляем каталог скриптов в путь
+sys.path.append(str(Path(__file__).parent.parent / "scripts"))
 
 from async_reindex import AsyncReindexer
 
-async def test_async_processing():
+# Ручной прогон на реальных PDF из PDF_DIR: pytest его не собирает
+async def run_async_processing():
     """Тестирует асинхронную обработку на небольшом наборе"""
     logger.info("🧪 Тестирую асинхронную обработку...")
     
@@ -55,7 +56,7 @@ async def main():
     logger.info("🚀 Запуск тестирования асинхронной обработки")
     
     try:
-        await test_async_processing()
+        await run_async_processing()
     except KeyboardInterrupt:
         logger.info("⏹️ Тестирование прервано пользователем")
     except Exception as e:
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Тесты кэшей: SQLiteCache, EmbeddingCache и SemanticCache
+"""
+
+import hashlib
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Добавляем текущую директорию в путь
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.utils import semantic_cache
+from src.utils.cache import SQLiteCache, chunking_cache_key, content_hash
+from src.utils.semantic_cache import SemanticCache
+from src.databases.embedding_cache import EmbeddingCache
+
+
+def test_sqlite_cache_round_trip(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = SQLiteCache(path)
+    value = [{"id": "chunk_1", "text": "Суд установил", "key_articles": ["ст. 18"]}]
+    key = content_hash("документ")
+
+    assert cache.get(key) is None
+    assert key not in cache
+    with pytest.raises(KeyError):
+        cache[key]
+
+    cache[key] = value
+    assert key in cache
+    assert cache[key] == value
+    assert len(cache) == 1
+    cache.close()
+
+    # Записи переживают переоткрытие базы
+    reopened = SQLiteCache(path)
+    assert reopened.get(key) == value
+    assert dict(reopened.items()) == {key: value}
+    reopened.close()
+
+
+def test_legacy_chunking_cache_hits_after_import(tmp_path):
+    """Ответы из старого JSON-кэша (ключи MD5) находятся по ключу чанкеров"""
+    text = "Решение суда по делу о защите прав потребителей"
+    chunks = [{"id": "chunk_1", "text": text}]
+    legacy = tmp_path / "chunking_cache.json"
+    legacy_key = hashlib.md5(text.encode("utf-8")).hexdigest()
+    legacy.write_text(json.dumps({legacy_key: chunks}), encoding="utf-8")
+
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"), legacy_json_path=str(legacy))
+    assert chunking_cache_key(text) == legacy_key
+    assert cache.get(chunking_cache_key(text)) == chunks
+    cache.close()
+
+
+def test_embedding_cache_round_trip(tmp_path):
+    path = str(tmp_path / "emb.sqlite")
+    cache = EmbeddingCache(path, "model-a")
+    texts = ["договор займа", "защита прав потребителей"]
+    keys = [cache.key(text) for text in texts]
+    vectors = [[0.25, -1.5, 3.0], [1.0, 0.0, 0.5]]
+
+    assert cache.get_many(keys) == {}
+    cache.put_many(zip(keys, vectors))
+    found = cache.get_many(keys + ["missing"])
+    assert set(found) == set(keys)
+    for key, vector in zip(keys, vectors):
+        np.testing.assert_allclose(found[key], vector, rtol=1e-6)
+    cache.close()
+
+    # Ключ зависит от модели, записи переживают переоткрытие
+    reopened = EmbeddingCache(path, "model-a")
+    assert set(reopened.get_many(keys)) == set(keys)
+    other_model = EmbeddingCache(path, "model-b")
+    assert other_model.key(texts[0]) != keys[0]
+    assert other_model.get_many([other_model.key(text) for text in texts]) == {}
+    reopened.close()
+    other_model.close()
+
+
+_VECTORS = {
+    "a": [1.0, 0.0, 0.0],
+    "a2": [0.99, 0.14, 0.0],  # сходство с "a" около 0.99
+    "b": [0.0, 1.0, 0.0],
+    "c": [0.0, 0.0, 1.0],
+}
+
+
+def _cache(**kwargs):
+    return SemanticCache(lambda text: _VECTORS[text], **kwargs)
+
+
+def test_semantic_cache_threshold():
+    cache = _cache(threshold=0.95)
+    cache.set("a", "ответ")
+    assert cache.get("a") == "ответ"
+    assert cache.get("a2") == "ответ"
+    assert cache.get("b") is None
+
+    strict = _cache(threshold=0.999)
+    strict.set("a", "ответ")
+    assert strict.get("a2") is None
+    assert (strict.hits, strict.misses) == (0, 1)
+
+
+def test_semantic_cache_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(semantic_cache.time, "monotonic", lambda: now[0])
+    cache = _cache(ttl=10.0)
+    cache.set("a", "ответ")
+    now[0] += 5.0
+    assert cache.get("a") == "ответ"
+    now[0] += 6.0
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_semantic_cache_lru_eviction():
+    cache = _cache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # Обращение к "a" делает вытесняемой запись "b"
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_semantic_cache_scope():
+    cache = _cache()
+    cache.set("a", "первый", scope=("doc_1",))
+    assert cache.get("a", scope=("doc_2",)) is None
+    assert cache.get("a") is None
+    cache.set("a", "второй", scope=("doc_2",))
+    assert cache.get("a", scope=("doc_1",)) == "первый"
+    assert cache.get("a", scope=("doc_2",)) == "второй"
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Тесты переиспользования JSON для PDF-копий с тем же содержимым
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Добавляем текущую директорию в путь
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.processors import data_processor
+from src.processors.data_processor import LegalDocumentProcessor
+from src.utils.json_io import read_json
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    """Процессор, который «извлекает» текст из байтов файла и считает вызовы"""
+    processor = LegalDocumentProcessor(use_gemini_chunking=False)
+    processor.extracted = []
+
+    def process_pdf_to_json(pdf_path):
+        text = Path(pdf_path).read_text(encoding="utf-8")
+        processor.extracted.append(Path(pdf_path).name)
+        name = Path(pdf_path).name
+        return {
+            "source_file": name,
+            "chunks": [{"id": f"{name}_chunk_0", "text": text}],
+            "processing_info": {"total_chunks": 1},
+        }
+
+    monkeypatch.setattr(processor, "process_pdf_to_json", process_pdf_to_json)
+    return processor
+
+
+def _convert(processor, tmp_path, name, content, **kwargs):
+    pdf = tmp_path / "pdf" / f"{name}.pdf"
+    pdf.parent.mkdir(exist_ok=True)
+    pdf.write_text(content, encoding="utf-8")
+    json_path = tmp_path / "json" / f"{name}.json"
+    json_path.parent.mkdir(exist_ok=True)
+    result = processor.convert_pdf(str(pdf), str(json_path), **kwargs)
+    assert result["status"] == "processed"
+    return read_json(str(json_path))
+
+
+def test_duplicate_reuses_json(processor, tmp_path):
+    _convert(processor, tmp_path, "a", "текст X")
+    copy = _convert(processor, tmp_path, "b", "текст X")
+
+    assert processor.extracted == ["a.pdf"]
+    assert copy["source_file"] == "b.pdf"
+    assert copy["chunks"] == [{"id": "b.pdf_chunk_0", "text": "текст X"}]
+
+
+def test_rewritten_json_is_not_reused(processor, tmp_path):
+    """JSON, перезаписанный другим содержимым, не выдается за копию старого"""
+    _convert(processor, tmp_path, "a", "текст X")
+    _convert(processor, tmp_path, "a", "текст Y")
+    copy = _convert(processor, tmp_path, "b", "текст X")
+
+    assert processor.extracted == ["a.pdf", "a.pdf", "b.pdf"]
+    assert copy["chunks"][0]["text"] == "текст X"
+
+
+def test_old_processing_version_is_not_reused(processor, tmp_path, monkeypatch):
+    _convert(processor, tmp_path, "a", "текст X")
+    monkeypatch.setattr(data_processor, "PROCESSING_VERSION", 2)
+    _convert(processor, tmp_path, "b", "текст X")
+
+    assert processor.extracted == ["a.pdf", "b.pdf"]
+
+
+def test_reuse_disabled(processor, tmp_path):
+    _convert(processor, tmp_path, "a", "текст X")
+    _convert(processor, tmp_path, "b", "текст X", reuse_duplicates=False)
+
+    assert processor.extracted == ["a.pdf", "b.pdf"]
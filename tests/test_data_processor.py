@@ -3,11 +3,18 @@
 """
 
 import os
+import sys
 import json
-from data_processor import LegalDocumentProcessor
-from config import PDF_DIR, JSON_DIR
+from pathlib import Path
 
-def test_data_processing():
+# Добавляем корень проекта в путь
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.processors.data_processor import LegalDocumentProcessor
+from src.utils.config import PDF_DIR, JSON_DIR
+
+# Ручная проверка на реальном PDF из PDF_DIR: pytest ее не собирает
+def run_data_processing():
     """Тестирует обработку данных"""
     print("🧪 Тестирование модуля обработки данных...")
     
@@ -59,7 +66,7 @@ def test_data_processing():
     return True
 
 if __name__ == "__main__":
-    success = test_data_processing()
+    success = run_data_processing()
     if success:
         print("\n🎉 Тест прошел успешно! Модуль обработки данных работает корректно.")
     else:
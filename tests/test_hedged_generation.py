@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Тесты асинхронной генерации: фолбэк, хеджирование и общий запрос
+для одинаковых промптов
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# Добавляем текущую директорию в путь
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.integrations import gemini_integration
+
+DOCUMENT = "Исковое заявление о защите прав потребителей. " * 3
+
+
+class _FakeProvider:
+    """Ответ через delay секунд (или исключение) и учет вызовов и отмен"""
+
+    def __init__(self, delay, text=DOCUMENT, error=None):
+        self.delay = delay
+        self.text = text
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def __call__(self, prompt):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.text
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    def install(gemini, openai):
+        monkeypatch.setattr(gemini_integration, "generate_with_gemini_async", gemini)
+        monkeypatch.setattr(gemini_integration, "generate_with_openai_async", openai)
+        return gemini, openai
+
+    return install
+
+
+def _generate(hedge_delay, case="Продавец отказался вернуть деньги за товар"):
+    return gemini_integration.generate_legal_document_async(
+        case, [], use_cache=False, hedge_delay=hedge_delay
+    )
+
+
+def test_without_hedge_slow_gemini_is_awaited(providers):
+    gemini, openai = providers(_FakeProvider(0.2), _FakeProvider(0))
+    result = asyncio.run(_generate(None))
+
+    assert result == {"provider": "gemini", "document": DOCUMENT}
+    assert openai.calls == 0
+
+
+def test_without_hedge_falls_back_after_gemini_error(providers):
+    gemini, openai = providers(
+        _FakeProvider(0, error=RuntimeError("403")), _FakeProvider(0)
+    )
+    result = asyncio.run(_generate(None))
+
+    assert result["provider"] == "openai"
+    assert (gemini.calls, openai.calls) == (1, 1)
+
+
+def test_hedge_returns_first_answer_and_cancels_other(providers):
+    gemini, openai = providers(_FakeProvider(5), _FakeProvider(0))
+    result = asyncio.run(_generate(0.05))
+
+    assert result["provider"] == "openai"
+    assert gemini.cancelled == 1
+
+
+def test_short_answer_loses_to_slower_full_one(providers):
+    gemini, openai = providers(_FakeProvider(0.1), _FakeProvider(0, text="нет"))
+    result = asyncio.run(_generate(0))
+
+    assert result["provider"] == "gemini"
+
+
+def test_identical_concurrent_requests_share_one_call(providers):
+    gemini, openai = providers(_FakeProvider(0.1), _FakeProvider(0))
+
+    async def run():
+        return await asyncio.gather(_generate(None), _generate(None))
+
+    first, second = asyncio.run(run())
+    assert first == second
+    assert gemini.calls == 1
+    assert not gemini_integration._inflight
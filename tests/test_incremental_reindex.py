@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Тесты удаления документов без исходных PDF при инкрементальной переиндексации
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+# Добавляем каталог скриптов в путь
+sys.path.append(str(Path(__file__).parent.parent / "scripts"))
+
+import async_reindex
+from async_reindex import AsyncReindexer
+
+
+class _FakeVectorDatabase:
+    """Манифест загруженных JSON и журнал удаленных источников"""
+
+    def __init__(self, ingested):
+        self._ingested = set(ingested)
+        self.deleted_sources = []
+
+    @property
+    def ingested_files(self):
+        return set(self._ingested)
+
+    def delete_source_files(self, source_files):
+        self.deleted_sources.extend(source_files)
+
+    def forget_ingested(self, json_files):
+        self._ingested.difference_update(json_files)
+
+
+@pytest.fixture
+def reindexer(tmp_path, monkeypatch):
+    pdf_dir = tmp_path / "pdf"
+    json_dir = tmp_path / "json"
+    pdf_dir.mkdir()
+    json_dir.mkdir()
+    monkeypatch.setattr(async_reindex, "PDF_DIR", str(pdf_dir))
+    monkeypatch.setattr(async_reindex, "JSON_DIR", str(json_dir))
+
+    names = [f"doc_{i}" for i in range(4)]
+    for name in names:
+        (pdf_dir / f"{name}.pdf").write_bytes(b"%PDF")
+        (json_dir / f"{name}.json").write_text(
+            json.dumps({"source_file": f"{name}.pdf"}), encoding="utf-8"
+        )
+
+    reindexer = AsyncReindexer(max_workers=1, use_gemini_chunking=False)
+    reindexer.vector_db = _FakeVectorDatabase(f"{name}.json" for name in names)
+    yield reindexer
+    asyncio.run(reindexer.cleanup())
+
+
+def _remove_deleted(reindexer):
+    async def run():
+        await reindexer.remove_deleted_pdfs(await reindexer.get_pdf_files())
+
+    asyncio.run(run())
+
+
+def test_removes_documents_of_deleted_pdfs(reindexer):
+    (Path(async_reindex.PDF_DIR) / "doc_3.pdf").unlink()
+    _remove_deleted(reindexer)
+
+    assert reindexer.vector_db.deleted_sources == ["doc_3.pdf"]
+    assert reindexer.vector_db.ingested_files == {
+        "doc_0.json",
+        "doc_1.json",
+        "doc_2.json",
+    }
+    assert not (Path(async_reindex.JSON_DIR) / "doc_3.json").exists()
+
+
+@pytest.mark.parametrize("state", ["missing", "empty"])
+def test_missing_or_empty_pdf_dir_deletes_nothing(reindexer, state):
+    pdf_dir = Path(async_reindex.PDF_DIR)
+    for pdf in pdf_dir.iterdir():
+        pdf.unlink()
+    if state == "missing":
+        pdf_dir.rmdir()
+    _remove_deleted(reindexer)
+
+    assert reindexer.vector_db.deleted_sources == []
+    assert len(reindexer.vector_db.ingested_files) == 4
+    assert len(list(Path(async_reindex.JSON_DIR).iterdir())) == 4
+
+
+def test_mass_deletion_requires_full(reindexer):
+    """Исчезновение большей части корпуса не удаляет его без --full"""
+    for name in ("doc_1", "doc_2", "doc_3"):
+        (Path(async_reindex.PDF_DIR) / f"{name}.pdf").unlink()
+    _remove_deleted(reindexer)
+
+    assert reindexer.vector_db.deleted_sources == []
+    assert len(reindexer.vector_db.ingested_files) == 4
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Тесты предварительного отбора шаблонов метаданных через Hyperscan
+"""
+
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+# Добавляем текущую директорию в путь
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.processors import data_processor
+from src.processors.data_processor import LegalDocumentProcessor, PREFILTER_FAMILIES
+
+# Текст, в котором встречается каждый шаблон всех семейств
+ALL_PATTERNS_TEXT = """
+ВЕРХОВНЫЙ СУД РОССИЙСКОЙ ФЕДЕРАЦИИ
+Арбитражный суд города Москвы, Районный суд Тверской, Городской суд Сочи,
+дело № 44-КГ23-11-К7, № 5-АД-2023-Б
+от 15 августа 2023 г., 2023-08-15, 15.08.2023
+Судья Иванов И. И.
+ст. 309 ГК, статья 310 ГК, 393 статья ГК
+"""
+
+
+class _ScanTerminated(Exception):
+    pass
+
+
+class _FakeDatabase:
+    """Сообщает о совпадении каждого шаблона и останавливается как Hyperscan"""
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def scan(self, data, match_event_handler):
+        for pattern_id in self.ids:
+            if match_event_handler(pattern_id, 0, 1, 0, None):
+                raise _ScanTerminated()
+
+
+@pytest.fixture
+def fake_hyperscan(monkeypatch):
+    pattern_index = [
+        (family, i)
+        for family, (patterns, _) in PREFILTER_FAMILIES.items()
+        for i in range(len(patterns))
+    ]
+    database = _FakeDatabase(list(range(len(pattern_index))))
+    monkeypatch.setattr(
+        data_processor,
+        "hyperscan",
+        types.SimpleNamespace(ScanTerminated=_ScanTerminated),
+        raising=False,
+    )
+    monkeypatch.setattr(data_processor, "_PREFILTER", (database, pattern_index))
+    return pattern_index
+
+
+def test_prefilter_hits_all_patterns_early_stop(fake_hyperscan):
+    """Остановка сканирования после всех попаданий не приводит к ошибке"""
+    hits = data_processor._prefilter_hits(ALL_PATTERNS_TEXT)
+    expected = {}
+    for family, i in fake_hyperscan:
+        expected.setdefault(family, set()).add(i)
+    assert hits == expected
+
+
+def test_extract_metadata_with_all_patterns(fake_hyperscan):
+    """Извлечение метаданных не падает на тексте со всеми шаблонами"""
+    processor = LegalDocumentProcessor(use_gemini_chunking=False)
+    metadata = processor.extract_legal_metadata(ALL_PATTERNS_TEXT)
+    assert metadata["case_number"]
+    assert metadata["court"]
+    assert metadata["date"]
+
+
+def test_real_hyperscan_all_patterns():
+    """С настоящим Hyperscan текст со всеми шаблонами находит каждый шаблон"""
+    pytest.importorskip("hyperscan")
+    if data_processor._PREFILTER is None:
+        pytest.skip("База Hyperscan не скомпилирована")
+    hits = data_processor._prefilter_hits(ALL_PATTERNS_TEXT)
+    assert set(hits) == set(PREFILTER_FAMILIES)
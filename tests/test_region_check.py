@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Тесты кэша проверки доступности Gemini из текущего региона
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Добавляем текущую директорию в путь
+sys.path.append(str(Path(__file__).parent.parent))
+
+import check_gemini_region
+
+
+@pytest.fixture
+def probe(tmp_path, monkeypatch):
+    """Подменяет сетевую проверку: отдает заданные результаты по очереди"""
+    monkeypatch.setattr(
+        check_gemini_region, "REGION_CACHE_FILE", str(tmp_path / "region.json")
+    )
+    results = []
+    calls = []
+
+    def probe_gemini_availability(session):
+        calls.append(session)
+        return results.pop(0)
+
+    monkeypatch.setattr(
+        check_gemini_region, "probe_gemini_availability", probe_gemini_availability
+    )
+    return results, calls
+
+
+def test_available_region_is_cached(probe):
+    results, calls = probe
+    results.append((True, "Germany", True))
+
+    assert check_gemini_region.check_gemini_availability()
+    assert check_gemini_region.check_gemini_availability()
+    assert len(calls) == 1
+
+
+def test_blocked_region_is_rechecked(probe):
+    """После блокировки следующий запуск (например, с VPN) проверяет заново"""
+    results, calls = probe
+    results.extend([(False, "Russia", True), (True, "Germany", True)])
+
+    assert not check_gemini_region.check_gemini_availability()
+    assert check_gemini_region.check_gemini_availability()
+    assert len(calls) == 2
+
+
+def test_unknown_region_is_not_cached(probe):
+    results, calls = probe
+    results.extend([(True, None, False), (True, None, False)])
+
+    check_gemini_region.check_gemini_availability()
+    check_gemini_region.check_gemini_availability()
+    assert len(calls) == 2
+
+
+def test_legacy_negative_cache_is_ignored(probe):
+    results, calls = probe
+    results.append((True, "Germany", True))
+    Path(check_gemini_region.REGION_CACHE_FILE).write_text(
+        json.dumps({"ts": time.time(), "available": False, "country": "Russia"}),
+        encoding="utf-8",
+    )
+
+    assert check_gemini_region.check_gemini_availability()
+    assert len(calls) == 1
+
+
+def test_no_cache_bypasses_saved_result(probe):
+    results, calls = probe
+    results.extend([(True, "Germany", True), (False, "Russia", True)])
+
+    assert check_gemini_region.check_gemini_availability()
+    assert not check_gemini_region.check_gemini_availability(use_cache=False)
+    assert len(calls) == 2
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Тесты резервного чанкования и извлечения правовых позиций
+"""
+
+import random
+import re
+import sys
+from pathlib import Path
+
+import pytest
+
+# Добавляем текущую директорию в путь
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.processors.data_processor import LegalDocumentProcessor
+
+split_paragraph = LegalDocumentProcessor.split_paragraph
+
+
+def _words(count, seed=0):
+    """Уникальные слова разной длины: по ним восстанавливаются границы частей"""
+    rng = random.Random(seed)
+    return [f"w{i}" + "x" * rng.randint(0, 12) for i in range(count)]
+
+
+def _check_pieces(words, pieces, chunk_size, overlap):
+    """Части покрывают все слова по порядку, перекрытие — хвост предыдущей части"""
+    index = {word: i for i, word in enumerate(words)}
+    covered = 0
+    prev = None
+    for piece in pieces:
+        piece_words = piece.split()
+        assert piece_words
+        assert len(piece) <= chunk_size or len(piece_words) == 1
+        first = index[piece_words[0]]
+        assert piece_words == words[first : first + len(piece_words)]
+        # Новая часть начинается не позже конца предыдущей и продвигается вперед
+        assert first <= covered < first + len(piece_words)
+        if prev is not None and first < covered:
+            tail = " ".join(words[first:covered])
+            assert prev.endswith(tail)
+            assert len(tail) <= overlap
+        covered = first + len(piece_words)
+        prev = piece
+    assert covered == len(words)
+
+
+@pytest.mark.parametrize(
+    "chunk_size,overlap", [(100, 0), (100, 20), (250, 60), (40, 39)]
+)
+def test_split_paragraph_covers_words_with_overlap(chunk_size, overlap):
+    words = _words(300)
+    pieces = split_paragraph(" ".join(words), chunk_size, overlap)
+    _check_pieces(words, pieces, chunk_size, overlap)
+
+
+def test_split_paragraph_without_overlap_partitions_words():
+    words = _words(200, seed=1)
+    pieces = split_paragraph(" ".join(words), 80, 0)
+    assert " ".join(pieces).split() == words
+
+
+def test_split_paragraph_exact_fit_boundary():
+    # Четыре слова по 9 символов с пробелами дают ровно 39 символов
+    words = ["a" * 9, "b" * 9, "c" * 9, "d" * 9, "e" * 9]
+    pieces = split_paragraph(" ".join(words), 39, 0)
+    assert pieces == [" ".join(words[:4]), words[4]]
+    assert split_paragraph(" ".join(words), 38, 0)[0] == " ".join(words[:3])
+
+
+def test_split_paragraph_long_word_is_own_piece():
+    words = ["short", "x" * 50, "tail", "end"]
+    pieces = split_paragraph(" ".join(words), 20, 5)
+    assert "x" * 50 in pieces
+    _check_pieces(words, pieces, 20, 5)
+
+
+def test_fallback_chunking_rejects_bad_overlap():
+    processor = LegalDocumentProcessor(use_gemini_chunking=False)
+    with pytest.raises(ValueError):
+        processor.fallback_chunking("текст", "a.pdf", chunk_size=100, overlap=100)
+
+
+POSITION_KEYWORDS = [
+    "суд установил",
+    "суд пришел к выводу",
+    "суд считает",
+    "суд полагает",
+    "суд указывает",
+    "суд подчеркивает",
+]
+
+
+def _baseline_positions(text):
+    """Исходная реализация: разбиение всего текста на предложения"""
+    positions = []
+    for sentence in re.split(r"[.!?]+", text):
+        sentence = sentence.strip()
+        if any(keyword in sentence.lower() for keyword in POSITION_KEYWORDS):
+            articles = re.findall(r"ст\.\s*\d+[^\s]*", sentence)
+            positions.append(
+                {"text": sentence, "articles": articles, "type": "legal_position"}
+            )
+    return positions
+
+
+_FRAGMENTS = [
+    "Суд установил, что товар был ненадлежащего качества",
+    "СУД СЧИТАЕТ доводы истца обоснованными согласно ст. 18 ЗоЗПП",
+    "Ответчик возражал против иска",
+    "суд указывает на ст.15 ГК РФ и ст. 309 ГК",
+    "Суд пришел к выводу",
+    "суд полагает, а суд подчеркивает",
+    "Договор заключен 15.08.2023",
+    "",
+    "   ",
+]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_extract_legal_positions_matches_baseline(seed):
+    rng = random.Random(seed)
+    text = ""
+    for _ in range(rng.randint(1, 30)):
+        text += rng.choice(_FRAGMENTS) + rng.choice(
+            [".", "!", "?", "...", ". ", "\n", " "]
+        )
+    processor = LegalDocumentProcessor(use_gemini_chunking=False)
+    assert processor.extract_legal_positions(text) == _baseline_positions(text)
+
+
+def test_extract_legal_positions_length_changing_lower():
+    # "İ" при lower() становится двумя символами: используется разбиение по предложениям
+    text = "İstanbul. Суд установил нарушение ст. 10 ГК. Конец"
+    processor = LegalDocumentProcessor(use_gemini_chunking=False)
+    assert len(text.lower()) != len(text)
+    assert processor.extract_legal_positions(text) == _baseline_positions(text)
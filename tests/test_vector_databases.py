@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Тесты векторных баз: mmap-хранение SimpleVectorDatabase и сброс кэша
+результатов поиска VectorDatabase
+"""
+
+import pickle
+import random
+import sys
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Добавляем текущую директорию в путь
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.databases.simple_vector_db import SimpleVectorDatabase
+
+
+def _documents(count, seed=0):
+    rng = random.Random(seed)
+    vocab = [f"термин{i}" for i in range(500)]
+    return [
+        {
+            "source_file": f"doc_{n}.pdf",
+            "metadata": {},
+            "chunks": [
+                {"id": f"chunk_{n}", "text": " ".join(rng.choices(vocab, k=30))}
+            ],
+        }
+        for n in range(count)
+    ]
+
+
+def test_simple_db_mmap_save_load(tmp_path):
+    db_path = str(tmp_path / "db")
+    db = SimpleVectorDatabase(db_path)
+    db.add_documents(_documents(200))
+    queries = ["термин1 термин2", "термин10 термин20 термин30", "термин499"]
+    expected = db.search_similar_batch(queries, 5)
+    assert all(expected)
+
+    reopened = SimpleVectorDatabase(db_path)
+    # Матрицы открываются через mmap только для чтения (без копии в памяти)
+    for matrix in (reopened.embeddings, reopened._postings):
+        for part in (matrix.data, matrix.indices, matrix.indptr):
+            assert not part.flags.writeable
+    assert reopened.embeddings.shape == db.embeddings.shape
+    assert reopened.search_similar_batch(queries, 5) == expected
+
+    # Добавление поверх отображенных файлов заменяет их атомарно
+    reopened.add_documents(_documents(1, seed=1))
+    again = SimpleVectorDatabase(db_path)
+    assert len(again.documents) == 201
+    assert again.embeddings.shape[0] == 201
+
+
+def test_simple_db_loads_legacy_pickle(tmp_path):
+    db_path = str(tmp_path / "db")
+    db = SimpleVectorDatabase(db_path)
+    db.add_documents(_documents(50))
+    queries = ["термин1 термин2", "термин7"]
+    expected = db.search_similar_batch(queries, 3)
+
+    # Старый формат: матрица внутри pickle, без отдельных .npy
+    db_file = tmp_path / "db" / "simple_vector_db.pkl"
+    with open(db_file, "rb") as f:
+        data = pickle.load(f)
+    data.pop("matrix_shapes")
+    data["embeddings"] = db.embeddings.astype(np.float64)
+    with open(db_file, "wb") as f:
+        pickle.dump(data, f)
+
+    legacy = SimpleVectorDatabase(db_path)
+    assert legacy.embeddings.dtype == np.float32
+    assert legacy.search_similar_batch(queries, 3) == expected
+
+
+def test_simple_db_save_replaces_matrix_version(tmp_path):
+    """Каждое сохранение пишет матрицы новой версии и удаляет прежние"""
+    db_path = tmp_path / "db"
+    db = SimpleVectorDatabase(str(db_path))
+    db.add_documents(_documents(20))
+    first = sorted(p.name for p in db_path.glob("*.npy"))
+    db.add_documents(_documents(5, seed=1))
+    second = sorted(p.name for p in db_path.glob("*.npy"))
+
+    assert len(first) == len(second) == 6
+    assert not set(first) & set(second)
+    assert not list(db_path.glob("*.tmp"))
+    assert len(SimpleVectorDatabase(str(db_path)).documents) == 25
+
+
+def test_simple_db_rejects_inconsistent_files(tmp_path):
+    """Матрица не того размера не подменяет документы: база остается пустой"""
+    db_path = tmp_path / "db"
+    db = SimpleVectorDatabase(str(db_path))
+    db.add_documents(_documents(20))
+
+    db_file = db_path / "simple_vector_db.pkl"
+    with open(db_file, "rb") as f:
+        data = pickle.load(f)
+    data["documents"] = data["documents"][:-1]
+    with open(db_file, "wb") as f:
+        pickle.dump(data, f)
+
+    broken = SimpleVectorDatabase(str(db_path))
+    assert broken.documents == []
+    assert broken.embeddings is None
+    assert not broken.is_fitted
+    assert broken.search_similar("термин1") == []
+
+
+class _HashingModel:
+    """Детерминированная замена модели эмбеддингов: хешированный мешок слов"""
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), 32), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, zlib.crc32(word.encode("utf-8")) % 32] += 1.0
+        return vectors
+
+
+class _MemoryCollection:
+    """Коллекция в памяти с подмножеством API Chroma, которое использует база"""
+
+    metadata = {"hnsw:space": "ip"}
+
+    def __init__(self):
+        self.rows = {}
+
+    def add(self, embeddings, documents, metadatas, ids):
+        for row in zip(ids, embeddings, documents, metadatas):
+            self.rows[row[0]] = row[1:]
+
+    def delete(self, where):
+        ((field, condition),) = where.items()
+        values = set(condition["$in"])
+        self.rows = {
+            i: row for i, row in self.rows.items() if row[2][field] not in values
+        }
+
+    def count(self):
+        return len(self.rows)
+
+    def query(self, query_embeddings, n_results, where=None):
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query in query_embeddings:
+            rows = [
+                (i, row)
+                for i, row in self.rows.items()
+                if all(row[2].get(k) == v for k, v in (where or {}).items())
+            ]
+            rows.sort(key=lambda item: -float(np.dot(item[1][0], query)))
+            rows = rows[:n_results]
+            results["ids"].append([i for i, _ in rows])
+            results["documents"].append([row[1] for _, row in rows])
+            results["metadatas"].append([row[2] for _, row in rows])
+            results["distances"].append(
+                [1.0 - float(np.dot(row[0], query)) for _, row in rows]
+            )
+        return results
+
+
+@pytest.fixture(params=["memory", "chroma"])
+def vector_db(request, tmp_path, monkeypatch):
+    from src.databases import vector_database
+
+    monkeypatch.setattr(
+        vector_database, "EMBEDDING_CACHE_PATH", str(tmp_path / "emb.sqlite")
+    )
+    monkeypatch.setattr(
+        vector_database, "INGEST_MANIFEST", str(tmp_path / "ingested_files.txt")
+    )
+
+    def load_embedding_model(self):
+        self.embedding_model = _HashingModel()
+
+    monkeypatch.setattr(
+        vector_database.VectorDatabase, "load_embedding_model", load_embedding_model
+    )
+    if request.param == "memory":
+
+        def initialize_database(self):
+            self.collection = _MemoryCollection()
+            self._configure_space()
+
+        monkeypatch.setattr(
+            vector_database.VectorDatabase, "initialize_database", initialize_database
+        )
+    else:
+        pytest.importorskip("chromadb")
+
+    db = vector_database.VectorDatabase(str(tmp_path / "chroma"))
+    yield db
+    db.embedding_cache.close()
+
+
+def _doc(source_file, text):
+    return {
+        "source_file": source_file,
+        "metadata": {},
+        "chunks": [{"id": "chunk_0", "text": text}],
+    }
+
+
+def test_result_cache_invalidated_on_add_and_delete(vector_db):
+    query = "договор займа"
+    vector_db.add_documents([_doc("a.pdf", "договор займа и возврат долга")])
+    first = vector_db.search_similar(query, n_results=5)
+    assert [doc["metadata"]["source_file"] for doc in first] == ["a.pdf"]
+
+    # Повторный запрос берется из кэша
+    assert vector_db.search_similar(query, n_results=5) == first
+    assert (vector_db.result_cache_hits, vector_db.result_cache_misses) == (1, 1)
+
+    # Добавление документов сбрасывает кэш: новый фрагмент виден сразу
+    vector_db.add_documents([_doc("b.pdf", "договор займа между гражданами")])
+    second = vector_db.search_similar(query, n_results=5)
+    assert {doc["metadata"]["source_file"] for doc in second} == {"a.pdf", "b.pdf"}
+    assert vector_db.result_cache_misses == 2
+
+    # Удаление тоже сбрасывает кэш
+    vector_db.delete_source_files(["a.pdf"])
+    third = vector_db.search_similar(query, n_results=5)
+    assert [doc["metadata"]["source_file"] for doc in third] == ["b.pdf"]
+    assert vector_db.result_cache_misses == 3
+
+    # Явный сброс (например, перед замером скорости поиска)
+    vector_db.clear_result_cache()
+    assert vector_db.search_similar(query, n_results=5) == third
+    assert vector_db.result_cache_misses == 4
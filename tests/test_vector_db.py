@@ -3,10 +3,17 @@
 """
 
 import os
-from vector_database import VectorDatabase
-from config import JSON_DIR
+import sys
+from pathlib import Path
 
-def test_vector_database():
+# Добавляем корень проекта в путь
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.databases.vector_database import VectorDatabase
+from src.utils.config import JSON_DIR
+
+# Ручная проверка на данных из JSON_DIR: pytest ее не собирает
+def run_vector_database():
     """Тестирует работу векторной базы данных"""
     print("🧪 Тестирование векторной базы данных...")
     
@@ -55,6 +62,6 @@ def test_vector_database():
         return False
 
 if __name__ == "__main__":
-    success = test_vector_database()
+    success = run_vector_database()
     if not success:
         print("\n❌ Тест не прошел. Проверьте ошибки выше.")